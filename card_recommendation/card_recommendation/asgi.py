@@ -13,4 +13,26 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'card_recommendation.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+
+async def application(scope, receive, send):
+    """
+    Django's ASGI application, plus the lifespan events of the serving event loop.
+
+    The async xAI client is bound to the loop that uses it, so it is connected
+    at startup and closed at shutdown here rather than in gunicorn's hooks.
+    """
+    if scope['type'] != 'lifespan':
+        return await django_application(scope, receive, send)
+
+    from recommendation.xai_clients import warm_async_xai_client, close_async_xai_client
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await warm_async_xai_client()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await close_async_xai_client()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
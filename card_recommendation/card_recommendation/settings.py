@@ -157,6 +157,83 @@ AUTH_USER_MODEL = 'users.User'
 # xAI RAG Configuration
 CARD_BENEFITS_COLLECTION_ID = os.environ.get('CARD_BENEFITS_COLLECTION_ID', None)
 
+# 'tool': Grok calls collections_search itself (grok-4)
+# 'prefetch': the views search the collection and put the excerpts in the prompt (see recommendation/rag_prefetch.py)
+RAG_MODE = os.environ.get('RAG_MODE', 'tool')
+RAG_PREFETCH_BUDGET = float(os.environ.get('RAG_PREFETCH_BUDGET', 2.0))
+RAG_PREFETCH_WORKERS = int(os.environ.get('RAG_PREFETCH_WORKERS', 8))
+RAG_PREFETCH_TOP_K = int(os.environ.get('RAG_PREFETCH_TOP_K', 3))
+
+# Where RAGService.search looks: 'remote' (xAI collections) or 'local' (index built by
+# build_local_rag_index, see recommendation/local_rag.py)
+RAG_BACKEND = os.environ.get('RAG_BACKEND', 'remote')
+# Fall back to the local index when a remote search fails
+RAG_LOCAL_FALLBACK = os.environ.get('RAG_LOCAL_FALLBACK', 'False').lower() in ('true', '1', 'yes')
+LOCAL_RAG_INDEX_DIR = os.environ.get('LOCAL_RAG_INDEX_DIR', os.path.join(BASE_DIR, '.local_rag_index'))
+
+# Extracted PDF text for upload_card_pdfs/sync_card_pdfs --condense, cached by file hash
+PDF_TEXT_CACHE_DIR = os.environ.get('PDF_TEXT_CACHE_DIR', os.path.join(BASE_DIR, '.pdf_text_cache'))
+
+# Pooled xAI clients (see recommendation/xai_clients.py)
+XAI_CLIENT_POOL_SIZE = int(os.environ.get('XAI_CLIENT_POOL_SIZE', 2))
+XAI_CLIENT_HEALTH_CHECK_INTERVAL = int(os.environ.get('XAI_CLIENT_HEALTH_CHECK_INTERVAL', 60))
+XAI_CLIENT_HEALTH_CHECK_TIMEOUT = int(os.environ.get('XAI_CLIENT_HEALTH_CHECK_TIMEOUT', 5))
+
+# How long a geohash cell's stored Places results (users.Place) answer nearby searches
+# before the cell is searched again (see users/places.py)
+PLACES_TILE_MAX_AGE = int(os.environ.get('PLACES_TILE_MAX_AGE', 60 * 60 * 24 * 7))
+
+# 'single': one Places request per cell (first page only)
+# 'paged': answer with the first page, then follow next_page_token and run one extra search
+# per PLACES_SEARCH_TYPES type in the background, concurrently, within PLACES_FETCH_BUDGET seconds
+PLACES_FETCH_MODE = os.environ.get('PLACES_FETCH_MODE', 'single')
+PLACES_FETCH_BUDGET = float(os.environ.get('PLACES_FETCH_BUDGET', 3.0))
+PLACES_SEARCH_TYPES = [t.strip() for t in os.environ.get('PLACES_SEARCH_TYPES', '').split(',') if t.strip()]
+
+# Shared outbound HTTP client for Google Places and Twilio (see http_client.py)
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 3.05))
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', 10))
+HTTP_MAX_RETRIES = int(os.environ.get('HTTP_MAX_RETRIES', 2))
+HTTP_RETRY_BASE_DELAY = float(os.environ.get('HTTP_RETRY_BASE_DELAY', 0.25))
+HTTP_MAX_CONCURRENCY_PER_HOST = int(os.environ.get('HTTP_MAX_CONCURRENCY_PER_HOST', 16))
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 32))
+
+
+# Caches
+# The local-memory backend evicts least-recently-used entries once MAX_ENTRIES is reached.
+# 'analysis' stores Grok card analyses keyed on a wallet/category/store fingerprint.
+# 'rag_search' stores collection search results (see recommendation/search_cache.py).
+# 'places_tiles' stores Google Places stores per geohash cell (see users/places.py).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+    'analysis': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'analysis',
+        'TIMEOUT': int(os.environ.get('ANALYSIS_CACHE_TIMEOUT', 60 * 60 * 6)),
+        'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('ANALYSIS_CACHE_MAX_ENTRIES', 1000))},
+    },
+    'rag_search': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'rag_search',
+        'TIMEOUT': int(os.environ.get('RAG_SEARCH_CACHE_TIMEOUT', 60 * 60)),
+        'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('RAG_SEARCH_CACHE_MAX_ENTRIES', 2000))},
+    },
+    'places_tiles': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'places_tiles',
+        'TIMEOUT': int(os.environ.get('PLACES_TILE_CACHE_TIMEOUT', 60 * 30)),
+        'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('PLACES_TILE_CACHE_MAX_ENTRIES', 5000))},
+    },
+}
+
+# How long a process trusts its copy of a collection's version (search cache keys)
+RAG_COLLECTION_VERSION_TTL = int(os.environ.get('RAG_COLLECTION_VERSION_TTL', 30))
+# How long a process trusts its copy of the reward data versions (reward matrix, card profiles)
+CACHE_VERSION_TTL = int(os.environ.get('CACHE_VERSION_TTL', 5))
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/4.1/topics/i18n/
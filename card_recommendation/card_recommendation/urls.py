@@ -17,9 +17,10 @@ from django.contrib import admin
 from django.urls import path, include
 from users.views import UserViewSet, UserCardListView
 from users.login_views import SendPhoneCode, RegisterVerifyPhoneCode, LoginVerifyPhoneCode
-from users.views import get_user, update_user, delete_user, get_nearby_stores, create_user_cards, delete_user_card, get_online_stores
+from users.views import get_user, update_user, delete_user, get_nearby_stores, create_user_cards, delete_user_card, get_online_stores, outbound_http_stats
 
-from recommendation.views import get_card_benefits_by_types, CardListView, analyze_cards_with_gpt, analyze_cards_with_gpt_streaming, get_card_details_streaming
+from recommendation.views import get_card_benefits_by_types, get_card_benefits_by_types_batch, get_nearby_stores_with_best_card, CardListView, analyze_cards_with_gpt, analyze_cards_with_gpt_streaming, get_card_details_streaming, rag_search_cache_stats
+from recommendation.async_views import analyze_cards_with_gpt_streaming_async, get_card_details_streaming_async
 
 from rest_framework.routers import DefaultRouter
 
@@ -45,12 +46,19 @@ urlpatterns = [
     path('user-cards/', UserCardListView.as_view(), name='user-card-list'),
     path('get-nearby-stores/', get_nearby_stores),
     path('get-online-stores/', get_online_stores),
+    path('http/outbound-stats/', outbound_http_stats),
     path('create-user-cards/', create_user_cards),
     path('delete-user-card/<uuid:pk>/', delete_user_card),
 
     path('cards/', CardListView.as_view(), name='card-list'),
     path('get-card-benefits-by-types/', get_card_benefits_by_types),
+    path('get-card-benefits-by-types-batch/', get_card_benefits_by_types_batch),
+    path('get-nearby-stores-with-best-card/', get_nearby_stores_with_best_card),
     path('analyze-cards-with-gpt/', analyze_cards_with_gpt),
     path('analyze-cards-with-gpt-streaming/', analyze_cards_with_gpt_streaming),
     path('card-details-streaming/<uuid:card_id>/', get_card_details_streaming),
+    path('rag/search-cache-stats/', rag_search_cache_stats),
+    # Same streams as async views; use when served over ASGI (SERVER_MODE=asgi)
+    path('async/analyze-cards-with-gpt-streaming/', analyze_cards_with_gpt_streaming_async),
+    path('async/card-details-streaming/<uuid:card_id>/', get_card_details_streaming_async),
 ]
@@ -0,0 +1,36 @@
+"""
+Gunicorn configuration.
+
+SERVER_MODE selects how the app is served:
+- "wsgi" (default): sync workers running card_recommendation.wsgi
+- "asgi": uvicorn workers running card_recommendation.asgi, so the async
+  streaming endpoints (/async/...) don't hold a worker for the whole stream.
+  Sync views still work but run one at a time per worker (Django serializes
+  them on a single thread), so scale WEB_CONCURRENCY accordingly.
+"""
+import os
+
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi').lower()
+
+if SERVER_MODE == 'asgi':
+    wsgi_app = 'card_recommendation.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    wsgi_app = 'card_recommendation.wsgi'
+
+
+def post_worker_init(worker):
+    """
+    Connect the pooled xAI clients before the worker takes requests.
+
+    In ASGI mode the async client is connected by the lifespan startup event
+    instead (see asgi.py): the serving event loop doesn't exist yet here.
+    """
+    from recommendation.xai_clients import warm_xai_clients
+    warm_xai_clients()
+
+
+def worker_exit(server, worker):
+    """Close the pooled xAI clients when the worker shuts down"""
+    from recommendation.xai_clients import close_xai_clients
+    close_xai_clients()
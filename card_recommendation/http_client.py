@@ -0,0 +1,188 @@
+""" Shared outbound HTTP client (Google Places, Twilio) """
+import random
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+# Statuses worth retrying: rate limiting and transient upstream failures
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# Methods that may be retried after the request reached the server
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+# Longest Retry-After (seconds) honored before a retry
+MAX_RETRY_AFTER = 5
+# Latencies kept per host for the percentiles
+LATENCY_WINDOW = 1000
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class HostStats:
+    """Request counters and recent latencies of one host"""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def snapshot(self):
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))], 1)
+
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'retries': self.retries,
+            'p50_ms': percentile(50),
+            'p95_ms': percentile(95),
+            'p99_ms': percentile(99),
+            'max_ms': round(latencies[-1], 1) if latencies else None,
+        }
+
+
+class OutboundHttpClient:
+    """
+    One requests.Session per process for calls to third-party APIs.
+
+    - keep-alive connections are pooled per host (no TLS handshake per call)
+    - every attempt has a connect and a read timeout, so a stalled upstream
+      cannot pin a worker
+    - connection errors, timeouts and RETRY_STATUS_CODES are retried with
+      jittered exponential backoff; requests that may have reached the server
+      are only retried for IDEMPOTENT_METHODS
+    - a semaphore per host bounds the calls in flight to it
+    - per-host latency and error counters are kept (see stats())
+    """
+
+    def __init__(self, connect_timeout=3.05, read_timeout=10, max_retries=2,
+                 retry_base_delay=0.25, max_per_host=16, pool_size=32):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.max_per_host = max_per_host
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._stats = {}
+
+    def _host(self, host):
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.max_per_host)
+                self._stats[host] = HostStats()
+            return self._semaphores[host], self._stats[host]
+
+    def _retry_delay(self, attempt, response=None):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(int(retry_after), MAX_RETRY_AFTER)
+        return self.retry_base_delay * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+    def request(self, method, url, timeout=None, **kwargs):
+        """
+        Send a request with pooling, timeouts, retries and per-host limits.
+
+        Args:
+            method: HTTP method
+            url: Request URL
+            timeout: (connect, read) seconds for each attempt (default: the client's)
+            **kwargs: Passed to requests.Session.request (params, data, json, headers, auth, ...)
+
+        Returns:
+            requests.Response: The last response (a retryable status is returned once retries run out)
+
+        Raises:
+            requests.RequestException: If the last attempt failed to get a response
+        """
+        method = method.upper()
+        semaphore, stats = self._host(urlsplit(url).hostname)
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            response = None
+            try:
+                with semaphore:
+                    response = self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+            except requests.RequestException as e:
+                error = e
+            else:
+                error = None
+            elapsed_ms = (time.perf_counter() - started) * 1000
+
+            # A connect timeout means nothing was sent, so any method can be retried
+            retryable = (
+                isinstance(error, requests.ConnectTimeout)
+                or (method in IDEMPOTENT_METHODS and (
+                    isinstance(error, (requests.ConnectionError, requests.Timeout))
+                    or (response is not None and response.status_code in RETRY_STATUS_CODES)
+                ))
+            )
+            failed = error is not None or response.status_code >= 500
+            with self._lock:
+                stats.requests += 1
+                stats.latencies.append(elapsed_ms)
+                if failed:
+                    stats.errors += 1
+                if retryable and attempt < self.max_retries:
+                    stats.retries += 1
+
+            if not retryable or attempt >= self.max_retries:
+                if error is not None:
+                    raise error
+                return response
+
+            delay = self._retry_delay(attempt, response)
+            print(f"🔄 Retrying {method} {urlsplit(url).hostname} in {delay:.2f}s "
+                  f"({error or response.status_code})")
+            time.sleep(delay)
+            attempt += 1
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        """
+        Get this process's outbound request counters.
+
+        Returns:
+            dict: host -> requests, errors, retries and latency percentiles (ms)
+        """
+        with self._lock:
+            return {host: host_stats.snapshot() for host, host_stats in self._stats.items()}
+
+
+def get_http_client():
+    """
+    Get the process-wide outbound HTTP client (created on first use from the HTTP_* settings).
+
+    Returns:
+        OutboundHttpClient
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = OutboundHttpClient(
+                connect_timeout=getattr(settings, 'HTTP_CONNECT_TIMEOUT', 3.05),
+                read_timeout=getattr(settings, 'HTTP_READ_TIMEOUT', 10),
+                max_retries=getattr(settings, 'HTTP_MAX_RETRIES', 2),
+                retry_base_delay=getattr(settings, 'HTTP_RETRY_BASE_DELAY', 0.25),
+                max_per_host=getattr(settings, 'HTTP_MAX_CONCURRENCY_PER_HOST', 16),
+                pool_size=getattr(settings, 'HTTP_POOL_SIZE', 32),
+            )
+        return _client
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Issuer, Card, MerchantCategory, MerchantCategoryCode, RewardCategory, RewardRate
+from .models import Issuer, Card, MerchantCategory, MerchantCategoryCode, RewardCategory, RewardRate, RagCollection, CardDetailsDocument, CardDocument
 
 # Register your models here.
 @admin.register(Issuer)
@@ -46,3 +46,22 @@ class RewardRateAdmin(admin.ModelAdmin):
     list_display = ("id", "reward_category", "cashback_percentage", "points", "limit", "reset_period")
     list_filter = ("reset_period",)
     search_fields = ("reward_category__card__name", "reward_category__merchant_category__name")
+
+
+@admin.register(RagCollection)
+class RagCollectionAdmin(admin.ModelAdmin):
+    list_display = ("id", "collection_id", "issuer", "version", "updated_at")
+    search_fields = ("collection_id", "issuer__name")
+
+
+@admin.register(CardDetailsDocument)
+class CardDetailsDocumentAdmin(admin.ModelAdmin):
+    list_display = ("id", "card", "collection_version", "model", "generated_at")
+    search_fields = ("card__name",)
+
+
+@admin.register(CardDocument)
+class CardDocumentAdmin(admin.ModelAdmin):
+    list_display = ("id", "name", "card", "collection_id", "file_id", "uploaded_at")
+    list_filter = ("card__issuer", "collection_id")
+    search_fields = ("name", "card__name", "file_id")
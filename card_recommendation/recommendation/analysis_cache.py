@@ -0,0 +1,80 @@
+"""
+Response cache for Grok card analyses.
+
+Most analyses are repeats: users with the same cards looking at the same kind
+of store. Responses are stored in the 'analysis' cache (see CACHES in
+settings.py, which sets the TTL and LRU size) under a fingerprint of
+everything that determines the model's answer.
+"""
+import hashlib
+import json
+
+from django.core.cache import caches
+
+from .card_profiles import get_card_profile_versions
+
+ANALYSIS_CACHE_ALIAS = 'analysis'
+
+
+def normalize_store_text(value):
+    """Lowercase and collapse whitespace so trivially different store strings share a key"""
+    if not value:
+        return ""
+    return " ".join(value.lower().split())
+
+
+def analysis_fingerprint(variant, card_ids, category, store_name, store_address,
+                         prompt_version, collection_version, model):
+    """
+    Build the cache key for an analysis.
+
+    Args:
+        variant: Which endpoint the response is for (e.g., "analysis", "streaming")
+        card_ids: Card UUIDs in the user's wallet
+        category: The resolved spending category
+        store_name: Optional name of the store/merchant
+        store_address: Optional address of the store/merchant
+        prompt_version: Version of the prompt the response was generated from
+        collection_version: Version of the RAG collection (None when RAG is off)
+        model: Grok model used for the response
+
+    Returns:
+        str: Cache key for the analysis
+    """
+    # Card profile versions change whenever a card's reward data changes
+    profile_versions = get_card_profile_versions(set(card_ids))
+    parts = {
+        'cards': sorted(f"{card_id}:{version}" for card_id, version in profile_versions.items()),
+        'category': category.lower(),
+        'store_name': normalize_store_text(store_name),
+        'store_address': normalize_store_text(store_address),
+        'prompt_version': prompt_version,
+        'collection_version': collection_version,
+        'model': model,
+    }
+    digest = hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+    return f"analysis:{variant}:{digest}"
+
+
+def get_cached_analysis(key):
+    """
+    Look up a cached analysis.
+
+    Args:
+        key: Key from analysis_fingerprint()
+
+    Returns:
+        The cached response, or None on a miss
+    """
+    return caches[ANALYSIS_CACHE_ALIAS].get(key)
+
+
+def set_cached_analysis(key, value):
+    """
+    Store an analysis using the cache's configured TTL.
+
+    Args:
+        key: Key from analysis_fingerprint()
+        value: The response to cache (must be picklable)
+    """
+    caches[ANALYSIS_CACHE_ALIAS].set(key, value)
@@ -0,0 +1,299 @@
+"""
+Async (ASGI) versions of the streaming Grok endpoints.
+
+A sync StreamingHttpResponse holds a gunicorn worker thread for as long as the
+model keeps talking. These views are plain Django async views: the database
+work runs through sync_to_async, and the Grok stream is relayed by an async
+generator using xai_sdk's AsyncClient, so one event loop can serve many open
+streams. They are only served over ASGI (SERVER_MODE=asgi, see
+gunicorn.conf.py). Under WSGI Django would run each request in its own event
+loop, opening (and leaking) a new async xAI client every time, so the views
+answer 501 there and clients should use the sync endpoints.
+
+Requests and responses are identical to the sync endpoints in views.py.
+"""
+import json
+import os
+import traceback
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from xai_sdk.chat import system, user as xai_user
+
+from .card_details_store import etag_header
+from .single_flight import async_coalesced_stream
+from .stream_parser import analysis_stream_parser, card_details_stream_parser
+from .utils import build_gpt_streaming_analysis_prompt, build_card_details_prompt
+from .xai_clients import get_async_xai_client
+from .views import (
+    prepare_streaming_analysis, prepare_card_details, collect_rag_context, log_rag_status, cache_streamed_analysis,
+    stored_card_details_response, save_streamed_card_details, card_details_flight_key,
+    sse_event, done_event, replay_cached_stream,
+)
+
+
+def asgi_required_response(request):
+    """
+    Refuse requests that are not served over ASGI.
+
+    Returns:
+        JsonResponse: 501 for a WSGI request, otherwise None
+    """
+    if isinstance(request, ASGIRequest):
+        return None
+    return JsonResponse({'error': 'Async endpoints are only available over ASGI (SERVER_MODE=asgi)'}, status=501)
+
+
+@sync_to_async
+def authenticate(request):
+    """
+    Authenticate a request with the DRF views' DEFAULT_AUTHENTICATION_CLASSES.
+
+    Args:
+        request: Django HttpRequest
+
+    Returns:
+        The authenticated user, or None if the credentials are missing or invalid
+    """
+    drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    try:
+        user = drf_request.user
+    except APIException:
+        return None
+    return user if user.is_authenticated else None
+
+
+def async_sse_response(stream):
+    """
+    Wrap an async generator of SSE frames in a StreamingHttpResponse.
+
+    Args:
+        stream: Async generator yielding SSE "data:" frames
+
+    Returns:
+        StreamingHttpResponse: Response with SSE headers set
+    """
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def iterate(frames):
+    """Relay a sync generator of SSE frames from an async generator"""
+    for frame in frames:
+        yield frame
+
+
+async def relay_chat_stream_async(chat, parser, structured, result):
+    """
+    Relay an async Grok chat stream as SSE frames.
+
+    Async counterpart of views.relay_chat_stream(). Async generators cannot
+    return a value, so the final chat response is stored in result['response'].
+
+    Args:
+        chat: Chat created with the async client's chat.create()
+        parser: JSONStreamParser for the expected response shape
+        structured: Send the parser's events instead of raw chunks
+        result: Dict receiving the final chat response
+    """
+    async for response, chunk in chat.stream():
+        result['response'] = response
+        if not chunk.content:
+            continue
+        events = parser.feed(chunk.content)
+        if structured:
+            for name, payload in events:
+                yield sse_event({name: payload})
+        else:
+            yield sse_event({'chunk': chunk.content})
+
+
+async def stream_grok(model, system_prompt, prompt, tools, parser, structured, on_complete=None):
+    """
+    Stream a Grok response as SSE frames, ending with the done frame.
+
+    Args:
+        model: Grok model name
+        system_prompt: System message for the chat
+        prompt: User prompt
+        tools: RAG tools (empty list when RAG is off)
+        parser: JSONStreamParser for the expected response shape
+        structured: Send typed events instead of raw chunks
+        on_complete: Optional sync callable given the full response text once streaming ends
+    """
+    try:
+        print(f"🔄 Starting async stream with model: {model}, RAG tools: {bool(tools)}")
+
+        chat = get_async_xai_client().chat.create(
+            model=model,
+            messages=[
+                system(system_prompt),
+                xai_user(prompt)
+            ],
+            tools=tools if tools else None
+        )
+
+        result = {}
+        async for frame in relay_chat_stream_async(chat, parser, structured, result):
+            yield frame
+        accumulated_content = parser.full_text()
+
+        # Log if RAG tool was used (check final response)
+        response = result.get('response')
+        if tools and hasattr(response, 'tool_calls') and response.tool_calls:
+            print(f"🔍 RAG tool was invoked {len(response.tool_calls)} time(s)")
+
+        # Send completion signal
+        yield done_event(accumulated_content, structured)
+
+        print(f"✅ Async Grok stream complete - streamed {len(accumulated_content)} characters")
+        if on_complete:
+            await sync_to_async(on_complete)(accumulated_content)
+
+    except Exception as e:
+        print(f"❌ Error in async streaming: {str(e)}")
+        traceback.print_exc()
+        yield sse_event({'error': str(e)})
+
+
+async def collect_rag_context_async(context):
+    """
+    Await views.collect_rag_context() off the event loop.
+
+    Waiting for the prefetch can take the whole RAG_PREFETCH_BUDGET, so it runs
+    in a worker thread of its own instead of the shared thread-sensitive executor
+    that serializes the database work of every request.
+    """
+    return await sync_to_async(collect_rag_context, thread_sensitive=False)(context)
+
+
+async def analyze_cards_with_gpt_streaming_async(request):
+    """
+    Async version of views.analyze_cards_with_gpt_streaming.
+
+    Expects query parameters:
+    - types: list of category types (e.g., ?types=restaurant&types=pharmacy)
+    - store_name: name of the store/merchant (optional)
+    - store_address: address of the store/merchant (optional)
+    - stream_format: "chunks" (default) or "events" (optional)
+    """
+    response = asgi_required_response(request)
+    if response is not None:
+        return response
+    if request.method != 'GET':
+        return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+    user = await authenticate(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+    try:
+        context, error = await sync_to_async(prepare_streaming_analysis)(user, request.GET)
+        if error:
+            return JsonResponse(error[0], status=error[1])
+
+        structured = context['structured']
+        cached_content = context['cached_content']
+        if cached_content is None and not os.environ.get('XAI_API_KEY'):
+            return JsonResponse({'error': 'Grok API key not configured'}, status=500)
+
+        async def grok_stream():
+            prompt = build_gpt_streaming_analysis_prompt(
+                card_data=context['card_data'],
+                analysis_category=context['analysis_category'],
+                store_name=context['store_name'],
+                store_address=context['store_address'],
+                rag_context=await collect_rag_context_async(context)
+            )
+            log_rag_status(context, [card['name'] for card in context['card_data']])
+            cache_key = context['cache_key']
+            async for frame in stream_grok(
+                context['model'], context['system_prompt'], prompt, context['tools'],
+                analysis_stream_parser(), structured,
+                on_complete=(lambda content: cache_streamed_analysis(cache_key, content)) if context['cacheable'] else None
+            ):
+                yield frame
+
+        async def event_stream():
+            yield sse_event({'provisional_ranking': context['provisional_ranking']})
+            if cached_content is not None:
+                print(f"⚡ Replaying cached GPT streaming analysis - {len(cached_content)} characters")
+                stream = iterate(replay_cached_stream(cached_content, analysis_stream_parser(), structured))
+            else:
+                # Identical concurrent requests (in the same format) share one upstream stream
+                stream = async_coalesced_stream(f"{context['cache_key']}:{context['stream_format']}", grok_stream)
+            async for frame in stream:
+                yield frame
+
+        return async_sse_response(event_stream())
+
+    except Exception as e:
+        print(f"❌ Error in async GPT streaming analysis: {str(e)}")
+        return JsonResponse({
+            'error': 'Internal server error during streaming analysis',
+            'details': str(e)
+        }, status=500)
+
+
+async def get_card_details_streaming_async(request, card_id):
+    """
+    Async version of views.get_card_details_streaming.
+
+    Expects URL parameter:
+    - card_id: UUID of the card model
+
+    Optional query parameter:
+    - stream_format: "chunks" (default) or "events"
+    """
+    response = asgi_required_response(request)
+    if response is not None:
+        return response
+    if request.method != 'GET':
+        return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+    user = await authenticate(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+    try:
+        context, error = await sync_to_async(prepare_card_details)(card_id, request.GET)
+        if error:
+            return JsonResponse(error[0], status=error[1])
+
+        card_data = context['card_data']
+        document = context['document']
+        if document is not None:
+            print(f"⚡ Serving stored card details for {card_data['name']}")
+            response = stored_card_details_response(request, document)
+            if response is None:
+                replay = replay_cached_stream(json.dumps(document.content), card_details_stream_parser(), context['structured'])
+                response = async_sse_response(iterate(replay))
+                response['ETag'] = etag_header(document)
+            return response
+
+        if not os.environ.get('XAI_API_KEY'):
+            return JsonResponse({'error': 'Grok API key not configured'}, status=500)
+
+        async def event_stream():
+            prompt = build_card_details_prompt(card_data, rag_context=await collect_rag_context_async(context))
+            log_rag_status(context, [card_data['name']])
+            async for frame in stream_grok(
+                context['model'], context['system_prompt'], prompt, context['tools'],
+                card_details_stream_parser(), context['structured'],
+                on_complete=lambda content: save_streamed_card_details(context, card_id, content)
+            ):
+                yield frame
+
+        # Concurrent misses for the same card (in the same format) share one upstream stream
+        return async_sse_response(async_coalesced_stream(card_details_flight_key(card_id, context), event_stream))
+
+    except Exception as e:
+        print(f"❌ Error in async card details streaming: {str(e)}")
+        return JsonResponse({
+            'error': 'Internal server error during card details streaming',
+            'details': str(e)
+        }, status=500)
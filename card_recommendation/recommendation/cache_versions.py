@@ -0,0 +1,82 @@
+"""
+Version tokens for invalidating derived data in every process.
+
+Derived data (the reward matrix, card profiles) lives in per-process memory
+or per-process caches, so the versions it is checked against must be shared:
+they are stored as CacheVersion rows. Each process keeps the versions it has
+read for CACHE_VERSION_TTL seconds, so a bump reaches other processes within
+that window (the bumping process sees it immediately) while hot paths query
+the database at most once per window.
+
+A version is a random token rather than a counter, so a data cache that
+outlives a database reset never matches a recreated version.
+"""
+import threading
+import time
+from uuid import uuid4
+
+from django.conf import settings
+
+from .models import CacheVersion
+
+# Version of keys that have never been bumped
+INITIAL_VERSION = "initial"
+
+_versions = {}
+_versions_lock = threading.Lock()
+
+
+def get_versions(keys):
+    """
+    Get the current version token for each key.
+
+    Args:
+        keys: Version keys
+
+    Returns:
+        dict: key -> version token
+    """
+    now = time.monotonic()
+    ttl = getattr(settings, 'CACHE_VERSION_TTL', 5)
+    with _versions_lock:
+        versions = {
+            key: _versions[key][0]
+            for key in keys
+            if key in _versions and now - _versions[key][1] < ttl
+        }
+
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        stored = dict(CacheVersion.objects.filter(key__in=missing).values_list('key', 'version'))
+        with _versions_lock:
+            for key in missing:
+                version = stored.get(key, INITIAL_VERSION)
+                _versions[key] = (version, now)
+                versions[key] = version
+    return versions
+
+
+def get_version(key):
+    """
+    Get the current version token for a single key.
+
+    Args:
+        key: Version key
+
+    Returns:
+        str: Version token
+    """
+    return get_versions([key])[key]
+
+
+def bump_version(key):
+    """
+    Replace a key's version token so everything derived from it is invalidated.
+
+    Args:
+        key: Version key
+    """
+    version = uuid4().hex
+    CacheVersion.objects.update_or_create(key=key, defaults={'version': version})
+    with _versions_lock:
+        _versions[key] = (version, time.monotonic())
@@ -0,0 +1,122 @@
+"""
+Persisted store of generated card details.
+
+A card's details write-up depends only on its catalog data, the RAG documents
+and the prompt, so one document per card is kept in CardDetailsDocument. Each
+document is tagged with the reward-data version (a hash of the card profile
+and prompt version) and the collection version it was generated from. A
+stored document is served while both still match. The regenerate_card_details
+command refills stale documents in bulk, and the streaming endpoint generates
+and saves a document only when it finds none.
+"""
+import hashlib
+import json
+
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import CardDetailsDocument
+from .stream_parser import extract_json_document
+from .utils import CARD_DETAILS_PROMPT_VERSION
+
+
+def reward_data_version(card_data):
+    """
+    Hash everything about a card that the details prompt is built from.
+
+    Args:
+        card_data: Card profile from get_card_profile()
+
+    Returns:
+        str: Hex digest that changes whenever the card's catalog data or the prompt changes
+    """
+    payload = json.dumps(
+        {'card': card_data, 'prompt_version': CARD_DETAILS_PROMPT_VERSION},
+        sort_keys=True, cls=JSONEncoder
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def is_current(document, reward_version, collection_version, model):
+    """Whether a stored document was generated from the current data"""
+    return (
+        document.reward_data_version == reward_version
+        and document.collection_version == collection_version
+        and document.model == model
+    )
+
+
+def get_card_details_document(card_id, reward_version, collection_version, model):
+    """
+    Look up a card's stored details if they are up to date.
+
+    Args:
+        card_id: UUID of the card model
+        reward_version: Current reward_data_version() of the card
+        collection_version: Current RAG collection version (None when RAG is off)
+        model: Grok model the details would be generated with
+
+    Returns:
+        CardDetailsDocument or None if missing or stale
+    """
+    document = CardDetailsDocument.objects.filter(card_id=card_id).first()
+    if document is None or not is_current(document, reward_version, collection_version, model):
+        return None
+    return document
+
+
+def save_card_details_document(card_id, content, reward_version, collection_version, model):
+    """
+    Store a generated write-up, replacing any older one for the card.
+
+    Args:
+        card_id: UUID of the card model
+        content: Full model response text (a ```json fence around the object is dropped)
+        reward_version: reward_data_version() the prompt was built from
+        collection_version: RAG collection version at generation time
+        model: Grok model that generated the details
+
+    Returns:
+        CardDetailsDocument, or None if the response is not valid JSON
+    """
+    parsed = extract_json_document(content)
+    if parsed is None:
+        print(f"⚠️  Card details for {card_id} are not valid JSON - not storing")
+        return None
+
+    etag_source = json.dumps(parsed, sort_keys=True).encode('utf-8')
+    document, _ = CardDetailsDocument.objects.update_or_create(
+        card_id=card_id,
+        defaults={
+            'content': parsed,
+            'reward_data_version': reward_version,
+            'collection_version': collection_version,
+            'model': model,
+            'etag': hashlib.sha256(etag_source).hexdigest()[:32],
+        }
+    )
+    print(f"💾 Stored card details for {card_id}")
+    return document
+
+
+def etag_header(document):
+    """Quoted ETag header value for a stored document"""
+    return f'"{document.etag}"'
+
+
+def etag_matches(if_none_match, document):
+    """
+    Check an If-None-Match header against a stored document.
+
+    Args:
+        if_none_match: Raw header value (may be None, "*" or a list of tags)
+        document: CardDetailsDocument
+
+    Returns:
+        bool: True if the client already has this version
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+    return etag_header(document) in tags
@@ -0,0 +1,123 @@
+"""
+Bookkeeping for uploaded card benefit documents.
+
+Used by the upload and maintenance commands to tie documents to Card rows
+(CardDocument) and to place them in per-issuer collections (RagCollection
+with an issuer). rag_scope.py reads these records to limit searches to a
+wallet's documents.
+"""
+import re
+
+from .models import CardDocument, RagCollection
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def _tokens(text):
+    return set(_TOKEN_RE.findall(text.lower()))
+
+
+def match_cards(filename, cards):
+    """
+    Find the cards a document's file name refers to.
+
+    A card matches when every word of its name appears in the file name
+    (e.g., "Chase_Sapphire_Preferred_Guide_to_Benefits.pdf" matches "Sapphire
+    Preferred"). Only the most specific matches (the longest names) are kept, so
+    "Robinhood_Gold_Card.pdf" matches "Robinhood Gold Card" and not also "Gold".
+
+    Args:
+        filename: Document file name
+        cards: Card instances to match against
+
+    Returns:
+        list: Matching cards (empty if none match)
+    """
+    filename_tokens = _tokens(filename)
+    matches = []
+    for card in cards:
+        name_tokens = _tokens(card.name)
+        if name_tokens and name_tokens <= filename_tokens:
+            matches.append((len(name_tokens), card))
+    if not matches:
+        return []
+    best = max(length for length, _ in matches)
+    return [card for length, card in matches if length == best]
+
+
+def get_issuer_collection_id(rag_service, issuer, embedding_model):
+    """
+    Get the collection holding an issuer's documents, creating it on first use.
+
+    Args:
+        rag_service: RAGService used to create the collection
+        issuer: Issuer instance
+        embedding_model: Embedding model for a new collection
+
+    Returns:
+        str: xAI collection ID
+    """
+    existing = RagCollection.objects.filter(issuer=issuer).first()
+    if existing is not None:
+        return existing.collection_id
+
+    collection = rag_service.create_collection(
+        name=f"{issuer.name} Card Benefits",
+        model_name=embedding_model
+    )
+    RagCollection.objects.update_or_create(
+        collection_id=collection.collection_id,
+        defaults={'issuer': issuer}
+    )
+    return collection.collection_id
+
+
+def record_card_documents(cards, collection_id, file_id, name):
+    """
+    Record that an uploaded document describes some cards.
+
+    Args:
+        cards: Card instances the document belongs to
+        collection_id: Collection the document was uploaded to
+        file_id: Uploaded document's file ID
+        name: Document name
+    """
+    for card in cards:
+        CardDocument.objects.update_or_create(
+            card=card, collection_id=collection_id, file_id=file_id,
+            defaults={'name': name}
+        )
+
+
+def forget_card_documents(collection_id, file_id=None):
+    """
+    Drop the card records for a deleted document (or a whole cleared collection).
+
+    Args:
+        collection_id: Collection the document was removed from
+        file_id: Removed document's file ID (None for every document in the collection)
+    """
+    documents = CardDocument.objects.filter(collection_id=collection_id)
+    if file_id is not None:
+        documents = documents.filter(file_id=file_id)
+    documents.delete()
+
+
+def move_card_documents(collection_id, old_file_id, new_file_id):
+    """
+    Carry a replaced document's card records over to its new version.
+
+    Args:
+        collection_id: Collection holding both versions
+        old_file_id: File ID of the version being replaced
+        new_file_id: File ID of the newly uploaded version
+
+    Returns:
+        list: Cards the document is tied to
+    """
+    documents = CardDocument.objects.filter(collection_id=collection_id, file_id=old_file_id).select_related('card')
+    cards = [document.card for document in documents]
+    if cards:
+        record_card_documents(cards, collection_id, new_file_id, documents[0].name)
+        documents.delete()
+    return cards
@@ -0,0 +1,160 @@
+"""
+Card profiles: the serialized card + reward data sent to Grok in prompts.
+
+Profiles are built with a constant number of queries regardless of wallet size
+and cached per card in Django's cache. Each cache key embeds a per-card version
+(bumped when that card's reward data changes) and a catalog version (bumped when
+shared rows such as issuers or merchant categories change), so stale profiles
+are never read and simply age out. The versions are stored in the database
+(see cache_versions.py), so an edit made in one process (admin, shell, a
+management command) reaches every worker within CACHE_VERSION_TTL seconds,
+along with the analysis fingerprints and card details versions built from the
+profiles.
+"""
+from django.core.cache import cache
+from django.db.models import Prefetch
+
+from .cache_versions import get_versions, bump_version
+from .models import Card, RewardCategory, RewardRate
+
+CARD_PROFILE_CACHE_TIMEOUT = 60 * 60 * 24
+CATALOG_VERSION_KEY = "card_profile_catalog_version"
+
+
+def _card_version_key(card_id):
+    return f"card_profile_version:{card_id}"
+
+
+def _profile_key(card_id, version):
+    return f"card_profile:{card_id}:{version}"
+
+
+def serialize_card_profile(card):
+    """
+    Serialize a card and its reward rates for use in a prompt.
+
+    Args:
+        card: Card with issuer selected and reward categories prefetched
+
+    Returns:
+        dict: The card's id, name, issuer, base point value and rewards
+    """
+    card_info = {
+        'id': str(card.id),
+        'name': card.name,
+        'issuer': card.issuer.name,
+        'base_point_value': float(card.base_point_value) if card.base_point_value else None,
+        'rewards': []
+    }
+
+    for rc in card.rewardcategory_set.all():
+        try:
+            rate = rc.rewardrate
+        except RewardRate.DoesNotExist:
+            continue
+
+        card_info['rewards'].append({
+            'category': rc.merchant_category.name,
+            'cashback_percentage': float(rate.cashback_percentage) if rate.cashback_percentage else None,
+            'points': rate.points if rate.points else None,
+            'reset_period': rate.reset_period if rate.reset_period else None,
+            'limit': float(rate.limit) if rate.limit else None
+        })
+
+    return card_info
+
+
+def load_card_profiles(card_ids):
+    """
+    Build profiles straight from the database in two queries.
+
+    Args:
+        card_ids: Card UUIDs to load
+
+    Returns:
+        dict: card_id -> profile dict (unknown IDs are omitted)
+    """
+    reward_categories = RewardCategory.objects.select_related('merchant_category', 'rewardrate')
+    cards = (
+        Card.objects.filter(id__in=card_ids)
+        .select_related('issuer')
+        .prefetch_related(Prefetch('rewardcategory_set', queryset=reward_categories))
+    )
+    return {card.id: serialize_card_profile(card) for card in cards}
+
+
+def get_card_profile_versions(card_ids):
+    """
+    Get the current cache version of each card's profile.
+
+    Args:
+        card_ids: Card UUIDs
+
+    Returns:
+        dict: card_id -> version string combining the catalog and card versions
+    """
+    version_keys = {card_id: _card_version_key(card_id) for card_id in card_ids}
+    stored = get_versions([CATALOG_VERSION_KEY, *version_keys.values()])
+    catalog_version = stored[CATALOG_VERSION_KEY]
+    return {
+        card_id: f"{catalog_version}.{stored[key]}"
+        for card_id, key in version_keys.items()
+    }
+
+
+def get_card_profiles(card_ids):
+    """
+    Get prompt profiles for several cards, serving unchanged cards from cache.
+
+    Args:
+        card_ids: Card UUIDs (duplicates are ignored)
+
+    Returns:
+        list: Profile dicts in the order the cards were given
+    """
+    card_ids = list(dict.fromkeys(card_ids))
+    versions = get_card_profile_versions(card_ids)
+    profile_keys = {card_id: _profile_key(card_id, versions[card_id]) for card_id in card_ids}
+
+    cached = cache.get_many(list(profile_keys.values()))
+    profiles = {
+        card_id: cached[key]
+        for card_id, key in profile_keys.items()
+        if key in cached
+    }
+
+    missing_ids = [card_id for card_id in card_ids if card_id not in profiles]
+    if missing_ids:
+        loaded = load_card_profiles(missing_ids)
+        profiles.update(loaded)
+        cache.set_many(
+            {profile_keys[card_id]: profile for card_id, profile in loaded.items()},
+            timeout=CARD_PROFILE_CACHE_TIMEOUT,
+        )
+        print(f"🗂️ Card profiles: {len(card_ids) - len(missing_ids)} cached, {len(loaded)} loaded from DB")
+
+    return [profiles[card_id] for card_id in card_ids if card_id in profiles]
+
+
+def get_card_profile(card_id):
+    """
+    Get the prompt profile for a single card.
+
+    Args:
+        card_id: Card UUID
+
+    Returns:
+        dict: The card's profile, or None if the card does not exist
+    """
+    profiles = get_card_profiles([card_id])
+    return profiles[0] if profiles else None
+
+
+def invalidate_card_profile(card_id=None):
+    """
+    Invalidate cached profiles in every process.
+
+    Args:
+        card_id: Card whose reward data changed, or None to invalidate every card
+    """
+    bump_version(_card_version_key(card_id) if card_id else CATALOG_VERSION_KEY)
@@ -0,0 +1,136 @@
+"""
+Mapping from Google Places types to reward categories.
+
+category_mapping is the hand-maintained source of truth. At import time it is
+inverted into a type -> categories index so a request's types can be resolved
+with dictionary lookups instead of scanning every category's list.
+"""
+category_mapping = {
+    "dining": [
+        "restaurant",
+        "food",
+        "acai_shop",
+        "afghani_restaurant",
+        "african_restaurant",
+        "american_restaurant",
+        "asian_restaurant",
+        "bagel_shop",
+        "bakery",
+        "bar",
+        "bar_and_grill",
+        "barbecue_restaurant",
+        "brazilian_restaurant",
+        "breakfast_restaurant",
+        "brunch_restaurant",
+        "buffet_restaurant",
+        "cafe",
+        "cafeteria",
+        "candy_store",
+        "cat_cafe",
+        "chinese_restaurant",
+        "chocolate_factory",
+        "chocolate_shop",
+        "coffee_shop",
+        "confectionery",
+        "deli",
+        "dessert_restaurant",
+        "dessert_shop",
+        "diner",
+        "dog_cafe",
+        "donut_shop",
+        "fast_food_restaurant",
+        "fine_dining_restaurant",
+        "food_court",
+        "french_restaurant",
+        "greek_restaurant",
+        "hamburger_restaurant",
+        "ice_cream_shop",
+        "indian_restaurant",
+        "indonesian_restaurant",
+        "italian_restaurant",
+        "japanese_restaurant",
+        "juice_shop",
+        "korean_restaurant",
+        "lebanese_restaurant",
+        "meal_delivery",
+        "meal_takeaway",
+        "mediterranean_restaurant",
+        "mexican_restaurant",
+        "middle_eastern_restaurant",
+        "pizza_restaurant",
+        "pub",
+        "ramen_restaurant",
+        "restaurant",
+        "sandwich_shop",
+        "seafood_restaurant",
+        "spanish_restaurant",
+        "steak_house",
+        "sushi_restaurant",
+        "tea_house",
+        "thai_restaurant",
+        "turkish_restaurant",
+        "vegan_restaurant",
+        "vegetarian_restaurant",
+        "vietnamese_restaurant",
+        "wine_bar"
+    ]
+}
+
+
+# Broad types Google attaches to many unrelated places; they count for less
+# than a specific type such as "sushi_restaurant" when scoring categories.
+GENERIC_PLACE_TYPES = {"food", "store", "establishment", "point_of_interest"}
+GENERIC_TYPE_WEIGHT = 0.25
+
+
+def build_type_index(mapping):
+    """
+    Invert a category -> types mapping.
+
+    Args:
+        mapping: Dict of category name -> list of Google place types
+
+    Returns:
+        dict: Google place type -> tuple of category names
+    """
+    index = {}
+    for category, place_types in mapping.items():
+        for place_type in place_types:
+            categories = index.setdefault(place_type, [])
+            if category not in categories:
+                categories.append(category)
+    return {place_type: tuple(categories) for place_type, categories in index.items()}
+
+
+type_index = build_type_index(category_mapping)
+
+
+def resolve_categories(types):
+    """
+    Resolve Google place types to reward categories ranked by specificity.
+
+    Every type is looked up in the inverted index. A type contributes more when
+    it is specific (maps to few categories and is not generic) and when it
+    appears earlier in the list, since Places orders types from most to least
+    specific.
+
+    Args:
+        types: List of Google place types (e.g., ["sushi_restaurant", "restaurant", "food"])
+
+    Returns:
+        list: Matched category names, most specific first (empty if nothing matched)
+    """
+    scores = {}
+    first_seen = {}
+    for position, place_type in enumerate(types):
+        categories = type_index.get(place_type)
+        if not categories:
+            continue
+
+        weight = GENERIC_TYPE_WEIGHT if place_type in GENERIC_PLACE_TYPES else 1.0
+        weight = weight / len(categories) / (position + 1)
+        for category in categories:
+            scores[category] = scores.get(category, 0.0) + weight
+            first_seen.setdefault(category, position)
+
+    return sorted(scores, key=lambda category: (-scores[category], first_seen[category]))
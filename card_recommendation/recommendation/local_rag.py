@@ -0,0 +1,306 @@
+"""
+Local retrieval backend for RAGService (no network).
+
+build_local_rag_index chunks card benefit PDFs and writes an index to
+LOCAL_RAG_INDEX_DIR:
+- a BM25 inverted index: postings (chunk ids, term frequencies) in NumPy
+  arrays, with each term's slice recorded in vocab.json
+- dense vectors from a hashing embedder (word unigrams and bigrams hashed
+  into EMBEDDING_DIM signed buckets, log-scaled and L2-normalized)
+
+The arrays are saved as .npy files and memory-mapped when loaded, so worker
+processes share the pages. Scoring is vectorized: BM25 adds each query
+term's postings into one score array, the dense scores are one
+matrix-vector product, and hybrid mode mixes the two after scaling each to
+[0, 1].
+
+With RAG_BACKEND=local, RAGService.search answers from this index and
+returns objects shaped like the xAI SearchResponse (matches with file_id,
+chunk_id, chunk_content, score and collection_ids). With
+RAG_LOCAL_FALLBACK=True, the remote backend falls back to this index when a
+search fails. Grok's collections_search tool always searches the remote
+collection, so the local backend serves RAG prefetch mode, the benchmarks
+and development.
+"""
+import json
+import math
+import os
+import re
+import shutil
+import threading
+import zlib
+from types import SimpleNamespace
+
+import numpy as np
+from django.conf import settings
+
+from .pdf_preprocess import split_paragraphs
+
+INDEX_FORMAT_VERSION = 1
+
+EMBEDDING_DIM = 512
+# Words per chunk (paragraphs are packed up to this size)
+CHUNK_WORDS = 200
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Weight of the dense score in hybrid mode (the BM25 score gets the rest)
+HYBRID_DENSE_WEIGHT = 0.5
+
+_TOKEN_RE = re.compile(r'\w+')
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def tokenize(text):
+    """Lowercase word tokens"""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def embed(tokens):
+    """
+    Hashing embedding of a token list.
+
+    Args:
+        tokens: Tokens from tokenize()
+
+    Returns:
+        np.ndarray: float32 vector of EMBEDDING_DIM with unit length (zeros if no tokens)
+    """
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    if not features:
+        return vector
+    hashes = np.fromiter((zlib.crc32(feature.encode('utf-8')) for feature in features), dtype=np.uint32, count=len(features))
+    signs = np.where(hashes & 1, 1.0, -1.0).astype(np.float32)
+    np.add.at(vector, (hashes >> 1) % EMBEDDING_DIM, signs)
+    vector = np.sign(vector) * np.log1p(np.abs(vector))
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def chunk_text(text):
+    """
+    Pack a document's paragraphs into chunks of about CHUNK_WORDS words.
+
+    Returns:
+        list: Chunk strings
+    """
+    chunks = []
+    current, current_words = [], 0
+    for paragraph in split_paragraphs(text):
+        words = len(paragraph.split())
+        if current and current_words + words > CHUNK_WORDS:
+            chunks.append("\n".join(current))
+            current, current_words = [], 0
+        current.append(paragraph)
+        current_words += words
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def get_index_dir():
+    """Directory holding the local index"""
+    return getattr(settings, 'LOCAL_RAG_INDEX_DIR', os.path.join(settings.BASE_DIR, '.local_rag_index'))
+
+
+def build_index(documents, index_dir=None):
+    """
+    Build the local index, replacing any existing one.
+
+    Args:
+        documents: Iterable of dicts with 'collection_id', 'file_id', 'name' and 'text'
+        index_dir: Where to write the index (default: LOCAL_RAG_INDEX_DIR)
+
+    Returns:
+        dict: Counts of documents, chunks and terms
+    """
+    index_dir = index_dir or get_index_dir()
+    chunks = []
+    collections = []
+    postings = {}
+    lengths = []
+    vectors = []
+    document_count = 0
+
+    for document in documents:
+        document_count += 1
+        if document['collection_id'] not in collections:
+            collections.append(document['collection_id'])
+        for position, text in enumerate(chunk_text(document['text'])):
+            chunk_id = len(chunks)
+            tokens = tokenize(text)
+            chunks.append({
+                'collection': collections.index(document['collection_id']),
+                'file_id': document['file_id'],
+                'name': document['name'],
+                'chunk_id': f"{document['file_id']}:{position}",
+                'text': text,
+            })
+            lengths.append(len(tokens))
+            vectors.append(embed(tokens))
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                postings.setdefault(token, []).append((chunk_id, count))
+
+    # Flatten the postings, recording each term's [offset, length]
+    vocab = {}
+    posting_chunks = []
+    posting_counts = []
+    for term in sorted(postings):
+        entries = postings[term]
+        vocab[term] = [len(posting_chunks), len(entries)]
+        posting_chunks.extend(chunk_id for chunk_id, _ in entries)
+        posting_counts.extend(count for _, count in entries)
+
+    # Write next to the live index, then swap it in
+    temp_dir = f"{index_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    os.makedirs(temp_dir)
+    np.save(os.path.join(temp_dir, 'embeddings.npy'), np.array(vectors, dtype=np.float32).reshape(-1, EMBEDDING_DIM))
+    np.save(os.path.join(temp_dir, 'lengths.npy'), np.array(lengths, dtype=np.float32))
+    np.save(os.path.join(temp_dir, 'chunk_collections.npy'), np.array([c['collection'] for c in chunks], dtype=np.int32))
+    np.save(os.path.join(temp_dir, 'posting_chunks.npy'), np.array(posting_chunks, dtype=np.int32))
+    np.save(os.path.join(temp_dir, 'posting_counts.npy'), np.array(posting_counts, dtype=np.float32))
+    with open(os.path.join(temp_dir, 'vocab.json'), 'w', encoding='utf-8') as f:
+        json.dump(vocab, f)
+    with open(os.path.join(temp_dir, 'chunks.json'), 'w', encoding='utf-8') as f:
+        json.dump(chunks, f)
+    with open(os.path.join(temp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({
+            'format_version': INDEX_FORMAT_VERSION,
+            'embedding_dim': EMBEDDING_DIM,
+            'collections': collections,
+            'documents': document_count,
+        }, f)
+
+    old_dir = f"{index_dir}.old-{os.getpid()}"
+    if os.path.exists(index_dir):
+        os.replace(index_dir, old_dir)
+    os.replace(temp_dir, index_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+    return {'documents': document_count, 'chunks': len(chunks), 'terms': len(vocab)}
+
+
+class LocalIndex:
+    """A built index, memory-mapped from disk"""
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta['format_version'] != INDEX_FORMAT_VERSION or meta['embedding_dim'] != EMBEDDING_DIM:
+            raise ValueError(f"Local RAG index in {index_dir} is outdated; run build_local_rag_index")
+        with open(os.path.join(index_dir, 'vocab.json'), 'r', encoding='utf-8') as f:
+            self.vocab = json.load(f)
+        with open(os.path.join(index_dir, 'chunks.json'), 'r', encoding='utf-8') as f:
+            self.chunks = json.load(f)
+        self.collections = meta['collections']
+
+        def load(name):
+            return np.load(os.path.join(index_dir, name), mmap_mode='r')
+
+        self.embeddings = load('embeddings.npy')
+        self.lengths = load('lengths.npy')
+        self.chunk_collections = load('chunk_collections.npy')
+        self.posting_chunks = load('posting_chunks.npy')
+        self.posting_counts = load('posting_counts.npy')
+        average_length = float(self.lengths.mean()) if len(self.lengths) else 0.0
+        # The BM25 length normalization only depends on the chunk, so compute it once
+        self.length_norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths / (average_length or 1.0))
+
+    def bm25_scores(self, tokens):
+        """BM25 score of every chunk for the query tokens"""
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        if not len(scores):
+            return scores
+        for token in set(tokens):
+            entry = self.vocab.get(token)
+            if entry is None:
+                continue
+            offset, count = entry
+            chunk_ids = self.posting_chunks[offset:offset + count]
+            term_counts = self.posting_counts[offset:offset + count]
+            idf = math.log(1 + (len(scores) - count + 0.5) / (count + 0.5))
+            # Each chunk appears once per term, so plain fancy-index addition is safe
+            scores[chunk_ids] += idf * term_counts * (BM25_K1 + 1) / (term_counts + self.length_norm[chunk_ids])
+        return scores
+
+    def search(self, query, collection_ids, retrieval_mode="hybrid", top_k=5):
+        """
+        Search the chunks of some collections.
+
+        Args:
+            query: Search query
+            collection_ids: Collections to search (chunks from other collections are ignored)
+            retrieval_mode: "hybrid", "semantic", or "keyword"
+            top_k: Number of results to return
+
+        Returns:
+            SimpleNamespace: matches list shaped like the xAI SearchResponse
+        """
+        wanted = [index for index, collection_id in enumerate(self.collections) if collection_id in collection_ids]
+        if not wanted or not self.chunks:
+            return SimpleNamespace(matches=[])
+
+        tokens = tokenize(query)
+        if retrieval_mode == "keyword":
+            scores = self.bm25_scores(tokens)
+        elif retrieval_mode == "semantic":
+            scores = self.embeddings @ embed(tokens)
+        else:
+            keyword = self.bm25_scores(tokens)
+            dense = np.clip(self.embeddings @ embed(tokens), 0, None)
+            keyword_max, dense_max = keyword.max(), dense.max()
+            scores = (
+                HYBRID_DENSE_WEIGHT * (dense / dense_max if dense_max > 0 else dense)
+                + (1 - HYBRID_DENSE_WEIGHT) * (keyword / keyword_max if keyword_max > 0 else keyword)
+            )
+
+        if len(wanted) < len(self.collections):
+            scores = np.where(np.isin(self.chunk_collections, wanted), scores, -np.inf)
+        top_k = min(top_k, len(scores))
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+
+        matches = []
+        for chunk_index in top:
+            score = float(scores[chunk_index])
+            if not np.isfinite(score) or score <= 0:
+                continue
+            chunk = self.chunks[chunk_index]
+            matches.append(SimpleNamespace(
+                file_id=chunk['file_id'],
+                chunk_id=chunk['chunk_id'],
+                chunk_content=chunk['text'],
+                score=round(score, 4),
+                collection_ids=[self.collections[chunk['collection']]],
+            ))
+        return SimpleNamespace(matches=matches)
+
+
+def get_local_index():
+    """
+    Get this process's copy of the local index, reloading it after a rebuild.
+
+    Returns:
+        LocalIndex
+
+    Raises:
+        FileNotFoundError: If build_local_rag_index has not been run
+    """
+    global _index
+    index_dir = get_index_dir()
+    meta_path = os.path.join(index_dir, 'meta.json')
+    if not os.path.exists(meta_path):
+        raise FileNotFoundError(f"No local RAG index in {index_dir}; run build_local_rag_index")
+    modified = os.stat(meta_path).st_mtime_ns
+    with _index_lock:
+        if _index is None or _index[0] != modified:
+            _index = (modified, LocalIndex(index_dir))
+        return _index[1]
@@ -0,0 +1,211 @@
+"""
+Management command to benchmark RAG retrieval latency, throughput and recall.
+
+Runs a labelled query set (see rag_benchmark_queries.json) against a
+RAGService backend:
+- latency: each query run --repeat times one after another (p50/p95/p99)
+- throughput: the same searches spread over --concurrency threads
+- recall@k: share of queries whose expected passage is in the top k chunks
+
+Each query entry names a card ("card", "issuer") and either a spending
+"category" (the query is then built the way RAG prefetch builds it) or an
+explicit "query". "expected" is a passage from the card's documents; a chunk
+matches when it contains it (case and whitespace are ignored).
+
+The remote backend's result cache is bypassed unless --cached is given.
+Results are written as JSON so runs can be compared.
+
+Usage:
+    # Benchmark the local index
+    python manage.py benchmark_rag --backend local
+
+    # Benchmark the xAI collection in keyword mode with 16 threads
+    python manage.py benchmark_rag --backend remote --retrieval-mode keyword --concurrency 16
+
+    # Own query set and output file
+    python manage.py benchmark_rag --queries path/to/queries.json --output results.json
+"""
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from recommendation.rag_prefetch import card_search_query
+from recommendation.rag_service import RAGService
+from recommendation.search_cache import SEARCH_CACHE_ALIAS
+
+DEFAULT_QUERIES = os.path.join(os.path.dirname(__file__), 'rag_benchmark_queries.json')
+
+
+def _normalize(text):
+    return " ".join(text.lower().split())
+
+
+class Command(BaseCommand):
+    help = 'Benchmark RAG retrieval latency, throughput and recall@k on a labelled query set'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--queries',
+            type=str,
+            default=DEFAULT_QUERIES,
+            help='Labelled query set (default: rag_benchmark_queries.json next to this command)'
+        )
+        parser.add_argument(
+            '--backend',
+            choices=['remote', 'local'],
+            help='Search backend (default: RAG_BACKEND)'
+        )
+        parser.add_argument(
+            '--collection-id',
+            type=str,
+            help='Collection to search (default: CARD_BENEFITS_COLLECTION_ID)'
+        )
+        parser.add_argument(
+            '--retrieval-mode',
+            choices=['hybrid', 'semantic', 'keyword'],
+            default='hybrid',
+            help='Retrieval mode (default: hybrid)'
+        )
+        parser.add_argument(
+            '--k',
+            type=int,
+            action='append',
+            dest='ks',
+            help='Report recall@k for this k (repeatable, default: 1, 3 and 5)'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Times each query is run (default: 5)'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=8,
+            help='Threads for the throughput run (default: 8)'
+        )
+        parser.add_argument(
+            '--cached',
+            action='store_true',
+            help="Keep the remote backend's search result cache (default: every search misses it)"
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            help='Results file (default: rag_benchmark_<backend>_<timestamp>.json)'
+        )
+
+    def handle(self, *args, **options):
+        collection_id = options['collection_id'] or getattr(settings, 'CARD_BENEFITS_COLLECTION_ID', None)
+        if not collection_id:
+            raise CommandError("Specify --collection-id or set CARD_BENEFITS_COLLECTION_ID")
+
+        try:
+            with open(options['queries'], 'r', encoding='utf-8') as f:
+                labelled = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read query set {options['queries']}: {str(e)}")
+        if not labelled:
+            raise CommandError("The query set is empty")
+
+        rag_service = RAGService(backend=options['backend'])
+        ks = sorted(set(options['ks'] or [1, 3, 5]))
+        top_k = max(ks)
+        repeat = max(1, options['repeat'])
+        queries = [
+            entry.get('query') or card_search_query(
+                {'name': entry['card'], 'issuer': entry.get('issuer', '')}, entry.get('category')
+            )
+            for entry in labelled
+        ]
+
+        def search(query):
+            if not options['cached']:
+                caches[SEARCH_CACHE_ALIAS].clear()
+            started = time.perf_counter()
+            results = rag_service.search(query, [collection_id], retrieval_mode=options['retrieval_mode'], top_k=top_k)
+            return results, (time.perf_counter() - started) * 1000
+
+        self.stdout.write(
+            f"Benchmarking {len(queries)} queries on the {rag_service.backend} backend "
+            f"({options['retrieval_mode']}, top_k={top_k}, repeat={repeat})"
+        )
+
+        # Latency and recall: sequential runs
+        latencies = []
+        per_query = []
+        for entry, query in zip(labelled, queries):
+            expected = _normalize(entry['expected'])
+            rank = None
+            query_latencies = []
+            for _ in range(repeat):
+                results, elapsed_ms = search(query)
+                query_latencies.append(elapsed_ms)
+            matches = getattr(results, 'matches', None) or []
+            for position, match in enumerate(matches, 1):
+                if expected in _normalize(getattr(match, 'chunk_content', '') or ''):
+                    rank = position
+                    break
+            latencies += query_latencies
+            per_query.append({
+                'card': entry['card'],
+                'category': entry.get('category'),
+                'query': query,
+                'rank': rank,
+                'p50_ms': round(float(np.percentile(query_latencies, 50)), 3),
+            })
+            status = f"rank {rank}" if rank else f"not in top {top_k}"
+            self.stdout.write(f"  {'✅' if rank else '❌'} {query} ({status})")
+
+        # Throughput: the same searches spread over concurrent threads
+        workload = queries * repeat
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, options['concurrency'])) as executor:
+            list(executor.map(search, workload))
+        throughput = len(workload) / (time.perf_counter() - started)
+
+        recall = {
+            f"recall@{k}": round(sum(1 for q in per_query if q['rank'] and q['rank'] <= k) / len(per_query), 4)
+            for k in ks
+        }
+        latency = {
+            f"p{p}_ms": round(float(np.percentile(latencies, p)), 3) for p in (50, 95, 99)
+        }
+        results = {
+            'run_at': timezone.now().isoformat(),
+            'config': {
+                'backend': rag_service.backend,
+                'collection_id': collection_id,
+                'retrieval_mode': options['retrieval_mode'],
+                'top_k': top_k,
+                'repeat': repeat,
+                'concurrency': options['concurrency'],
+                'cached': options['cached'],
+                'queries_file': os.path.abspath(options['queries']),
+                'query_count': len(queries),
+            },
+            'latency': latency,
+            'throughput_qps': round(throughput, 2),
+            'recall': recall,
+            'queries': per_query,
+        }
+
+        output = options['output'] or f"rag_benchmark_{rag_service.backend}_{timezone.now():%Y%m%d_%H%M%S}.json"
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+        self.stdout.write("\n" + "="*50)
+        self.stdout.write(
+            "Latency: " + ", ".join(f"{name.replace('_ms', '')} {value:.2f}ms" for name, value in latency.items())
+        )
+        self.stdout.write(f"Throughput: {throughput:.1f} searches/s with {options['concurrency']} threads")
+        self.stdout.write("Recall: " + ", ".join(f"{name} {value:.0%}" for name, value in recall.items()))
+        self.stdout.write(self.style.SUCCESS(f"✅ Results written to {output}"))
@@ -0,0 +1,104 @@
+"""
+Management command to build the local RAG index from a directory of card PDFs.
+
+The index serves RAGService searches with RAG_BACKEND=local (or as the
+fallback with RAG_LOCAL_FALLBACK=True); see recommendation/local_rag.py.
+Documents get the file IDs recorded in the directory's upload manifest when
+they were uploaded to the same collection, so card document tags
+(CardDocument) apply to local results too.
+
+Usage:
+    # Index a directory as CARD_BENEFITS_COLLECTION_ID
+    python manage.py build_local_rag_index --pdf-dir path/to/pdfs/
+
+    # Index condensed text as another collection
+    python manage.py build_local_rag_index --pdf-dir path/to/pdfs/ --collection-id "col_xyz123" --condense
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recommendation.local_rag import build_index, get_index_dir
+from recommendation.pdf_preprocess import condense_pdfs, extract_pdf_text
+from recommendation.upload_manifest import MANIFEST_FILENAME, UploadManifest, file_sha256
+
+
+class Command(BaseCommand):
+    help = 'Build the local RAG index (BM25 + hashing embeddings) from card PDFs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pdf-dir',
+            type=str,
+            required=True,
+            help='Directory containing the PDF files to index'
+        )
+        parser.add_argument(
+            '--collection-id',
+            type=str,
+            help='Collection ID the documents are searched under (default: CARD_BENEFITS_COLLECTION_ID)'
+        )
+        parser.add_argument(
+            '--condense',
+            action='store_true',
+            help='Index the condensed text (boilerplate removed, as uploaded with --condense)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Number of files extracted concurrently (default: 4)'
+        )
+
+    def handle(self, *args, **options):
+        collection_id = options['collection_id'] or getattr(settings, 'CARD_BENEFITS_COLLECTION_ID', None)
+        if not collection_id:
+            raise CommandError("Specify --collection-id or set CARD_BENEFITS_COLLECTION_ID")
+
+        pdf_dir = options['pdf_dir']
+        if not os.path.isdir(pdf_dir):
+            raise CommandError(f"Directory not found: {pdf_dir}")
+        pdf_paths = [
+            os.path.join(pdf_dir, pdf_file)
+            for pdf_file in sorted(os.listdir(pdf_dir))
+            if pdf_file.lower().endswith('.pdf')
+        ]
+        if not pdf_paths:
+            raise CommandError(f"No PDF files found in {pdf_dir}")
+
+        started = time.monotonic()
+        self.stdout.write(f"Extracting text from {len(pdf_paths)} PDF file(s)...")
+        workers = max(1, options['workers'])
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            hashes = dict(zip(pdf_paths, executor.map(file_sha256, pdf_paths)))
+        if options['condense']:
+            texts, _ = condense_pdfs(pdf_paths, workers)
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                texts = dict(zip(pdf_paths, executor.map(lambda path: extract_pdf_text(path, hashes[path]), pdf_paths)))
+
+        # Use the uploaded documents' file IDs where the manifest has them
+        manifest = UploadManifest(os.path.join(pdf_dir, MANIFEST_FILENAME))
+        uploaded_file_ids = manifest.file_ids_by_path(collection_id)
+
+        documents = [
+            {
+                'collection_id': collection_id,
+                'file_id': uploaded_file_ids.get(os.path.abspath(pdf_path), f"local_{hashes[pdf_path][:24]}"),
+                'name': os.path.basename(pdf_path),
+                'text': texts[pdf_path],
+            }
+            for pdf_path in pdf_paths
+        ]
+        stats = build_index(documents)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Indexed {stats['documents']} document(s) as {stats['chunks']} chunk(s) "
+            f"({stats['terms']:,} terms) in {elapsed:.1f}s"
+        ))
+        self.stdout.write(f"Index directory: {get_index_dir()}")
+        self.stdout.write("Set RAG_BACKEND=local (or RAG_LOCAL_FALLBACK=True) to search it")
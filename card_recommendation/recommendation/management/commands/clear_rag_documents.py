@@ -1,15 +1,28 @@
 """
 Management command to clear all documents from a xAI collection.
 
+Documents are listed page by page and deleted concurrently; transient API
+errors are retried with exponential backoff.
+
 Usage:
     # Clear all documents from a collection
     python manage.py clear_rag_documents --collection-id "col_xyz123"
 
     # Clear documents and confirm
     python manage.py clear_rag_documents --collection-id "col_xyz123" --confirm
+
+    # Clear a large collection with more concurrent deletions
+    python manage.py clear_rag_documents --collection-id "col_xyz123" --confirm --workers 32
 """
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 from django.core.management.base import BaseCommand, CommandError
-from recommendation.rag_service import RAGService
+from recommendation.card_documents import forget_card_documents
+from recommendation.rag_service import RAGService, bump_collection_version, call_with_retries
+
+# Print progress after this many documents
+PROGRESS_INTERVAL = 50
 
 
 class Command(BaseCommand):
@@ -27,6 +40,18 @@ class Command(BaseCommand):
             action='store_true',
             help='Skip confirmation prompt'
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=16,
+            help='Number of concurrent deletions (default: 16)'
+        )
+        parser.add_argument(
+            '--retries',
+            type=int,
+            default=4,
+            help='Attempts per document on transient errors (default: 4)'
+        )
 
     def handle(self, *args, **options):
         collection_id = options['collection_id']
@@ -35,61 +60,74 @@ class Command(BaseCommand):
         self.stdout.write(f"Fetching documents from collection: {collection_id}")
 
         try:
-            # List all documents in the collection
-            collection_info = rag_service.client.collections.get(collection_id)
-
-            # Get documents from the collection
-            documents = []
-            if hasattr(collection_info, 'documents'):
-                documents = collection_info.documents
-            elif hasattr(collection_info, 'files'):
-                documents = collection_info.files
-
-            if not documents:
-                self.stdout.write(self.style.WARNING(
-                    "No documents found in this collection."
-                ))
-                return
-
-            self.stdout.write(f"Found {len(documents)} document(s):")
-            for doc in documents:
-                doc_id = getattr(doc, 'document_id', None) or getattr(doc, 'id', None) or getattr(doc, 'file_id', None)
-                doc_name = getattr(doc, 'name', None) or getattr(doc, 'filename', 'Unknown')
-                self.stdout.write(f"  - {doc_name} (ID: {doc_id})")
+            # List every document in the collection, page by page
+            documents = [
+                (doc.file_metadata.file_id, doc.file_metadata.name or 'Unknown')
+                for doc in rag_service.list_documents(collection_id)
+            ]
+        except Exception as e:
+            raise CommandError(f"Error accessing collection: {str(e)}")
 
-            # Confirm deletion
-            if not options['confirm']:
-                confirm = input(f"\nAre you sure you want to delete all {len(documents)} document(s)? (yes/no): ")
-                if confirm.lower() != 'yes':
-                    self.stdout.write(self.style.WARNING("Operation cancelled."))
-                    return
+        if not documents:
+            self.stdout.write(self.style.WARNING(
+                "No documents found in this collection."
+            ))
+            return
 
-            # Delete all documents
-            deleted_count = 0
-            failed_count = 0
+        self.stdout.write(f"Found {len(documents)} document(s):")
+        for doc_id, doc_name in documents:
+            self.stdout.write(f"  - {doc_name} (ID: {doc_id})")
 
-            for doc in documents:
-                doc_id = getattr(doc, 'document_id', None) or getattr(doc, 'id', None) or getattr(doc, 'file_id', None)
-                doc_name = getattr(doc, 'name', None) or getattr(doc, 'filename', 'Unknown')
+        # Confirm deletion
+        if not options['confirm']:
+            confirm = input(f"\nAre you sure you want to delete all {len(documents)} document(s)? (yes/no): ")
+            if confirm.lower() != 'yes':
+                self.stdout.write(self.style.WARNING("Operation cancelled."))
+                return
 
+        # Delete all documents concurrently
+        deleted_count = 0
+        failed_count = 0
+        started = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as executor:
+            futures = {
+                executor.submit(
+                    call_with_retries, rag_service.delete_document, collection_id, doc_id,
+                    attempts=max(1, options['retries'])
+                ): (doc_id, doc_name)
+                for doc_id, doc_name in documents
+            }
+            for future in as_completed(futures):
+                doc_id, doc_name = futures[future]
                 try:
-                    rag_service.delete_document(collection_id, doc_id)
-                    self.stdout.write(self.style.SUCCESS(f"  ✅ Deleted: {doc_name}"))
+                    future.result()
+                    forget_card_documents(collection_id, doc_id)
                     deleted_count += 1
                 except Exception as e:
                     self.stdout.write(self.style.ERROR(f"  ❌ Failed to delete {doc_name}: {str(e)}"))
                     failed_count += 1
 
-            # Summary
-            self.stdout.write("\n" + "="*50)
-            self.stdout.write(self.style.SUCCESS(
-                f"✅ Deletion complete! {deleted_count} document(s) deleted"
+                done = deleted_count + failed_count
+                if done % PROGRESS_INTERVAL == 0 and done < len(documents):
+                    rate = done / (time.monotonic() - started)
+                    self.stdout.write(f"  ... {done}/{len(documents)} processed ({rate:.1f} docs/s)")
+
+        elapsed = time.monotonic() - started
+
+        # Invalidate analyses and searches cached from the deleted documents
+        if deleted_count:
+            bump_collection_version(collection_id)
+
+        # Summary
+        self.stdout.write("\n" + "="*50)
+        rate = deleted_count / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Deletion complete! {deleted_count} document(s) deleted in {elapsed:.1f}s ({rate:.1f} docs/s)"
+        ))
+        if failed_count > 0:
+            self.stdout.write(self.style.WARNING(
+                f"⚠️  {failed_count} document(s) failed to delete"
             ))
-            if failed_count > 0:
-                self.stdout.write(self.style.WARNING(
-                    f"⚠️  {failed_count} document(s) failed to delete"
-                ))
+        else:
             self.stdout.write(f"\nCollection ID {collection_id} is now empty and ready for new documents.")
-
-        except Exception as e:
-            raise CommandError(f"Error accessing collection: {str(e)}")
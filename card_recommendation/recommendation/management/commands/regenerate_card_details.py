@@ -0,0 +1,152 @@
+"""
+Management command to regenerate stored card details in bulk.
+
+Generates a details document for every card whose stored document is missing
+or was built from older reward data, an older RAG collection version or a
+different model. Run it after catalog changes or document uploads (e.g., from
+Heroku Scheduler) so the card details endpoint never has to stream.
+
+Usage:
+    # Regenerate every missing or stale document
+    python manage.py regenerate_card_details
+
+    # Only some cards, regenerating even if up to date
+    python manage.py regenerate_card_details --card-id <uuid> --card-id <uuid> --force
+
+    # Show what would be regenerated
+    python manage.py regenerate_card_details --dry-run
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from xai_sdk.chat import system, user as xai_user
+
+from recommendation.card_details_store import reward_data_version, is_current, save_card_details_document
+from recommendation.card_profiles import get_card_profiles
+from recommendation.models import Card, CardDetailsDocument
+from recommendation.rag_prefetch import start_card_prefetch
+from recommendation.utils import build_card_details_prompt, CARD_DETAILS_SYSTEM_PROMPT, CARD_DETAILS_PREFETCH_SYSTEM_PROMPT
+from recommendation.views import get_rag_tools, get_cards_rag_scope
+from recommendation.xai_clients import get_xai_client
+
+# Seconds allowed for the document search per card in RAG prefetch mode
+PREFETCH_BUDGET = 30
+
+
+class Command(BaseCommand):
+    help = 'Regenerate stored card details for cards whose reward data or RAG documents changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--card-id',
+            action='append',
+            dest='card_ids',
+            help='Only regenerate this card (repeatable)'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Regenerate even if the stored document is up to date'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Number of concurrent Grok requests (default: 4)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='List the cards that would be regenerated without calling Grok'
+        )
+
+    def handle(self, *args, **options):
+        card_ids = options['card_ids'] or list(Card.objects.values_list('id', flat=True))
+        profiles = {profile['id']: profile for profile in get_card_profiles(card_ids)}
+        if not profiles:
+            raise CommandError("No cards found")
+
+        # Each card is searched only in its own documents (see rag_scope.py)
+        rag_scope = get_cards_rag_scope(list(profiles))
+        documents = {
+            str(document.card_id): document
+            for document in CardDetailsDocument.objects.filter(card_id__in=list(profiles))
+        }
+        stale = []
+        for card_id, card_data in profiles.items():
+            tools = get_rag_tools(rag_scope.collection_ids([card_id]) if rag_scope else None)
+            model = "grok-4" if tools else "grok-3"
+            collection_version = rag_scope.version_tag([card_id]) if rag_scope else None
+            reward_version = reward_data_version(card_data)
+            document = documents.get(card_id)
+            if options['force'] or document is None or not is_current(document, reward_version, collection_version, model):
+                stale.append((card_data, reward_version, collection_version, model, tools))
+
+        self.stdout.write(f"{len(stale)} of {len(profiles)} cards need details")
+        if options['dry_run']:
+            for card_data, _, collection_version, model, _ in stale:
+                self.stdout.write(
+                    f"  - {card_data['name']} ({card_data['id']}, model: {model}, documents: {collection_version})"
+                )
+            return
+        if not stale:
+            return
+        if not os.environ.get('XAI_API_KEY'):
+            raise CommandError("XAI_API_KEY environment variable not set")
+
+        started = time.monotonic()
+        stored_count = 0
+        failed_count = 0
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as executor:
+            futures = {
+                executor.submit(self.generate, card_data, reward_version, collection_version, model, tools, rag_scope): card_data
+                for card_data, reward_version, collection_version, model, tools in stale
+            }
+            for future in as_completed(futures):
+                card_data = futures[future]
+                try:
+                    stored = future.result()
+                except Exception as e:
+                    stored = False
+                    self.stdout.write(self.style.ERROR(f"❌ {card_data['name']}: {str(e)}"))
+                if stored:
+                    stored_count += 1
+                    self.stdout.write(self.style.SUCCESS(f"✅ {card_data['name']}"))
+                else:
+                    failed_count += 1
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"\n✅ Stored details for {stored_count} card(s) in {elapsed:.1f}s ({failed_count} failed)"
+        ))
+
+    def generate(self, card_data, reward_version, collection_version, model, tools, rag_scope):
+        """Generate and store one card's details (runs in a worker thread)"""
+        try:
+            system_prompt, rag_context = CARD_DETAILS_SYSTEM_PROMPT, None
+            prefetch = start_card_prefetch([card_data], scope=rag_scope)
+            if prefetch is not None:
+                # No one is waiting on a response here, so allow a much longer search
+                rag_context, complete = prefetch.collect(budget=PREFETCH_BUDGET)
+                if not complete:
+                    raise CommandError("document search did not finish")
+                system_prompt = CARD_DETAILS_PREFETCH_SYSTEM_PROMPT
+
+            chat = get_xai_client().chat.create(
+                model=model,
+                messages=[
+                    system(system_prompt),
+                    xai_user(build_card_details_prompt(card_data, rag_context=rag_context))
+                ],
+                tools=tools if tools else None
+            )
+            response = chat.sample()
+            document = save_card_details_document(
+                card_data['id'], response.content.strip(), reward_version, collection_version, model
+            )
+            return document is not None
+        finally:
+            connections.close_all()
@@ -0,0 +1,251 @@
+"""
+Management command to sync a collection with a local directory of card PDFs.
+
+Compares the directory with the collection by document name and SHA-256
+(stored in each document's fields by upload_card_pdfs and this command):
+- new files are uploaded
+- changed files are uploaded, then their previous version is deleted
+- documents with no local file (or duplicates of a name) are deleted
+- unchanged files are left alone
+
+Uploads finish before anything is deleted, so the collection never loses a
+document that still exists locally. Card tags (CardDocument) follow a
+changed document to its new version.
+
+Usage:
+    # Show what would change
+    python manage.py sync_card_pdfs --pdf-dir path/to/pdfs/ --dry-run
+
+    # Sync CARD_BENEFITS_COLLECTION_ID with the directory
+    python manage.py sync_card_pdfs --pdf-dir path/to/pdfs/
+
+    # Sync another collection, tagging new files with the cards named in them
+    python manage.py sync_card_pdfs --collection-id "col_xyz123" --pdf-dir path/to/pdfs/ --match-cards
+
+    # Keep condensed text instead of the PDFs (see pdf_preprocess.py)
+    python manage.py sync_card_pdfs --pdf-dir path/to/pdfs/ --condense
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recommendation.card_documents import match_cards, record_card_documents, move_card_documents, forget_card_documents
+from recommendation.models import Card
+from recommendation.pdf_preprocess import condense_pdfs, condensed_document_name, text_sha256
+from recommendation.rag_service import RAGService, bump_collection_version, call_with_retries, document_file_id
+from recommendation.upload_manifest import MANIFEST_FILENAME, UploadManifest, file_sha256
+
+
+class Command(BaseCommand):
+    help = 'Upload new or changed card PDFs and delete stale documents so a collection matches a directory'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--collection-id',
+            type=str,
+            help='Collection to sync (default: CARD_BENEFITS_COLLECTION_ID)'
+        )
+        parser.add_argument(
+            '--pdf-dir',
+            type=str,
+            required=True,
+            help='Directory containing the PDF files the collection should hold'
+        )
+        parser.add_argument(
+            '--match-cards',
+            action='store_true',
+            help='Tie new documents to the cards whose name appears in their file name'
+        )
+        parser.add_argument(
+            '--condense',
+            action='store_true',
+            help='Keep condensed text (<name>.txt, boilerplate removed) in the collection instead of the PDFs'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Number of concurrent uploads or deletions (default: 4)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=20,
+            help='Documents per batch; progress is reported after each batch (default: 20)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report the differences without changing the collection'
+        )
+
+    def handle(self, *args, **options):
+        collection_id = options['collection_id'] or getattr(settings, 'CARD_BENEFITS_COLLECTION_ID', None)
+        if not collection_id:
+            raise CommandError("Specify --collection-id or set CARD_BENEFITS_COLLECTION_ID")
+
+        pdf_dir = options['pdf_dir']
+        if not os.path.isdir(pdf_dir):
+            raise CommandError(f"Directory not found: {pdf_dir}")
+
+        local = {
+            pdf_file: os.path.join(pdf_dir, pdf_file)
+            for pdf_file in sorted(os.listdir(pdf_dir))
+            if pdf_file.lower().endswith('.pdf')
+        }
+        workers = max(1, options['workers'])
+        condensed = {}
+        if options['condense']:
+            # Documents are the condensed text, named <name>.txt
+            self.stdout.write(f"Extracting and condensing {len(local)} local PDF file(s) in {pdf_dir}...")
+            condensed, _ = condense_pdfs(list(local.values()), workers)
+            local = {condensed_document_name(pdf_file): pdf_path for pdf_file, pdf_path in local.items()}
+            local_hashes = {name: text_sha256(condensed[pdf_path]) for name, pdf_path in local.items()}
+        else:
+            self.stdout.write(f"Hashing {len(local)} local PDF file(s) in {pdf_dir}...")
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                local_hashes = dict(zip(local, executor.map(file_sha256, local.values())))
+
+        rag_service = RAGService()
+        self.stdout.write(f"Listing documents in collection: {collection_id}")
+        try:
+            remote = list(rag_service.list_documents(collection_id))
+        except Exception as e:
+            raise CommandError(f"Error accessing collection: {str(e)}")
+
+        # Diff by name, then by content hash
+        new_files, changed_files, stale_documents = [], [], []
+        unchanged_count = 0
+        remote_by_name = {}
+        for document in remote:
+            remote_by_name.setdefault(document.file_metadata.name, []).append(document)
+
+        for pdf_file in local:
+            documents = remote_by_name.pop(pdf_file, [])
+            if not documents:
+                new_files.append(pdf_file)
+                continue
+            current = [document for document in documents if document.fields.get('sha256') == local_hashes[pdf_file]]
+            if current:
+                unchanged_count += 1
+                # Keep one copy of the current content; any other copies are stale
+                stale_documents += [document for document in documents if document is not current[0]]
+            else:
+                changed_files.append((pdf_file, [document.file_metadata.file_id for document in documents]))
+        for documents in remote_by_name.values():
+            stale_documents += documents
+
+        self.stdout.write(
+            f"\n{len(new_files)} new, {len(changed_files)} changed, {unchanged_count} unchanged, "
+            f"{len(stale_documents)} stale"
+        )
+        for pdf_file in new_files:
+            self.stdout.write(f"  + {pdf_file}")
+        for pdf_file, _ in changed_files:
+            self.stdout.write(f"  ~ {pdf_file}")
+        for document in stale_documents:
+            self.stdout.write(f"  - {document.file_metadata.name} (ID: {document.file_metadata.file_id})")
+
+        if options['dry_run'] or not (new_files or changed_files or stale_documents):
+            return
+
+        all_cards = list(Card.objects.select_related('issuer')) if options['match_cards'] else []
+        manifest = UploadManifest(os.path.join(pdf_dir, MANIFEST_FILENAME))
+        started = time.monotonic()
+
+        # Upload first, so nothing that exists locally is ever missing from the collection
+        uploads = [(pdf_file, []) for pdf_file in new_files] + changed_files
+        uploaded, upload_failures = self.run_batches(
+            uploads,
+            lambda upload: self.upload(
+                rag_service, manifest, collection_id, upload[0], local[upload[0]], local_hashes[upload[0]],
+                condensed.get(local[upload[0]])
+            ),
+            lambda upload: upload[0],
+            'Uploaded',
+            workers,
+            options['batch_size'],
+        )
+
+        replaced_file_ids = []
+        for (pdf_file, old_file_ids), file_id in uploaded:
+            if old_file_ids:
+                # Card tags follow the document to its new version
+                for old_file_id in old_file_ids:
+                    move_card_documents(collection_id, old_file_id, file_id)
+                replaced_file_ids += old_file_ids
+            elif all_cards:
+                cards = match_cards(pdf_file, all_cards)
+                if cards:
+                    record_card_documents(cards, collection_id, file_id, pdf_file)
+
+        # Delete stale documents and the old versions of changed files that were re-uploaded
+        deletions = [document.file_metadata.file_id for document in stale_documents] + replaced_file_ids
+        deleted, delete_failures = self.run_batches(
+            deletions,
+            lambda file_id: call_with_retries(rag_service.delete_document, collection_id, file_id),
+            lambda file_id: file_id,
+            'Deleted',
+            workers,
+            options['batch_size'],
+        )
+        for file_id, _ in deleted:
+            forget_card_documents(collection_id, file_id)
+
+        # Invalidate analyses and searches cached from the old documents
+        if uploaded or deleted:
+            bump_collection_version(collection_id)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write("\n" + "="*50)
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Sync complete in {elapsed:.1f}s! {len(uploaded)} uploaded, {len(deleted)} deleted"
+        ))
+        if upload_failures or delete_failures:
+            self.stdout.write(self.style.WARNING(
+                f"⚠️  {upload_failures} upload(s) and {delete_failures} deletion(s) failed; run the sync again to retry"
+            ))
+
+    def upload(self, rag_service, manifest, collection_id, name, pdf_path, sha256, text=None):
+        """Upload one file (or its condensed text) with its hash in the document fields (runs in a worker thread)"""
+        if text is None:
+            document = rag_service.upload_document(collection_id, pdf_path, fields={'sha256': sha256})
+        else:
+            document = rag_service.upload_text(collection_id, name, text, fields={'sha256': sha256})
+        file_id = document_file_id(document)
+        manifest.record(collection_id, sha256, file_id, name, pdf_path)
+        return file_id
+
+    def run_batches(self, items, action, label, verb, workers, batch_size):
+        """
+        Apply an action to items concurrently, one batch at a time.
+
+        Args:
+            items: Items to process
+            action: Function called with each item (in a worker thread)
+            label: Function giving an item's name for messages
+            verb: Past-tense verb for progress messages (e.g., "Uploaded")
+            workers: Concurrent calls per batch
+            batch_size: Items per batch
+
+        Returns:
+            tuple: (list of (item, result) that succeeded, number of failures)
+        """
+        succeeded = []
+        failed_count = 0
+        batch_size = max(1, batch_size)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for start in range(0, len(items), batch_size):
+                batch = items[start:start + batch_size]
+                futures = [(item, executor.submit(action, item)) for item in batch]
+                for item, future in futures:
+                    try:
+                        succeeded.append((item, future.result()))
+                    except Exception as e:
+                        failed_count += 1
+                        self.stdout.write(self.style.ERROR(f"  ❌ {label(item)}: {str(e)}"))
+                self.stdout.write(f"{verb} {len(succeeded)}/{len(items)}")
+        return succeeded, failed_count
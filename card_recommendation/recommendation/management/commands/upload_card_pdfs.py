@@ -1,6 +1,9 @@
 """
 Management command to upload card benefit PDFs to xAI collections.
 
+Uploaded documents can be tied to cards (recorded as CardDocument rows), so
+RAG searches for a wallet only cover that wallet's documents (see rag_scope.py).
+
 Usage:
     # Create a collection and upload a single PDF
     python manage.py upload_card_pdfs --create-collection "Chase Sapphire Preferred" --pdf path/to/benefits.pdf
@@ -13,10 +16,41 @@ Usage:
 
     # Create collection and upload all PDFs from a directory
     python manage.py upload_card_pdfs --create-collection "All Cards" --pdf-dir path/to/pdfs/
+
+    # Tie a PDF to a card
+    python manage.py upload_card_pdfs --collection-id "col_xyz123" --pdf path/to/benefits.pdf --card-id <uuid>
+
+    # Tie each PDF to the cards named in its file name, in one collection per issuer
+    # (files matching no card go to --collection-id or CARD_BENEFITS_COLLECTION_ID)
+    python manage.py upload_card_pdfs --pdf-dir path/to/pdfs/ --match-cards --per-issuer
+
+    # Upload with 8 concurrent workers, re-sending files already uploaded
+    python manage.py upload_card_pdfs --collection-id "col_xyz123" --pdf-dir path/to/pdfs/ --workers 8 --force
+
+    # Upload condensed text: boilerplate shared across the PDFs is removed (see pdf_preprocess.py)
+    python manage.py upload_card_pdfs --collection-id "col_xyz123" --pdf-dir path/to/pdfs/ --condense
+
+Each uploaded document's SHA-256 is kept in a manifest (.rag_upload_manifest.json in the PDF
+directory by default) and stored in the document's fields. Files already
+uploaded to the target collection are skipped, so an interrupted run resumes
+where it stopped when started again. A changed file replaces the document
+uploaded from the same path earlier (its card records move to the new one). The collection is listed first, and
+files whose documents have since been deleted from it are uploaded again.
 """
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
-from recommendation.rag_service import RAGService
+
+from recommendation.card_documents import (
+    match_cards, get_issuer_collection_id, record_card_documents, forget_card_documents, move_card_documents,
+)
+from recommendation.models import Card
+from recommendation.pdf_preprocess import condense_pdfs, condensed_document_name, text_sha256
+from recommendation.rag_service import RAGService, bump_collection_version, call_with_retries, document_file_id
+from recommendation.upload_manifest import MANIFEST_FILENAME, UploadManifest, file_sha256
 
 
 class Command(BaseCommand):
@@ -34,6 +68,11 @@ class Command(BaseCommand):
             type=str,
             help='Use existing collection ID'
         )
+        parser.add_argument(
+            '--per-issuer',
+            action='store_true',
+            help="Upload documents tied to cards into their issuer's collection (created if needed)"
+        )
 
         # Document upload options
         parser.add_argument(
@@ -52,6 +91,42 @@ class Command(BaseCommand):
             help='Custom name for the document (only for single PDF upload)'
         )
 
+        # Card options
+        parser.add_argument(
+            '--card-id',
+            action='append',
+            dest='card_ids',
+            help='Tie the uploaded documents to this card (repeatable)'
+        )
+        parser.add_argument(
+            '--match-cards',
+            action='store_true',
+            help='Tie each document to the cards whose name appears in its file name'
+        )
+
+        # Pipeline options
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Number of concurrent uploads (default: 4)'
+        )
+        parser.add_argument(
+            '--manifest',
+            type=str,
+            help=f'Upload manifest path (default: {MANIFEST_FILENAME} in the PDF directory)'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Upload files even if the manifest says they are already in the collection'
+        )
+        parser.add_argument(
+            '--condense',
+            action='store_true',
+            help='Upload extracted text without boilerplate repeated across the PDFs (as <name>.txt)'
+        )
+
         # Model options
         parser.add_argument(
             '--model',
@@ -60,6 +135,52 @@ class Command(BaseCommand):
             help='Embedding model to use (default: grok-embedding-small)'
         )
 
+    def upload(self, manifest, pdf_path, document_name, collection_id, force, text=None):
+        """
+        Upload one file unless its content is already in the collection (runs in a worker thread).
+
+        Args:
+            text: Condensed text to upload instead of the PDF (see pdf_preprocess.py)
+
+        Returns:
+            tuple: (True if uploaded, False if skipped as unchanged; the document's file ID;
+            the name it was uploaded as; file IDs of the replaced earlier versions that were
+            deleted; file IDs of earlier versions that could not be deleted)
+        """
+        # The hash is of the content actually uploaded
+        sha256 = file_sha256(pdf_path) if text is None else text_sha256(text)
+        entry = None if force else manifest.get(collection_id, sha256)
+        if entry is not None:
+            return False, entry['file_id'], entry['name'], [], []
+
+        previous_file_ids = manifest.file_ids_for_path(collection_id, pdf_path)
+        rag_service = RAGService()
+        name = document_name or os.path.basename(pdf_path)
+        if text is None:
+            document = rag_service.upload_document(
+                collection_id=collection_id,
+                file_path=pdf_path,
+                document_name=document_name,
+                fields={'sha256': sha256}
+            )
+        else:
+            name = condensed_document_name(name)
+            document = rag_service.upload_text(collection_id, name, text, fields={'sha256': sha256})
+        doc_id = document_file_id(document)
+        manifest.record(collection_id, sha256, doc_id, name, pdf_path)
+
+        # Earlier versions of the file would otherwise be searched next to this one
+        replaced, failed = [], []
+        for file_id in sorted(previous_file_ids - {doc_id}):
+            try:
+                call_with_retries(rag_service.delete_document, collection_id, file_id)
+            except Exception:
+                failed.append(file_id)
+            else:
+                replaced.append(file_id)
+        manifest.forget(collection_id, set(replaced))
+        return True, doc_id, name, replaced, failed
+
     def handle(self, *args, **options):
         rag_service = RAGService()
 
@@ -81,88 +202,185 @@ class Command(BaseCommand):
         elif options['collection_id']:
             collection_id = options['collection_id']
             self.stdout.write(f"Using existing collection: {collection_id}")
-        else:
+        elif options['per_issuer'] and getattr(settings, 'CARD_BENEFITS_COLLECTION_ID', None):
+            collection_id = settings.CARD_BENEFITS_COLLECTION_ID
+            self.stdout.write(f"Using CARD_BENEFITS_COLLECTION_ID for documents without an issuer: {collection_id}")
+        elif not options['per_issuer']:
             raise CommandError(
                 "You must specify either --create-collection or --collection-id"
             )
 
-        # Upload documents
-        uploaded_count = 0
+        # Cards to tie the documents to
+        tagged_cards = []
+        if options['card_ids']:
+            tagged_cards = list(Card.objects.filter(id__in=options['card_ids']).select_related('issuer'))
+            if len(tagged_cards) != len(set(options['card_ids'])):
+                raise CommandError("One or more --card-id values do not match a card")
+        all_cards = list(Card.objects.select_related('issuer')) if options['match_cards'] else []
 
+        # Collect the files to upload as (path, document name)
         if options['pdf']:
-            # Upload single PDF
             pdf_path = options['pdf']
             if not os.path.exists(pdf_path):
                 raise CommandError(f"PDF file not found: {pdf_path}")
-
-            self.stdout.write(f"Uploading {pdf_path}...")
-            document = rag_service.upload_document(
-                collection_id=collection_id,
-                file_path=pdf_path,
-                document_name=options.get('document_name')
-            )
-            # Extract document ID from response (handle different response formats)
-            doc_id = getattr(document, 'document_id', None) or getattr(document, 'id', None)
-            if not doc_id and hasattr(document, 'file_metadata'):
-                doc_id = document.file_metadata.file_id
-            elif not doc_id:
-                doc_id = "uploaded successfully"
-
-            self.stdout.write(self.style.SUCCESS(
-                f"✅ Uploaded: {doc_id}"
-            ))
-            uploaded_count = 1
-
+            uploads = [(pdf_path, options.get('document_name'))]
         elif options['pdf_dir']:
-            # Upload all PDFs from directory
             pdf_dir = options['pdf_dir']
             if not os.path.isdir(pdf_dir):
                 raise CommandError(f"Directory not found: {pdf_dir}")
 
-            pdf_files = [f for f in os.listdir(pdf_dir) if f.lower().endswith('.pdf')]
+            pdf_files = sorted(f for f in os.listdir(pdf_dir) if f.lower().endswith('.pdf'))
             if not pdf_files:
                 raise CommandError(f"No PDF files found in {pdf_dir}")
 
             self.stdout.write(f"Found {len(pdf_files)} PDF files in {pdf_dir}")
+            uploads = [(os.path.join(pdf_dir, pdf_file), None) for pdf_file in pdf_files]
+        else:
+            raise CommandError(
+                "You must specify either --pdf or --pdf-dir"
+            )
 
-            for pdf_file in pdf_files:
-                pdf_path = os.path.join(pdf_dir, pdf_file)
-                self.stdout.write(f"Uploading {pdf_file}...")
+        manifest_path = options['manifest'] or os.path.join(
+            options['pdf_dir'] or os.path.dirname(os.path.abspath(options['pdf'])), MANIFEST_FILENAME
+        )
+        manifest = UploadManifest(manifest_path)
 
-                try:
-                    document = rag_service.upload_document(
-                        collection_id=collection_id,
-                        file_path=pdf_path
-                    )
-                    # Extract document ID from response (handle different response formats)
-                    doc_id = getattr(document, 'document_id', None)
-                    if not doc_id and hasattr(document, 'file_metadata'):
-                        doc_id = document.file_metadata.file_id
-                    elif not doc_id:
-                        doc_id = "uploaded successfully"
+        # Decide each file's cards and collection up front (database work stays in this thread)
+        jobs = []
+        for pdf_path, document_name in uploads:
+            pdf_file = os.path.basename(pdf_path)
+            cards = list(tagged_cards)
+            if options['match_cards']:
+                cards += [card for card in match_cards(pdf_file, all_cards) if card not in cards]
 
-                    self.stdout.write(self.style.SUCCESS(
-                        f"  ✅ {pdf_file}: {doc_id}"
+            target_collection_id = collection_id
+            issuers = {card.issuer for card in cards}
+            if options['per_issuer'] and len(issuers) == 1:
+                target_collection_id = get_issuer_collection_id(rag_service, issuers.pop(), options['model'])
+            if not target_collection_id:
+                self.stdout.write(self.style.WARNING(
+                    f"  ⚠️  Skipped {pdf_file}: no single issuer and no --collection-id"
+                ))
+                continue
+            jobs.append((pdf_path, document_name, cards, target_collection_id))
+
+        # The manifest only records uploads; drop entries whose documents were deleted since
+        if not options['force']:
+            for target_collection_id in sorted({job[3] for job in jobs}):
+                recorded = manifest.file_ids(target_collection_id)
+                if not recorded:
+                    continue
+                present = {
+                    document_file_id(document)
+                    for document in rag_service.list_documents(target_collection_id)
+                }
+                missing = recorded - present
+                if missing:
+                    manifest.forget(target_collection_id, missing)
+                    for file_id in missing:
+                        forget_card_documents(target_collection_id, file_id)
+                    self.stdout.write(self.style.WARNING(
+                        f"⚠️  {len(missing)} manifest document(s) are no longer in {target_collection_id}; "
+                        f"uploading them again"
                     ))
-                    uploaded_count += 1
+
+        # Upload extracted text without the boilerplate shared across the documents
+        condensed = {}
+        if options['condense']:
+            self.stdout.write(f"Extracting and condensing {len(jobs)} PDF file(s)...")
+            condensed, stats = condense_pdfs([job[0] for job in jobs], options['workers'])
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ Condensed {stats['original_chars']:,} to {stats['condensed_chars']:,} characters "
+                f"({stats['removed_paragraphs']} boilerplate or repeated paragraph(s) removed)"
+            ))
+
+        # Upload documents
+        uploaded_count = 0
+        skipped_count = 0
+        failed_count = 0
+        touched_collections = set()
+
+        workers = max(1, options['workers'])
+        self.stdout.write(f"Uploading {len(jobs)} file(s) with {workers} worker(s) (manifest: {manifest_path})")
+        started = time.monotonic()
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            futures = {
+                executor.submit(
+                    self.upload, manifest, pdf_path, document_name, target_collection_id, options['force'],
+                    condensed.get(pdf_path)
+                ):
+                    (pdf_path, document_name, cards, target_collection_id)
+                for pdf_path, document_name, cards, target_collection_id in jobs
+            }
+            for future in as_completed(futures):
+                pdf_path, document_name, cards, target_collection_id = futures[future]
+                pdf_file = os.path.basename(pdf_path)
+                try:
+                    uploaded, doc_id, name, replaced, failed = future.result()
                 except Exception as e:
+                    failed_count += 1
                     self.stdout.write(self.style.ERROR(
                         f"  ❌ Failed to upload {pdf_file}: {str(e)}"
                     ))
+                    continue
 
-        else:
-            raise CommandError(
-                "You must specify either --pdf or --pdf-dir"
-            )
+                if uploaded:
+                    touched_collections.add(target_collection_id)
+                    uploaded_count += 1
+                    self.stdout.write(self.style.SUCCESS(
+                        f"  ✅ {pdf_file}: {doc_id or 'uploaded successfully'}"
+                    ))
+                else:
+                    skipped_count += 1
+                    self.stdout.write(f"  ⏭️  {pdf_file}: unchanged ({doc_id})")
+
+                # Card records of replaced versions move to the new document
+                for old_file_id in replaced:
+                    cards += [
+                        card for card in move_card_documents(target_collection_id, old_file_id, doc_id)
+                        if card not in cards
+                    ]
+                    self.stdout.write(f"     Replaced earlier version {old_file_id}")
+                for old_file_id in failed:
+                    self.stdout.write(self.style.WARNING(
+                        f"     ⚠️  Could not delete earlier version {old_file_id}; "
+                        f"remove it with sync_card_pdfs or clear_rag_documents"
+                    ))
+
+                if cards and doc_id:
+                    record_card_documents(cards, target_collection_id, doc_id, name)
+                    card_names = ", ".join(card.name for card in cards)
+                    self.stdout.write(f"     Tied to {card_names} in collection {target_collection_id}")
+                elif options['match_cards'] and not cards:
+                    self.stdout.write(self.style.WARNING(f"     ⚠️  No card name found in {pdf_file}"))
+        except KeyboardInterrupt:
+            # Finished uploads are already in the manifest, so the next run resumes from here
+            executor.shutdown(wait=True, cancel_futures=True)
+            for touched_collection_id in touched_collections:
+                bump_collection_version(touched_collection_id)
+            raise CommandError(f"Interrupted after {uploaded_count} upload(s); run the command again to resume")
+        finally:
+            executor.shutdown(wait=True)
+        elapsed = time.monotonic() - started
+
+        # Invalidate analyses and searches cached from the old documents
+        for touched_collection_id in touched_collections:
+            bump_collection_version(touched_collection_id)
 
         # Summary
         self.stdout.write("\n" + "="*50)
         self.stdout.write(self.style.SUCCESS(
-            f"✅ Upload complete! {uploaded_count} document(s) uploaded"
+            f"✅ Upload complete! {uploaded_count} document(s) uploaded in {elapsed:.1f}s "
+            f"({skipped_count} unchanged, {failed_count} failed)"
         ))
-        self.stdout.write(f"Collection ID: {collection_id}")
-        self.stdout.write("\nNext steps:")
-        self.stdout.write("1. Add this to your .env file:")
-        self.stdout.write(f"   CARD_BENEFITS_COLLECTION_ID={collection_id}")
-        self.stdout.write("2. Update your settings.py to load this environment variable")
-        self.stdout.write("3. Use the collection ID in your views for RAG queries")
+        if collection_id:
+            self.stdout.write(f"Collection ID: {collection_id}")
+        for touched_collection_id in sorted(touched_collections - {collection_id}):
+            self.stdout.write(f"Issuer collection ID: {touched_collection_id}")
+        if collection_id and collection_id != getattr(settings, 'CARD_BENEFITS_COLLECTION_ID', None):
+            self.stdout.write("\nNext steps:")
+            self.stdout.write("1. Add this to your .env file:")
+            self.stdout.write(f"   CARD_BENEFITS_COLLECTION_ID={collection_id}")
+            self.stdout.write("2. Update your settings.py to load this environment variable")
+            self.stdout.write("3. Use the collection ID in your views for RAG queries")
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:41
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendation', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RagCollection',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('collection_id', models.CharField(max_length=100, unique=True)),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:50
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendation', '0002_ragcollection'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CardDetailsDocument',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('content', models.JSONField()),
+                ('reward_data_version', models.CharField(max_length=64)),
+                ('collection_version', models.PositiveIntegerField(blank=True, null=True)),
+                ('model', models.CharField(max_length=50)),
+                ('etag', models.CharField(max_length=64)),
+                ('generated_at', models.DateTimeField(auto_now=True)),
+                ('card', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='details_document', to='recommendation.card')),
+            ],
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:56
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendation', '0003_carddetailsdocument'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ragcollection',
+            name='issuer',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='rag_collection', to='recommendation.issuer'),
+        ),
+        migrations.AlterField(
+            model_name='carddetailsdocument',
+            name='collection_version',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.CreateModel(
+            name='CardDocument',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('collection_id', models.CharField(max_length=100)),
+                ('file_id', models.CharField(max_length=100)),
+                ('name', models.CharField(max_length=255)),
+                ('uploaded_at', models.DateTimeField(auto_now_add=True)),
+                ('card', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='documents', to='recommendation.card')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['collection_id', 'file_id'], name='recommendat_collect_81b737_idx')],
+                'unique_together': {('card', 'collection_id', 'file_id')},
+            },
+        ),
+    ]
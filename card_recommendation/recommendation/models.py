@@ -72,3 +72,58 @@ class RewardRate(models.Model):
             return "Rate: " + " / ".join(rewards)
         return "No rewards specified"
 
+
+class RagCollection(models.Model):
+    """xAI collection used for RAG, with a version bumped whenever its documents change"""
+    id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
+    collection_id = models.CharField(max_length=100, unique=True)
+    # Set for per-issuer collections created by upload_card_pdfs --per-issuer
+    issuer = models.OneToOneField(Issuer, on_delete=models.SET_NULL, null=True, blank=True, related_name='rag_collection')
+    version = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.collection_id} (v{self.version})"
+
+
+class CardDetailsDocument(models.Model):
+    """Generated card details write-up, tagged with the data it was generated from"""
+    id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
+    card = models.OneToOneField(Card, on_delete=models.CASCADE, related_name='details_document')
+    content = models.JSONField()
+    reward_data_version = models.CharField(max_length=64)
+    # Version tag of the documents searched for the card (see rag_scope.py)
+    collection_version = models.CharField(max_length=64, null=True, blank=True)
+    model = models.CharField(max_length=50)
+    etag = models.CharField(max_length=64)
+    generated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Details for {self.card}"
+
+
+class CardDocument(models.Model):
+    """Uploaded benefit document that describes a card"""
+    id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
+    card = models.ForeignKey(Card, on_delete=models.CASCADE, related_name='documents')
+    collection_id = models.CharField(max_length=100)
+    file_id = models.CharField(max_length=100)
+    name = models.CharField(max_length=255)
+    uploaded_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('card', 'collection_id', 'file_id')
+        indexes = [models.Index(fields=['collection_id', 'file_id'])]
+
+    def __str__(self):
+        return f"{self.name} ({self.card})"
+
+
+class CacheVersion(models.Model):
+    """Version token of derived data kept in memory or per-process caches (see cache_versions.py)"""
+    key = models.CharField(max_length=255, primary_key=True)
+    version = models.CharField(max_length=32)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.key} ({self.version})"
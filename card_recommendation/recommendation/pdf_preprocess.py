@@ -0,0 +1,269 @@
+"""
+Local text extraction and boilerplate removal for card benefit PDFs.
+
+Issuer PDFs repeat the same legal text (arbitration clauses, privacy notices,
+page footers) across documents. Uploaded as-is, all of it is embedded and
+then comes back from searches as noise. With --condense, upload_card_pdfs and
+sync_card_pdfs upload plain text instead:
+1. Text is extracted locally with PyPDF2 and cached on disk by the PDF's
+   SHA-256 (PDF_TEXT_CACHE_DIR), so unchanged files are only parsed once.
+2. The text is split into paragraphs. Near-duplicate paragraphs are found
+   with word shingles, MinHash signatures and LSH banding.
+3. Paragraphs of at least BOILERPLATE_MIN_WORDS words that appear (nearly)
+   verbatim in at least BOILERPLATE_MIN_DOCUMENTS documents are dropped, as are exact repeats
+   within a document (page headers and footers).
+
+Boilerplate is decided over the whole set of documents being uploaded, so
+upload a directory at a time for it to be found.
+"""
+import hashlib
+import os
+import random
+import re
+import zlib
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from PyPDF2 import PdfReader
+
+from .upload_manifest import file_sha256
+
+# A paragraph in this many documents is boilerplate
+BOILERPLATE_MIN_DOCUMENTS = 3
+# Shorter paragraphs are never boilerplate: "No foreign transaction fees." is in
+# many documents but is a benefit, not legal filler
+BOILERPLATE_MIN_WORDS = 12
+# Estimated Jaccard similarity at which two paragraphs count as the same
+BOILERPLATE_SIMILARITY = 0.7
+
+# Words per shingle
+SHINGLE_SIZE = 5
+# MinHash signature length = LSH bands x rows per band
+LSH_BANDS = 8
+LSH_ROWS = 4
+NUM_PERMUTATIONS = LSH_BANDS * LSH_ROWS
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+# Fixed seed: signatures must be comparable across runs
+_rng = random.Random(20240917)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERMUTATIONS)
+]
+
+_WORD_RE = re.compile(r'\w+')
+_SENTENCE_END_RE = re.compile(r'[.!?:;]["\')\]]*$')
+
+
+def get_text_cache_dir():
+    """Directory holding extracted PDF text, named by SHA-256"""
+    return getattr(settings, 'PDF_TEXT_CACHE_DIR', os.path.join(settings.BASE_DIR, '.pdf_text_cache'))
+
+
+def extract_pdf_text(pdf_path, sha256):
+    """
+    Extract a PDF's text, reusing the cached copy for the same content.
+
+    Args:
+        pdf_path: Path to the PDF file
+        sha256: The file's SHA-256 (cache key)
+
+    Returns:
+        str: Page texts separated by blank lines
+    """
+    cache_dir = get_text_cache_dir()
+    cache_path = os.path.join(cache_dir, f"{sha256}.txt")
+    if os.path.exists(cache_path):
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    reader = PdfReader(pdf_path)
+    text = "\n\n".join((page.extract_text() or "").strip() for page in reader.pages)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(temp_path, cache_path)
+    return text
+
+
+def split_paragraphs(text):
+    """
+    Split extracted text into paragraphs.
+
+    PDF text has unreliable line breaks (PyPDF2 puts some documents one word
+    per line, separated by blank lines), so blank lines are ignored and a
+    line that ends a sentence ends its paragraph.
+
+    Returns:
+        list: Paragraphs with whitespace collapsed
+    """
+    paragraphs = []
+    current = []
+    for line in text.splitlines():
+        line = " ".join(line.split())
+        if not line:
+            continue
+        current.append(line)
+        if _SENTENCE_END_RE.search(line):
+            paragraphs.append(" ".join(current))
+            current = []
+    if current:
+        paragraphs.append(" ".join(current))
+    return paragraphs
+
+
+def _normalize(paragraph):
+    return " ".join(_WORD_RE.findall(paragraph.lower()))
+
+
+def minhash_signature(normalized):
+    """
+    MinHash signature of a normalized paragraph's word shingles.
+
+    Args:
+        normalized: Lowercase words separated by single spaces
+
+    Returns:
+        tuple: NUM_PERMUTATIONS ints
+    """
+    words = normalized.split()
+    if len(words) <= SHINGLE_SIZE:
+        shingles = {normalized}
+    else:
+        shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+    hashes = [zlib.crc32(shingle.encode('utf-8')) for shingle in shingles]
+    return tuple(
+        min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+        for a, b in _PERMUTATIONS
+    )
+
+
+def _similarity(signature_a, signature_b):
+    return sum(1 for x, y in zip(signature_a, signature_b) if x == y) / NUM_PERMUTATIONS
+
+
+def find_boilerplate(documents, min_documents=BOILERPLATE_MIN_DOCUMENTS, similarity=BOILERPLATE_SIMILARITY):
+    """
+    Find paragraphs repeated (nearly) verbatim across documents.
+
+    Args:
+        documents: Dict of document name -> list of paragraphs
+        min_documents: Number of documents a paragraph must appear in to be boilerplate
+        similarity: Estimated Jaccard similarity at which paragraphs are near-duplicates
+
+    Returns:
+        set: Normalized forms of the boilerplate paragraphs
+    """
+    # Exact repeats share one entry, so only distinct paragraphs are hashed
+    paragraph_documents = {}
+    for name, paragraphs in documents.items():
+        for paragraph in paragraphs:
+            normalized = _normalize(paragraph)
+            if len(normalized.split()) >= BOILERPLATE_MIN_WORDS:
+                paragraph_documents.setdefault(normalized, set()).add(name)
+
+    keys = list(paragraph_documents)
+    signatures = [minhash_signature(key) for key in keys]
+
+    # Union-find over candidate pairs that share an LSH band
+    parent = list(range(len(keys)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for band in range(LSH_BANDS):
+        buckets = {}
+        for index, signature in enumerate(signatures):
+            band_key = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+            buckets.setdefault(band_key, []).append(index)
+        for members in buckets.values():
+            first = members[0]
+            for other in members[1:]:
+                root_a, root_b = find(first), find(other)
+                if root_a != root_b and _similarity(signatures[first], signatures[other]) >= similarity:
+                    parent[root_b] = root_a
+
+    cluster_documents = {}
+    for index, key in enumerate(keys):
+        cluster_documents.setdefault(find(index), set()).update(paragraph_documents[key])
+
+    return {
+        key for index, key in enumerate(keys)
+        if len(cluster_documents[find(index)]) >= min_documents
+    }
+
+
+def condense_documents(texts, min_documents=BOILERPLATE_MIN_DOCUMENTS, similarity=BOILERPLATE_SIMILARITY):
+    """
+    Drop boilerplate and repeated paragraphs from a set of documents.
+
+    Args:
+        texts: Dict of document name -> extracted text
+        min_documents: Number of documents a paragraph must appear in to be boilerplate
+        similarity: Estimated Jaccard similarity at which paragraphs are near-duplicates
+
+    Returns:
+        tuple: (dict of document name -> condensed text,
+                dict with original_chars, condensed_chars and removed_paragraphs)
+    """
+    documents = {name: split_paragraphs(text) for name, text in texts.items()}
+    boilerplate = find_boilerplate(documents, min_documents, similarity)
+
+    condensed = {}
+    removed = 0
+    for name, paragraphs in documents.items():
+        seen = set()
+        kept = []
+        for paragraph in paragraphs:
+            normalized = _normalize(paragraph)
+            if not normalized:
+                continue
+            if normalized in boilerplate or normalized in seen:
+                removed += 1
+                continue
+            seen.add(normalized)
+            kept.append(paragraph)
+        condensed[name] = "\n\n".join(kept)
+
+    stats = {
+        'original_chars': sum(len(text) for text in texts.values()),
+        'condensed_chars': sum(len(text) for text in condensed.values()),
+        'removed_paragraphs': removed,
+    }
+    return condensed, stats
+
+
+def condensed_document_name(pdf_name):
+    """Name of the text document uploaded in place of a PDF ("guide.pdf" -> "guide.txt")"""
+    return f"{os.path.splitext(pdf_name)[0]}.txt"
+
+
+def text_sha256(text):
+    """SHA-256 of a condensed document, as stored in its fields"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def condense_pdfs(pdf_paths, workers=4):
+    """
+    Extract and condense a set of PDFs.
+
+    Args:
+        pdf_paths: Paths of the PDFs uploaded together
+        workers: Files hashed and extracted concurrently
+
+    Returns:
+        tuple: (dict of path -> condensed text, stats from condense_documents)
+    """
+    def extract(pdf_path):
+        return extract_pdf_text(pdf_path, file_sha256(pdf_path))
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        texts = dict(zip(pdf_paths, executor.map(extract, pdf_paths)))
+    return condense_documents(texts)
@@ -0,0 +1,153 @@
+"""
+Pre-retrieval of RAG context for Grok prompts.
+
+In tool mode (RAG_MODE=tool, the default) the streaming views hand Grok the
+collections_search tool, so the model makes at least one tool round trip
+before it writes anything. In prefetch mode (RAG_MODE=prefetch) the views
+search the collection themselves and put the excerpts straight into the
+prompt, so the model answers in one pass without tools.
+
+Searches run on a process-wide thread pool, one per card, as soon as the
+wallet's card names are known. They overlap with the rest of the view's
+database work. Results are collected within RAG_PREFETCH_BUDGET seconds of
+the start. Searches that miss the budget are left out of the prompt, and the
+response is then not cached (see RagPrefetch.collect).
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .rag_service import RAGService
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def rag_prefetch_enabled():
+    """Whether RAG is configured and set to pre-retrieval mode"""
+    return (
+        bool(getattr(settings, 'CARD_BENEFITS_COLLECTION_ID', None))
+        and getattr(settings, 'RAG_MODE', 'tool') == 'prefetch'
+    )
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'RAG_PREFETCH_WORKERS', 8),
+                    thread_name_prefix='rag-prefetch',
+                )
+    return _executor
+
+
+def card_search_query(card, category=None):
+    """
+    Build the collection search query for a card.
+
+    Args:
+        card: Dict with the card's 'name' and 'issuer'
+        category: Optional spending category to focus the search on
+
+    Returns:
+        str: Query such as "Chase Sapphire Preferred dining benefits"
+    """
+    name = card['name']
+    # Most card names already start with the issuer ("Chase Sapphire Preferred")
+    if card['issuer'].lower() not in name.lower():
+        name = f"{card['issuer']} {name}"
+    if category:
+        return f"{name} {category} rewards benefits"
+    return f"{name} benefits rewards fees"
+
+
+def _search_context(query, collection_ids, file_ids, top_k):
+    # Pool threads live outside the request cycle, so manage their DB connection here
+    close_old_connections()
+    try:
+        return RAGService().get_collection_context(query, collection_ids, top_k=top_k, file_ids=file_ids)
+    finally:
+        close_old_connections()
+
+
+class RagPrefetch:
+    """Collection searches running in the background for one request"""
+
+    def __init__(self, searches, top_k):
+        """
+        Args:
+            searches: Dict of label (e.g., card name) -> (query, collection_ids, file_ids),
+                where file_ids limits matches to those documents (None keeps all)
+            top_k: Number of chunks to retrieve per query
+        """
+        self.started = time.monotonic()
+        executor = _get_executor()
+        self.futures = {
+            label: executor.submit(_search_context, query, collection_ids, file_ids, top_k)
+            for label, (query, collection_ids, file_ids) in searches.items()
+        }
+
+    def collect(self, budget=None):
+        """
+        Wait for the searches until the time budget (counted from the start) runs out.
+
+        Args:
+            budget: Seconds allowed in total (default: RAG_PREFETCH_BUDGET)
+
+        Returns:
+            tuple: (formatted context string, True if every search finished in time)
+        """
+        if budget is None:
+            budget = getattr(settings, 'RAG_PREFETCH_BUDGET', 2.0)
+        deadline = self.started + budget
+
+        sections = []
+        complete = True
+        for label, future in self.futures.items():
+            try:
+                text = future.result(timeout=max(0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                print(f"⏱️  RAG prefetch for {label} missed the {budget}s budget")
+                complete = False
+                continue
+            except Exception as e:
+                print(f"⚠️  RAG prefetch for {label} failed: {str(e)}")
+                complete = False
+                continue
+            if text:
+                sections.append(f"=== {label} ===\n{text}")
+
+        elapsed = time.monotonic() - self.started
+        print(f"📚 RAG prefetch: {len(sections)}/{len(self.futures)} cards with context in {elapsed:.2f}s")
+        return "\n\n".join(sections), complete
+
+
+def start_card_prefetch(cards, category=None, scope=None):
+    """
+    Start collection searches for a set of cards.
+
+    Args:
+        cards: Dicts with 'id', 'name' and 'issuer' (duplicates are searched once)
+        category: Optional spending category to focus the searches on
+        scope: Optional RagScope limiting each card's search to its own documents
+
+    Returns:
+        RagPrefetch: Handle to collect the context from, or None if prefetch mode is off
+    """
+    if not rag_prefetch_enabled():
+        return None
+
+    searches = {}
+    for card in cards:
+        if scope is not None:
+            collection_ids = scope.collections_for_card(card['id'])
+            file_ids = scope.file_ids_for_card(card['id'])
+        else:
+            collection_ids, file_ids = [settings.CARD_BENEFITS_COLLECTION_ID], None
+        searches[card['name']] = (card_search_query(card, category), collection_ids, file_ids)
+    return RagPrefetch(searches, getattr(settings, 'RAG_PREFETCH_TOP_K', 3))
@@ -0,0 +1,113 @@
+"""
+Which RAG documents and collections to search for a set of cards.
+
+upload_card_pdfs records a CardDocument for each uploaded PDF it can tie to a
+card, optionally in a collection per issuer. Searches for a wallet then only
+cover:
+- the collections holding the wallet cards' documents, plus the default
+  CARD_BENEFITS_COLLECTION_ID for cards that have no recorded documents
+- within those collections, only the chunks from the card's own documents
+  when a search is made for a single card (prefetch mode)
+
+The Grok collections_search tool can only be scoped to collections, so tool
+mode gets the collection part only.
+"""
+import hashlib
+
+from django.conf import settings
+
+from .models import CardDocument, RagCollection
+
+# collections_search accepts at most this many collections
+MAX_TOOL_COLLECTIONS = 10
+
+
+class RagScope:
+    """Collections and documents to search for a set of cards"""
+
+    def __init__(self, default_collection_id, documents):
+        """
+        Args:
+            default_collection_id: CARD_BENEFITS_COLLECTION_ID (may be None)
+            documents: Iterable of (card_id, collection_id, file_id) for the cards
+        """
+        self.default_collection_id = default_collection_id
+        self.collections_by_card = {}
+        self.file_ids_by_card = {}
+        for card_id, collection_id, file_id in documents:
+            card_id = str(card_id)
+            self.collections_by_card.setdefault(card_id, set()).add(collection_id)
+            self.file_ids_by_card.setdefault(card_id, set()).add(file_id)
+
+    def collections_for_card(self, card_id):
+        """
+        Collections to search for one card.
+
+        Returns:
+            list: The collections holding the card's documents, or the default collection
+        """
+        collections = self.collections_by_card.get(str(card_id))
+        if collections:
+            return sorted(collections)
+        return [self.default_collection_id] if self.default_collection_id else []
+
+    def file_ids_for_card(self, card_id):
+        """The card's own documents, or None to keep every match in its collections"""
+        return self.file_ids_by_card.get(str(card_id))
+
+    def collection_ids(self, card_ids):
+        """
+        Collections to search for several cards together.
+
+        Args:
+            card_ids: Card UUIDs
+
+        Returns:
+            list: Sorted collection IDs (empty if RAG has nothing to search)
+        """
+        collections = set()
+        for card_id in card_ids:
+            collections.update(self.collections_for_card(card_id))
+        return sorted(collections)
+
+    def version_tag(self, card_ids):
+        """
+        Identify the documents a response for these cards was grounded in.
+
+        Changes whenever a searched collection's version changes or documents
+        are tagged to or untagged from the cards. Costs one query.
+
+        Args:
+            card_ids: Card UUIDs
+
+        Returns:
+            str: Hex digest, or None if there is nothing to search
+        """
+        collection_ids = self.collection_ids(card_ids)
+        if not collection_ids:
+            return None
+        versions = dict(
+            RagCollection.objects.filter(collection_id__in=collection_ids).values_list('collection_id', 'version')
+        )
+        parts = [f"{collection_id}:{versions.get(collection_id, 1)}" for collection_id in collection_ids]
+        for card_id in sorted(str(card_id) for card_id in card_ids):
+            file_ids = self.file_ids_for_card(card_id)
+            if file_ids:
+                parts.append(f"{card_id}:{','.join(sorted(file_ids))}")
+        return hashlib.sha256("|".join(parts).encode('utf-8')).hexdigest()[:32]
+
+
+def get_rag_scope(card_ids):
+    """
+    Load the RAG scope for a set of cards in a single query.
+
+    Args:
+        card_ids: Card UUIDs (e.g., the user's wallet)
+
+    Returns:
+        RagScope
+    """
+    documents = CardDocument.objects.filter(card_id__in=list(card_ids)).values_list(
+        'card_id', 'collection_id', 'file_id'
+    )
+    return RagScope(getattr(settings, 'CARD_BENEFITS_COLLECTION_ID', None), documents)
@@ -1,26 +1,131 @@
 """
 RAG service for retrieving credit card benefit information from xAI collections.
 """
+import mmap
 import os
-from xai_sdk import Client
+import random
+import time
+
+import grpc
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from .local_rag import get_local_index
+from .models import RagCollection
+from .search_cache import search_cache_key, get_cached_search, set_cached_search, forget_collection_version
+from .xai_clients import get_xai_client
+
+
+def get_collection_version(collection_id):
+    """
+    Get the current document version of a collection.
+
+    Args:
+        collection_id: xAI collection ID (or None when RAG is disabled)
+
+    Returns:
+        int: The collection's version, or None if no collection is configured
+    """
+    if not collection_id:
+        return None
+
+    collection, _ = RagCollection.objects.get_or_create(collection_id=collection_id)
+    return collection.version
+
+
+def bump_collection_version(collection_id):
+    """
+    Mark a collection's documents as changed, invalidating anything cached from it.
+
+    Args:
+        collection_id: xAI collection ID
+    """
+    updated = RagCollection.objects.filter(collection_id=collection_id).update(
+        version=F('version') + 1,
+        updated_at=timezone.now(),
+    )
+    if not updated:
+        RagCollection.objects.get_or_create(collection_id=collection_id, defaults={'version': 2})
+    forget_collection_version(collection_id)
+
+
+def document_file_id(document):
+    """
+    Get the file ID from an upload_document response.
+
+    Args:
+        document: Response from RAGService.upload_document
+
+    Returns:
+        str: The document's file ID, or None if the response has none
+    """
+    # Handle different response formats (file_metadata in current SDKs)
+    doc_id = getattr(document, 'document_id', None) or getattr(document, 'id', None)
+    if not doc_id and hasattr(document, 'file_metadata'):
+        doc_id = document.file_metadata.file_id
+    return doc_id or None
+
+
+# gRPC status codes worth retrying (the request may succeed if sent again)
+TRANSIENT_STATUS_CODES = {
+    grpc.StatusCode.UNAVAILABLE,
+    grpc.StatusCode.DEADLINE_EXCEEDED,
+    grpc.StatusCode.RESOURCE_EXHAUSTED,
+    grpc.StatusCode.ABORTED,
+}
+
+
+def call_with_retries(func, *args, attempts=4, base_delay=0.5, **kwargs):
+    """
+    Call an xAI API function, retrying transient gRPC errors with exponential backoff.
+
+    Args:
+        func: Function to call
+        attempts: Total attempts before giving up
+        base_delay: Delay before the first retry in seconds (doubles each retry, with jitter)
+
+    Returns:
+        The function's result
+
+    Raises:
+        The last error if every attempt fails, or any non-transient error immediately
+    """
+    for attempt in range(attempts):
+        try:
+            return func(*args, **kwargs)
+        except grpc.RpcError as e:
+            if attempt == attempts - 1 or e.code() not in TRANSIENT_STATUS_CODES:
+                raise
+            time.sleep(base_delay * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+
+# How many more results to request when matches are filtered to specific documents
+FILE_FILTER_OVERFETCH = 4
 
 
 class RAGService:
     """Service for interacting with xAI collections for RAG"""
 
-    def __init__(self):
-        """Initialize xAI client"""
-        api_key = os.environ.get('XAI_API_KEY')
-        if not api_key:
-            raise ValueError('XAI_API_KEY environment variable not set')
+    def __init__(self, backend=None):
+        """
+        Use the process-wide pooled xAI client (created on first use, so the local backend needs no API key).
 
-        # Use XAI_MANAGEMENT_API_KEY if available, otherwise use XAI_API_KEY for both
-        management_api_key = os.environ.get('XAI_MANAGEMENT_API_KEY', api_key)
+        Args:
+            backend: "remote" or "local" search backend (default: RAG_BACKEND)
+        """
+        self.backend = backend or getattr(settings, 'RAG_BACKEND', 'remote')
+        self._client = None
 
-        self.client = Client(
-            api_key=api_key,
-            management_api_key=management_api_key
-        )
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_xai_client()
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
 
     def create_collection(self, name, model_name="grok-embedding-small"):
         """
@@ -40,14 +145,18 @@ class RAGService:
         print(f"✅ Created collection: {name} (ID: {collection.collection_id})")
         return collection
 
-    def upload_document(self, collection_id, file_path, document_name=None):
+    def upload_document(self, collection_id, file_path, document_name=None, fields=None):
         """
         Upload a document to a collection.
 
+        The file is memory-mapped rather than read into memory; the SDK sends
+        it in chunks sliced from the mapping.
+
         Args:
             collection_id: xAI collection ID
             file_path: Path to the PDF file
             document_name: Optional name for the document (defaults to filename)
+            fields: Optional metadata fields to store with the document (e.g., its sha256)
 
         Returns:
             Document object with document_id
@@ -55,19 +164,48 @@ class RAGService:
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"File not found: {file_path}")
 
+        name = document_name or os.path.basename(file_path)
+
         with open(file_path, 'rb') as f:
-            file_data = f.read()
+            if os.fstat(f.fileno()).st_size == 0:
+                # Empty files can't be memory-mapped
+                file_data = b''
+            else:
+                file_data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                document = self.client.collections.upload_document(
+                    collection_id,
+                    name=name,
+                    data=file_data,
+                    fields=fields,
+                )
+            finally:
+                if isinstance(file_data, mmap.mmap):
+                    file_data.close()
+        doc_id = document_file_id(document)
+        print(f"✅ Uploaded document: {name} (ID: {doc_id}) to collection {collection_id}")
+        return document
 
-        name = document_name or os.path.basename(file_path)
+    def upload_text(self, collection_id, name, text, fields=None):
+        """
+        Upload extracted text as a document (e.g., a condensed PDF, see pdf_preprocess.py).
+
+        Args:
+            collection_id: xAI collection ID
+            name: Document name (e.g., "guide.txt")
+            text: Document text
+            fields: Optional metadata fields to store with the document
 
+        Returns:
+            Document object with document_id
+        """
         document = self.client.collections.upload_document(
             collection_id,
             name=name,
-            data=file_data,
+            data=text.encode('utf-8'),
+            fields=fields,
         )
-        # Handle both response formats - some return document_id directly, others in an object
-        doc_id = getattr(document, 'document_id', None) or getattr(document, 'id', str(document))
-        print(f"✅ Uploaded document: {name} (ID: {doc_id}) to collection {collection_id}")
+        print(f"✅ Uploaded document: {name} (ID: {document_file_id(document)}) to collection {collection_id}")
         return document
 
     def search(self, query, collection_ids, retrieval_mode="hybrid", top_k=5):
@@ -77,30 +215,52 @@ class RAGService:
         Args:
             query: Search query
             collection_ids: List of collection IDs to search
-            retrieval_mode: "hybrid", "vector", or "keyword" (default: hybrid)
+            retrieval_mode: "hybrid", "semantic", or "keyword" (default: hybrid)
             top_k: Number of results to return
 
         Returns:
             Search results with relevant document chunks
+
+        Results are cached until the collections change (see search_cache.py).
+        With RAG_BACKEND=local they come from the local index instead (see local_rag.py).
         """
-        # Try with top_k, if it fails try without it
+        if self.backend == 'local':
+            return get_local_index().search(query, collection_ids, retrieval_mode, top_k)
+
+        try:
+            return self.search_remote(query, collection_ids, retrieval_mode, top_k)
+        except Exception as e:
+            if not getattr(settings, 'RAG_LOCAL_FALLBACK', False):
+                raise
+            print(f"⚠️  Collection search failed ({str(e)}), using the local RAG index")
+            return get_local_index().search(query, collection_ids, retrieval_mode, top_k)
+
+    def search_remote(self, query, collection_ids, retrieval_mode="hybrid", top_k=5):
+        """Search the xAI collections, caching the results (see search())"""
+        cache_key = search_cache_key(query, collection_ids, retrieval_mode, top_k)
+        results = get_cached_search(cache_key)
+        if results is not None:
+            return results
+
+        # Try with a result limit, if the SDK doesn't support it try without it
         try:
             results = self.client.collections.search(
                 query=query,
                 collection_ids=collection_ids,
                 retrieval_mode=retrieval_mode,
-                top_k=top_k,
+                limit=top_k,
             )
         except TypeError:
-            # Fallback without top_k parameter
+            # Fallback without the limit parameter
             results = self.client.collections.search(
                 query=query,
                 collection_ids=collection_ids,
                 retrieval_mode=retrieval_mode,
             )
+        set_cached_search(cache_key, results)
         return results
 
-    def get_collection_context(self, query, collection_ids, top_k=5):
+    def get_collection_context(self, query, collection_ids, top_k=5, file_ids=None):
         """
         Get formatted context from collection search results.
 
@@ -108,19 +268,26 @@ class RAGService:
             query: Search query
             collection_ids: List of collection IDs to search
             top_k: Number of results to return
+            file_ids: Optional document IDs to keep matches from (e.g., one card's
+                documents); more results are requested so enough remain after filtering
 
         Returns:
             Formatted string with relevant context from documents
         """
-        results = self.search(query, collection_ids, top_k=top_k)
+        limit = top_k * FILE_FILTER_OVERFETCH if file_ids else top_k
+        results = self.search(query, collection_ids, top_k=limit)
 
-        if not results or not hasattr(results, 'results') or not results.results:
+        # SearchResponse lists chunks in "matches" (older SDKs used "results")
+        matches = getattr(results, 'matches', None) or getattr(results, 'results', None)
+        if matches and file_ids:
+            matches = [match for match in matches if getattr(match, 'file_id', None) in file_ids]
+        if not matches:
             return ""
 
         context_parts = []
-        for idx, result in enumerate(results.results, 1):
+        for idx, result in enumerate(matches[:top_k], 1):
             # Extract text from result
-            text = result.text if hasattr(result, 'text') else str(result)
+            text = getattr(result, 'chunk_content', None) or getattr(result, 'text', None) or str(result)
             score = result.score if hasattr(result, 'score') else 'N/A'
 
             context_parts.append(f"[Source {idx}] (Relevance: {score})\n{text}")
@@ -136,9 +303,32 @@ class RAGService:
             collection_id: xAI collection ID
             document_id: Document ID to delete
         """
-        self.client.collections.delete_document(collection_id, document_id)
+        self.client.collections.remove_document(collection_id, document_id)
         print(f"✅ Deleted document {document_id} from collection {collection_id}")
 
+    def list_documents(self, collection_id, page_size=100):
+        """
+        List every document in a collection, following pagination.
+
+        Args:
+            collection_id: xAI collection ID
+            page_size: Documents requested per page
+
+        Yields:
+            DocumentMetadata for each document (file_metadata.file_id, file_metadata.name, fields)
+        """
+        pagination_token = None
+        while True:
+            page = self.client.collections.list_documents(
+                collection_id,
+                limit=page_size,
+                pagination_token=pagination_token,
+            )
+            yield from page.documents
+            pagination_token = page.pagination_token
+            if not pagination_token or not page.documents:
+                return
+
     def delete_collection(self, collection_id):
         """
         Delete an entire collection.
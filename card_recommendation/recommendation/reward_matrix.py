@@ -0,0 +1,159 @@
+"""
+In-memory card x merchant category reward matrix.
+
+The catalog (cards, merchant categories and reward rates) changes rarely but is
+read on every store the app shows, so it is loaded once per process and kept
+as plain dictionaries. Model signals (see signals.py) bump a version stored in
+the database whenever reward data changes (see cache_versions.py), which makes
+every process rebuild its copy within CACHE_VERSION_TTL seconds.
+"""
+import threading
+
+from .cache_versions import get_version, bump_version
+from .models import Card, MerchantCategory, RewardRate
+
+FALLBACK_CATEGORY_NAME = "other"
+REWARD_MATRIX_VERSION_KEY = "reward_matrix_version"
+
+_matrix = None
+_matrix_version = None
+_matrix_lock = threading.Lock()
+
+
+class RewardMatrix:
+    """Precomputed reward values for every card and merchant category"""
+
+    def __init__(self, cards, categories, rates):
+        """
+        Args:
+            cards: Dict of card_id -> {'name': ..., 'issuer': ...}
+            categories: Set of lowercased merchant category names
+            rates: Dict of card_id -> {lowercased category name -> reward entry}
+        """
+        self.cards = cards
+        self.categories = categories
+        self.rates = rates
+        self.fallbacks = {
+            card_id: card_rates.get(FALLBACK_CATEGORY_NAME)
+            for card_id, card_rates in rates.items()
+        }
+
+    @classmethod
+    def build(cls):
+        """
+        Load the catalog from the database in three queries.
+
+        Returns:
+            RewardMatrix: A matrix with the "other" fallback already resolved per card
+        """
+        cards = {
+            card.id: {'name': card.name, 'issuer': card.issuer.name, 'base_point_value': card.base_point_value}
+            for card in Card.objects.select_related('issuer')
+        }
+        categories = {name.lower() for name in MerchantCategory.objects.values_list('name', flat=True)}
+
+        rates = {card_id: {} for card_id in cards}
+        reward_rates = RewardRate.objects.select_related('reward_category__merchant_category')
+        for rate in reward_rates:
+            rc = rate.reward_category
+            card = cards.get(rc.card_id)
+            if card is None:
+                continue
+
+            base_point_value = float(card['base_point_value'] or 0)
+            points = rate.points or 0
+            cashback = float(rate.cashback_percentage or 0)
+
+            rates[rc.card_id][rc.merchant_category.name.lower()] = {
+                "value": cashback + points * base_point_value,
+                "reward_type": "cashback" if rate.cashback_percentage else "points",
+                "reward_amount": rate.cashback_percentage or rate.points,
+                "category": rc.merchant_category.name,
+            }
+
+        return cls(cards, categories, rates)
+
+    def lookup(self, card_id, category_names):
+        """
+        Find the reward entry a card earns for the given categories.
+
+        Args:
+            card_id: UUID of the card
+            category_names: Category names in order of preference
+
+        Returns:
+            dict: Reward entry for the first category the card has, the card's
+            "other" entry if none match, or None if the card earns nothing
+        """
+        card_rates = self.rates.get(card_id)
+        if card_rates is None:
+            return None
+
+        for name in category_names:
+            entry = card_rates.get(name.lower())
+            if entry:
+                return entry
+        return self.fallbacks.get(card_id)
+
+    def rank_cards(self, card_ids, category_names):
+        """
+        Rank cards from best to worst for the given categories.
+
+        Args:
+            card_ids: Card UUIDs (e.g., the cards in a user's wallet)
+            category_names: Category names in order of preference
+
+        Returns:
+            list: Recommendation dicts sorted by value, highest first
+        """
+        results = []
+        for card_id in card_ids:
+            entry = self.lookup(card_id, category_names)
+            if not entry:
+                continue
+
+            card = self.cards[card_id]
+            results.append({
+                "card_id": str(card_id),
+                "card_name": card['name'],
+                "issuer": card['issuer'],
+                **entry,
+            })
+
+        results.sort(key=lambda x: x["card_name"])
+        results.sort(key=lambda x: x["value"], reverse=True)
+        return results
+
+
+def get_reward_matrix():
+    """
+    Return the process-wide reward matrix, rebuilding it if reward data changed.
+
+    Returns:
+        RewardMatrix: The current matrix
+    """
+    global _matrix, _matrix_version
+
+    version = get_version(REWARD_MATRIX_VERSION_KEY)
+    matrix = _matrix
+    if matrix is not None and _matrix_version == version:
+        return matrix
+
+    with _matrix_lock:
+        if _matrix is None or _matrix_version != version:
+            _matrix = RewardMatrix.build()
+            _matrix_version = version
+            print(f"🧮 Built reward matrix: {len(_matrix.cards)} cards, {len(_matrix.categories)} categories")
+        return _matrix
+
+
+def invalidate_reward_matrix():
+    """
+    Drop this process's matrix and bump the shared version so other processes
+    rebuild theirs too. Note that queryset.update() and bulk_create() do not
+    send model signals, so call this directly after bulk catalog edits.
+    """
+    global _matrix
+
+    _matrix = None
+    bump_version(REWARD_MATRIX_VERSION_KEY)
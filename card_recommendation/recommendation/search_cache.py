@@ -0,0 +1,145 @@
+"""
+Result cache for RAGService.search.
+
+The same searches (e.g. "Chase Sapphire Preferred dining rewards benefits")
+reach the remote collection over and over. Responses are stored in the
+'rag_search' cache (see CACHES in settings.py, which sets the TTL and LRU
+size). The key covers the normalized query, collection IDs, retrieval mode
+and result limit, plus each collection's version. upload_card_pdfs and
+clear_rag_documents bump that version, so cached results from the old
+documents stop matching.
+
+Collection versions are read from the database at most every
+RAG_COLLECTION_VERSION_TTL seconds per process. Other processes therefore
+see a bump within that window. The bumping process sees it immediately.
+
+Hit/miss counters are per process; see get_search_cache_stats().
+"""
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import RagCollection
+
+SEARCH_CACHE_ALIAS = 'rag_search'
+
+_versions = {}
+_versions_lock = threading.Lock()
+
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def normalize_query(query):
+    """Lowercase and collapse whitespace so trivially different queries share a key"""
+    return " ".join(query.lower().split())
+
+
+def get_collection_versions(collection_ids):
+    """
+    Get the document versions of several collections.
+
+    Args:
+        collection_ids: xAI collection IDs
+
+    Returns:
+        dict: collection_id -> version (1 for collections without a RagCollection row)
+    """
+    now = time.monotonic()
+    ttl = getattr(settings, 'RAG_COLLECTION_VERSION_TTL', 30)
+    with _versions_lock:
+        known = {
+            collection_id: entry[0]
+            for collection_id, entry in _versions.items()
+            if collection_id in collection_ids and now - entry[1] < ttl
+        }
+
+    missing = [collection_id for collection_id in collection_ids if collection_id not in known]
+    if missing:
+        fetched = dict(
+            RagCollection.objects.filter(collection_id__in=missing).values_list('collection_id', 'version')
+        )
+        with _versions_lock:
+            for collection_id in missing:
+                version = fetched.get(collection_id, 1)
+                _versions[collection_id] = (version, now)
+                known[collection_id] = version
+    return known
+
+
+def search_cache_key(query, collection_ids, retrieval_mode, top_k):
+    """
+    Build the cache key for a search.
+
+    Args:
+        query: Search query
+        collection_ids: Collections being searched
+        retrieval_mode: Retrieval mode passed to the search
+        top_k: Number of results requested
+
+    Returns:
+        str: Cache key that changes when any searched collection changes
+    """
+    versions = get_collection_versions(list(collection_ids))
+    parts = {
+        'query': normalize_query(query),
+        'collections': sorted(f"{collection_id}:{version}" for collection_id, version in versions.items()),
+        'retrieval_mode': retrieval_mode,
+        'top_k': top_k,
+    }
+    digest = hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+    return f"rag_search:{digest}"
+
+
+def get_cached_search(key):
+    """
+    Look up cached search results and count the hit or miss.
+
+    Args:
+        key: Key from search_cache_key()
+
+    Returns:
+        The cached SearchResponse, or None on a miss
+    """
+    results = caches[SEARCH_CACHE_ALIAS].get(key)
+    with _stats_lock:
+        _stats['hits' if results is not None else 'misses'] += 1
+    return results
+
+
+def set_cached_search(key, results):
+    """
+    Store search results using the cache's configured TTL.
+
+    Args:
+        key: Key from search_cache_key()
+        results: SearchResponse to cache
+    """
+    caches[SEARCH_CACHE_ALIAS].set(key, results)
+
+
+def forget_collection_version(collection_id):
+    """Make this process re-read a collection's version on the next search"""
+    with _versions_lock:
+        _versions.pop(collection_id, None)
+
+
+def get_search_cache_stats():
+    """
+    Get this process's search cache counters.
+
+    Returns:
+        dict: hits, misses and hit_rate (None before the first lookup)
+    """
+    with _stats_lock:
+        hits, misses = _stats['hits'], _stats['misses']
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 4) if total else None,
+    }
@@ -0,0 +1,33 @@
+"""
+Signal handlers that keep in-memory reward data in sync with the database.
+"""
+from django.db.models.signals import post_save, post_delete
+
+from .card_profiles import invalidate_card_profile
+from .models import Issuer, Card, MerchantCategory, RewardCategory, RewardRate
+from .reward_matrix import invalidate_reward_matrix
+
+
+def _changed_card_id(instance):
+    """Return the card a saved/deleted row belongs to, or None if it is shared"""
+    if isinstance(instance, Card):
+        return instance.id
+    if isinstance(instance, RewardCategory):
+        return instance.card_id
+    if isinstance(instance, RewardRate):
+        try:
+            return instance.reward_category.card_id
+        except RewardCategory.DoesNotExist:
+            return None
+    return None
+
+
+def invalidate_reward_data(sender, instance, **kwargs):
+    """Invalidate cached reward data whenever a catalog row is saved or deleted"""
+    invalidate_reward_matrix()
+    invalidate_card_profile(_changed_card_id(instance))
+
+
+for model in (Issuer, Card, MerchantCategory, RewardCategory, RewardRate):
+    post_save.connect(invalidate_reward_data, sender=model, dispatch_uid=f"invalidate_reward_data_save_{model.__name__}")
+    post_delete.connect(invalidate_reward_data, sender=model, dispatch_uid=f"invalidate_reward_data_delete_{model.__name__}")
@@ -0,0 +1,246 @@
+"""
+Single-flight coalescing for streamed Grok responses.
+
+When several requests for the same analysis arrive while one is already being
+generated, only the first (the leader) opens an upstream stream. The stream is
+driven by a background thread that records every SSE frame, and every request
+(leader included) replays the recorded frames from the start and then follows
+the live ones. All subscribers therefore finish as soon as the upstream does,
+and a client disconnecting never cancels the stream for the others.
+
+async_coalesced_stream() is the same for the async views: the leader's
+stream is driven by a task on the event loop instead of a thread.
+
+coalesced_call() does the same for plain function calls (e.g. an upstream
+fetch that fills a cache): concurrent callers with the same key share one
+call and its result or exception.
+
+Coalescing is per process (and, for async streams, per event loop); requests
+handled by different workers each open their own stream.
+"""
+import asyncio
+import threading
+import weakref
+
+from django.db import connections
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+# Async flights belong to the event loop their leader task runs on
+_async_flights = weakref.WeakKeyDictionary()
+
+
+class StreamFlight:
+    """One upstream stream shared by every request with the same key"""
+
+    def __init__(self, key):
+        self.key = key
+        self.frames = []
+        self.done = False
+        self.condition = threading.Condition()
+
+    def publish(self, frame):
+        """Record a frame and wake up subscribers"""
+        with self.condition:
+            self.frames.append(frame)
+            self.condition.notify_all()
+
+    def finish(self):
+        """Mark the stream complete and wake up subscribers"""
+        with self.condition:
+            self.done = True
+            self.condition.notify_all()
+
+    def subscribe(self):
+        """
+        Iterate over every frame of the stream, including ones already sent.
+
+        Yields:
+            str: SSE frames in the order the upstream produced them
+        """
+        index = 0
+        while True:
+            with self.condition:
+                while index >= len(self.frames) and not self.done:
+                    self.condition.wait()
+                pending = self.frames[index:]
+                index += len(pending)
+                finished = self.done and index >= len(self.frames)
+
+            yield from pending
+            if finished:
+                return
+
+
+def _run_flight(flight, producer):
+    """Drive the producer to completion, publishing its frames to the flight"""
+    try:
+        for frame in producer():
+            flight.publish(frame)
+    finally:
+        # Unregister before finishing so later requests start a new flight
+        # (or, more likely, hit the response cache the producer just filled)
+        with _flights_lock:
+            if _flights.get(flight.key) is flight:
+                del _flights[flight.key]
+        flight.finish()
+        connections.close_all()
+
+
+def coalesced_stream(key, producer):
+    """
+    Subscribe to the stream for a key, starting it if nobody else has.
+
+    Args:
+        key: Identifies identical requests (e.g., the analysis cache key)
+        producer: Zero-argument callable returning a generator of SSE frames;
+            only called for the leader
+
+    Returns:
+        Generator of SSE frames for this request
+    """
+    with _flights_lock:
+        flight = _flights.get(key)
+        is_leader = flight is None
+        if is_leader:
+            flight = StreamFlight(key)
+            _flights[key] = flight
+
+    if is_leader:
+        threading.Thread(target=_run_flight, args=(flight, producer), daemon=True).start()
+    else:
+        print(f"🔗 Joining in-flight stream ({len(flight.frames)} frames already sent)")
+
+    return flight.subscribe()
+
+
+class AsyncStreamFlight:
+    """One upstream async stream shared by every request on an event loop with the same key"""
+
+    def __init__(self, key):
+        self.key = key
+        self.frames = []
+        self.done = False
+        self.changed = asyncio.Event()
+        self.task = None
+
+    def publish(self, frame):
+        """Record a frame and wake up subscribers"""
+        self.frames.append(frame)
+        self.changed.set()
+
+    def finish(self):
+        """Mark the stream complete and wake up subscribers"""
+        self.done = True
+        self.changed.set()
+
+    async def subscribe(self):
+        """
+        Iterate over every frame of the stream, including ones already sent.
+
+        Yields:
+            str: SSE frames in the order the upstream produced them
+        """
+        index = 0
+        while True:
+            while index >= len(self.frames) and not self.done:
+                self.changed.clear()
+                await self.changed.wait()
+            pending = self.frames[index:]
+            index += len(pending)
+            for frame in pending:
+                yield frame
+            if self.done and index >= len(self.frames):
+                return
+
+
+async def _run_async_flight(flights, flight, producer):
+    """Drive the async producer to completion, publishing its frames to the flight"""
+    try:
+        async for frame in producer():
+            flight.publish(frame)
+    finally:
+        if flights.get(flight.key) is flight:
+            del flights[flight.key]
+        flight.finish()
+
+
+def async_coalesced_stream(key, producer):
+    """
+    Subscribe to the async stream for a key, starting it if nobody else on this loop has.
+
+    Must be called from a coroutine.
+
+    Args:
+        key: Identifies identical requests (e.g., the analysis cache key)
+        producer: Zero-argument callable returning an async generator of SSE
+            frames; only called for the leader
+
+    Returns:
+        Async generator of SSE frames for this request
+    """
+    loop = asyncio.get_running_loop()
+    flights = _async_flights.setdefault(loop, {})
+    flight = flights.get(key)
+    if flight is None:
+        flight = AsyncStreamFlight(key)
+        flights[key] = flight
+        # Keep a reference so the task isn't collected while subscribers wait
+        flight.task = loop.create_task(_run_async_flight(flights, flight, producer))
+    else:
+        print(f"🔗 Joining in-flight async stream ({len(flight.frames)} frames already sent)")
+
+    return flight.subscribe()
+
+
+class CallFlight:
+    """One function call shared by every caller with the same key"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_calls = {}
+_calls_lock = threading.Lock()
+
+
+def coalesced_call(key, func):
+    """
+    Call func, or wait for the identical call already in flight.
+
+    Args:
+        key: Identifies identical calls (e.g., the cache key the call fills)
+        func: Zero-argument callable; only called by the leader, on its own thread
+
+    Returns:
+        func's return value (followers get the leader's)
+
+    Raises:
+        Whatever func raised (re-raised in every caller)
+    """
+    with _calls_lock:
+        flight = _calls.get(key)
+        is_leader = flight is None
+        if is_leader:
+            flight = CallFlight()
+            _calls[key] = flight
+
+    if not is_leader:
+        flight.event.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    try:
+        flight.result = func()
+        return flight.result
+    except BaseException as e:
+        flight.error = e
+        raise
+    finally:
+        with _calls_lock:
+            del _calls[key]
+        flight.event.set()
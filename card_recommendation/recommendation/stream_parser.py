@@ -0,0 +1,164 @@
+"""
+Incremental parser for the JSON object Grok streams back.
+
+Instead of forwarding raw token fragments and making clients re-parse a
+growing string, the streaming views feed every fragment through a parser that
+tracks JSON structure as it arrives and reports complete pieces as soon as
+they close: a whole array (e.g. "ranking"), each element of an array (e.g.
+every object in "analysis"), and finally the whole document.
+"""
+import json
+
+
+class JSONStreamParser:
+    """Follow a streamed top-level JSON object and emit its completed parts"""
+
+    def __init__(self, arrays=None, array_items=None, document_event=None):
+        """
+        Args:
+            arrays: Dict of top-level key -> event name, emitted with the whole
+                array once it closes (e.g., {'ranking': 'ranking'})
+            array_items: Dict of top-level key -> event name, emitted with each
+                element of that array as it closes (e.g., {'analysis': 'card_analysis'})
+            document_event: Optional event name emitted with the whole object
+                once the top-level object closes
+        """
+        self.arrays = arrays or {}
+        self.array_items = array_items or {}
+        self.document_event = document_event
+
+        self._parts = []
+        self._offset = 0
+        self._depth = 0
+        self._started = False
+        self._finished = False
+        self._in_string = False
+        self._escaped = False
+        self._string_parts = []
+        self._expect_key = False
+        self._current_key = None
+
+        # What is being captured: (event_name, depth_it_closes_at, start_offset)
+        self._capture = None
+        self._document_start = None
+
+    def full_text(self):
+        """Everything fed so far"""
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    def feed(self, text):
+        """
+        Consume the next fragment of streamed text.
+
+        Args:
+            text: A fragment of the model's output
+
+        Returns:
+            list: (event_name, payload) tuples completed by this fragment
+        """
+        offset = self._offset
+        self._parts.append(text)
+        self._offset += len(text)
+        if self._finished:
+            return []
+
+        events = []
+        for index, char in enumerate(text):
+            if not self._started:
+                # Skip anything before the object (e.g. a ```json fence)
+                if char != '{':
+                    continue
+                self._started = True
+                self._document_start = offset + index
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._expect_key:
+                        self._current_key = "".join(self._string_parts)
+                        self._expect_key = False
+                    self._string_parts = []
+                    continue
+                if self._depth == 1 and self._expect_key:
+                    self._string_parts.append(char)
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+                if self._depth == 1:
+                    self._expect_key = True
+                elif self._capture is None:
+                    event = self._capture_start(char)
+                    if event:
+                        self._capture = (event, self._depth - 1, offset + index)
+            elif char in '}]':
+                self._depth -= 1
+                if self._capture and self._depth == self._capture[1]:
+                    events.extend(self._capture_end(offset + index + 1))
+                if self._depth == 0:
+                    events.extend(self._document_end(offset + index + 1))
+                    return events
+            elif char == ',' and self._depth == 1:
+                self._expect_key = True
+
+        return events
+
+    def _capture_start(self, char):
+        """Decide whether the container opening at the current depth should be captured"""
+        if self._depth == 2 and char == '[':
+            return self.arrays.get(self._current_key)
+        if self._depth == 3 and char == '{':
+            return self.array_items.get(self._current_key)
+        return None
+
+    def _capture_end(self, end):
+        event, _, start = self._capture
+        self._capture = None
+        return self._decode(event, start, end)
+
+    def _document_end(self, end):
+        self._finished = True
+        if not self.document_event:
+            return []
+        return self._decode(self.document_event, self._document_start, end)
+
+    def _decode(self, event, start, end):
+        """Parse text[start:end] and return it as a single event (or nothing if malformed)"""
+        try:
+            return [(event, json.loads(self.full_text()[start:end]))]
+        except json.JSONDecodeError:
+            return []
+
+
+def extract_json_document(text):
+    """
+    Decode the JSON object of a complete model response.
+
+    Tolerates what the streaming parser skips, such as a ```json fence around the object.
+
+    Args:
+        text: Full model response
+
+    Returns:
+        The decoded object, or None if the text holds no complete, well-formed object
+    """
+    events = JSONStreamParser(document_event='document').feed(text)
+    return events[0][1] if events else None
+
+
+def analysis_stream_parser():
+    """Parser for analyze_cards_with_gpt_streaming's {"ranking": [...], "analysis": [...]} output"""
+    return JSONStreamParser(arrays={'ranking': 'ranking'}, array_items={'analysis': 'card_analysis'})
+
+
+def card_details_stream_parser():
+    """Parser for get_card_details_streaming's single card object"""
+    return JSONStreamParser(document_event='card_details')
@@ -1,3 +1,190 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import threading
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase
+
+from .cache_versions import bump_version
+from .models import Issuer, Card, MerchantCategory, RewardCategory, RewardRate
+from .reward_matrix import REWARD_MATRIX_VERSION_KEY, get_reward_matrix
+from .single_flight import coalesced_stream, _flights
+from .stream_parser import JSONStreamParser, analysis_stream_parser, card_details_stream_parser, extract_json_document
+from .upload_manifest import UploadManifest
+
+
+ANALYSIS = {
+    "ranking": [{"card_name": "Gold", "rank": 1}, {"card_name": "Sapphire", "rank": 2}],
+    "analysis": [
+        {"card_name": "Gold", "notes": ["4x {dining}", "say \"hi\" \\ bye"], "tiers": [[1, 2], [3]]},
+        {"card_name": "Sapphire", "notes": [], "tiers": []},
+    ],
+}
+
+
+def feed_all(parser, chunks):
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    return events
+
+
+class JSONStreamParserTests(SimpleTestCase):
+    def test_events_from_single_character_chunks(self):
+        text = json.dumps(ANALYSIS)
+        events = feed_all(analysis_stream_parser(), list(text))
+
+        self.assertEqual(events, [
+            ('ranking', ANALYSIS['ranking']),
+            ('card_analysis', ANALYSIS['analysis'][0]),
+            ('card_analysis', ANALYSIS['analysis'][1]),
+        ])
+
+    def test_events_do_not_depend_on_chunk_boundaries(self):
+        text = json.dumps(ANALYSIS)
+        expected = feed_all(analysis_stream_parser(), [text])
+        for size in (2, 3, 7, 13):
+            chunks = [text[i:i + size] for i in range(0, len(text), size)]
+            self.assertEqual(feed_all(analysis_stream_parser(), chunks), expected)
+
+    def test_leading_fence_is_skipped(self):
+        text = "```json\n" + json.dumps({"name": "Gold", "fee": 325}) + "\n```"
+        parser = card_details_stream_parser()
+        events = feed_all(parser, [text[:5], text[5:20], text[20:]])
+
+        self.assertEqual(events, [('card_details', {"name": "Gold", "fee": 325})])
+        self.assertEqual(parser.full_text(), text)
+
+    def test_escaped_quotes_and_braces_in_strings(self):
+        document = {"name": "The \"Gold\" card {amex}", "notes": ["a \\\" b", "[not an array]"]}
+        events = feed_all(JSONStreamParser(document_event='document'), list(json.dumps(document)))
+
+        self.assertEqual(events, [('document', document)])
+
+    def test_nested_arrays_close_with_their_item(self):
+        document = {"analysis": [{"tiers": [[1, [2, 3]], []]}, {"tiers": [[4]]}]}
+        events = feed_all(analysis_stream_parser(), [json.dumps(document)])
+
+        self.assertEqual(events, [('card_analysis', item) for item in document['analysis']])
+
+    def test_text_after_the_object_is_ignored(self):
+        parser = card_details_stream_parser()
+        events = feed_all(parser, ['{"a": 1}', '\n```', '{"b": 2}'])
+
+        self.assertEqual(events, [('card_details', {"a": 1})])
+
+    def test_extract_json_document(self):
+        self.assertEqual(extract_json_document('```json\n{"a": [1, 2]}\n```'), {"a": [1, 2]})
+        self.assertIsNone(extract_json_document('{"a": [1, 2'))
+        self.assertIsNone(extract_json_document('no object here'))
+
+
+class CoalescedStreamTests(SimpleTestCase):
+    def test_follower_replays_frames_already_sent(self):
+        first_sent = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def producer():
+            calls.append(True)
+            yield 'a'
+            first_sent.set()
+            release.wait(5)
+            yield 'b'
+            yield 'c'
+
+        leader = coalesced_stream('test:replay', producer)
+        self.assertEqual(next(leader), 'a')
+        self.assertTrue(first_sent.wait(5))
+
+        follower = coalesced_stream('test:replay', producer)
+        release.set()
+
+        self.assertEqual(list(leader), ['b', 'c'])
+        self.assertEqual(list(follower), ['a', 'b', 'c'])
+        self.assertEqual(len(calls), 1)
+
+    def test_leader_error_ends_every_subscriber(self):
+        errors = []
+        reported = threading.Event()
+
+        def excepthook(args):
+            errors.append(args.exc_value)
+            reported.set()
+
+        def failing_producer():
+            yield 'a'
+            raise RuntimeError('upstream failed')
+
+        with mock.patch.object(threading, 'excepthook', excepthook):
+            stream = coalesced_stream('test:error', failing_producer)
+            self.assertEqual(list(stream), ['a'])
+            self.assertTrue(reported.wait(5))
+        self.assertEqual(str(errors[0]), 'upstream failed')
+        self.assertNotIn('test:error', _flights)
+
+        # The failed flight is not reused
+        retry = coalesced_stream('test:error', lambda: iter(['b']))
+        self.assertEqual(list(retry), ['b'])
+
+
+class RewardMatrixTests(TestCase):
+    def setUp(self):
+        issuer = Issuer.objects.create(name="Amex")
+        self.card = Card.objects.create(issuer=issuer, name="Gold", base_point_value=Decimal("0.02"))
+        dining = MerchantCategory.objects.create(name="dining")
+        self.reward_category = RewardCategory.objects.create(card=self.card, merchant_category=dining)
+        RewardRate.objects.create(reward_category=self.reward_category, points=4)
+
+    def test_saving_reward_data_rebuilds_the_matrix(self):
+        self.assertEqual(get_reward_matrix().lookup(self.card.id, ['dining'])['reward_amount'], 4)
+
+        rate = RewardRate.objects.get(reward_category=self.reward_category)
+        rate.points = 5
+        rate.save()
+
+        self.assertEqual(get_reward_matrix().lookup(self.card.id, ['dining'])['reward_amount'], 5)
+
+    def test_bump_version_invalidates_the_matrix(self):
+        matrix = get_reward_matrix()
+
+        # update() sends no signals, so the matrix stays until the version is bumped
+        RewardRate.objects.filter(reward_category=self.reward_category).update(points=3)
+        self.assertIs(get_reward_matrix(), matrix)
+
+        bump_version(REWARD_MATRIX_VERSION_KEY)
+        rebuilt = get_reward_matrix()
+        self.assertIsNot(rebuilt, matrix)
+        self.assertEqual(rebuilt.lookup(self.card.id, ['dining'])['reward_amount'], 3)
+
+
+class UploadManifestTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'manifest.json')
+        self.pdf_path = os.path.join(directory.name, 'gold.pdf')
+
+    def test_entries_survive_a_reload(self):
+        manifest = UploadManifest(self.path)
+        manifest.record('col', 'sha-1', 'file-1', 'gold.pdf', self.pdf_path)
+        manifest.record('col', 'sha-2', 'file-2', 'gold.pdf', self.pdf_path)
+
+        reloaded = UploadManifest(self.path)
+        self.assertEqual(reloaded.get('col', 'sha-1')['file_id'], 'file-1')
+        self.assertIsNone(reloaded.get('other', 'sha-1'))
+        self.assertEqual(reloaded.file_ids('col'), {'file-1', 'file-2'})
+        self.assertEqual(reloaded.file_ids_for_path('col', self.pdf_path), {'file-1', 'file-2'})
+        self.assertEqual(reloaded.file_ids_by_path('col'), {os.path.abspath(self.pdf_path): 'file-2'})
+
+    def test_forget_is_saved(self):
+        manifest = UploadManifest(self.path)
+        manifest.record('col', 'sha-1', 'file-1', 'gold.pdf', self.pdf_path)
+        manifest.record('col', 'sha-2', 'file-2', 'gold.pdf', self.pdf_path)
+        manifest.forget('col', {'file-1'})
+
+        reloaded = UploadManifest(self.path)
+        self.assertIsNone(reloaded.get('col', 'sha-1'))
+        self.assertEqual(reloaded.file_ids('col'), {'file-2'})
@@ -0,0 +1,135 @@
+"""
+Local manifest of uploaded card benefit PDFs.
+
+upload_card_pdfs records every uploaded file's SHA-256 hash here, per
+collection. A file whose content is already in the target collection is
+skipped, so re-running an upload only sends new or changed PDFs, and a run
+that was interrupted resumes where it stopped. When a changed file is
+uploaded, the documents of its earlier versions (same path) are deleted. The manifest is written
+after each upload. Before trusting it, upload_card_pdfs lists the collection
+and forgets entries whose documents were deleted since (e.g. by
+clear_rag_documents or sync_card_pdfs), so those files are uploaded again.
+
+Format (JSON):
+    {"<collection_id>": {"<sha256>": {"file_id": ..., "name": ..., "path": ..., "uploaded_at": ...}}}
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from django.utils import timezone
+
+MANIFEST_FILENAME = '.rag_upload_manifest.json'
+
+# Bytes read at a time when hashing
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_sha256(file_path):
+    """
+    Hash a file without loading it into memory.
+
+    Args:
+        file_path: Path to the file
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class UploadManifest:
+    """SHA-256 hashes of the documents uploaded to each collection (thread-safe)"""
+
+    def __init__(self, path):
+        """
+        Args:
+            path: Manifest file (created on the first upload if missing)
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self._entries = json.load(f)
+
+    def get(self, collection_id, sha256):
+        """
+        Look up an uploaded document by content.
+
+        Returns:
+            dict: The manifest entry, or None if this content is not in the collection
+        """
+        with self._lock:
+            return self._entries.get(collection_id, {}).get(sha256)
+
+    def file_ids_by_path(self, collection_id):
+        """
+        Get the latest uploaded file ID of each local file in a collection.
+
+        Returns:
+            dict: Absolute file path -> file ID
+        """
+        with self._lock:
+            entries = sorted(self._entries.get(collection_id, {}).values(), key=lambda entry: entry['uploaded_at'])
+        return {entry['path']: entry['file_id'] for entry in entries}
+
+    def file_ids_for_path(self, collection_id, path):
+        """
+        Get the file IDs of every version of a local file uploaded to a collection.
+
+        Returns:
+            set: File IDs recorded for the file's path (any content)
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            return {
+                entry['file_id'] for entry in self._entries.get(collection_id, {}).values() if entry['path'] == path
+            }
+
+    def file_ids(self, collection_id):
+        """
+        Get the file IDs recorded for a collection.
+
+        Returns:
+            set: File IDs of the documents the manifest says are in the collection
+        """
+        with self._lock:
+            return {entry['file_id'] for entry in self._entries.get(collection_id, {}).values()}
+
+    def forget(self, collection_id, file_ids):
+        """Drop the entries of documents no longer in a collection and save the manifest"""
+        with self._lock:
+            entries = self._entries.get(collection_id, {})
+            for sha256 in [sha256 for sha256, entry in entries.items() if entry['file_id'] in file_ids]:
+                del entries[sha256]
+            self._save()
+
+    def record(self, collection_id, sha256, file_id, name, path):
+        """Record an upload and save the manifest"""
+        with self._lock:
+            self._entries.setdefault(collection_id, {})[sha256] = {
+                'file_id': file_id,
+                'name': name,
+                'path': os.path.abspath(path),
+                'uploaded_at': timezone.now().isoformat(),
+            }
+            self._save()
+
+    def _save(self):
+        # Write to a temporary file and rename it, so an interrupted run never leaves a torn manifest
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.rag_manifest_', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, indent=2, sort_keys=True)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
@@ -3,6 +3,19 @@ Utility functions for the recommendation app.
 """
 import json
 
+# Bump these whenever the matching prompt (or its system message) changes so
+# cached analyses and stored card details generated from the old wording are
+# no longer served.
+ANALYSIS_PROMPT_VERSION = "1"
+STREAMING_ANALYSIS_PROMPT_VERSION = "1"
+CARD_DETAILS_PROMPT_VERSION = "1"
+
+STREAMING_ANALYSIS_SYSTEM_PROMPT = "You are a credit card expert who provides detailed, accurate analysis of credit card benefits. CRITICAL: Use the collections_search tool to look up official card benefit documentation for accurate, up-to-date information. Always prioritize information from official documents over general knowledge. Always respond with valid JSON."
+# Used in RAG prefetch mode, where document excerpts are in the prompt instead of a tool
+STREAMING_ANALYSIS_PREFETCH_SYSTEM_PROMPT = "You are a credit card expert who provides detailed, accurate analysis of credit card benefits. CRITICAL: Excerpts from official card benefit documentation are included in the prompt. Always prioritize information from official documents over general knowledge. Always respond with valid JSON."
+CARD_DETAILS_PREFETCH_SYSTEM_PROMPT = "You are a credit card expert who provides detailed, accurate information about credit card benefits and features. CRITICAL: Excerpts from official card benefit documentation are included in the prompt. Always prioritize information from official documents over general knowledge. Always respond with valid JSON."
+CARD_DETAILS_SYSTEM_PROMPT = "You are a credit card expert who provides detailed, accurate information about credit card benefits and features. CRITICAL: Use the collections_search tool to look up official card benefit documentation for accurate, up-to-date information. Always prioritize information from official documents over general knowledge. Always respond with valid JSON."
+
 
 def build_gpt_analysis_prompt(card_data, analysis_category, store_name=None, store_address=None):
     """
@@ -91,7 +104,27 @@ def build_gpt_analysis_prompt(card_data, analysis_category, store_name=None, sto
     return prompt
 
 
-def build_gpt_streaming_analysis_prompt(card_data, analysis_category, store_name=None, store_address=None):
+def build_documentation_info(rag_context):
+    """
+    Build the prompt section holding pre-retrieved document excerpts.
+
+    Args:
+        rag_context: Formatted excerpts from RagPrefetch.collect(), or None
+
+    Returns:
+        str: The section, or an empty string if there is no context
+    """
+    if not rag_context:
+        return ""
+    return (
+        "\n\nOFFICIAL CARD DOCUMENTATION:\n"
+        "The following excerpts were retrieved from official card benefit documents. "
+        "Prioritize them over general knowledge wherever they apply.\n\n"
+        f"{rag_context}\n"
+    )
+
+
+def build_gpt_streaming_analysis_prompt(card_data, analysis_category, store_name=None, store_address=None, rag_context=None):
     """
     Build the GPT prompt for streaming credit card analysis.
     This version instructs GPT to return ranking first, then full analysis.
@@ -101,6 +134,7 @@ def build_gpt_streaming_analysis_prompt(card_data, analysis_category, store_name
         analysis_category: The spending category to analyze (e.g., "dining")
         store_name: Optional name of the store/merchant
         store_address: Optional address of the store/merchant
+        rag_context: Optional excerpts from card benefit documents (RAG prefetch mode)
 
     Returns:
         str: The formatted prompt for GPT
@@ -118,6 +152,7 @@ def build_gpt_streaming_analysis_prompt(card_data, analysis_category, store_name
     prompt = f"""
         You are a credit card expert with extensive knowledge of credit card rewards programs. Analyze the following credit cards for spending in the "{analysis_category}" category and rank them from best to worst with detailed explanations.
         {store_info}
+        {build_documentation_info(rag_context)}
 
         CRITICAL: Use the most accurate and up-to-date benefit and rewards information available. Prioritize current card terms, recent reward structure updates, and the latest known reward rates when making your analysis.
 
@@ -205,12 +240,13 @@ def build_gpt_streaming_analysis_prompt(card_data, analysis_category, store_name
     return prompt
 
 
-def build_card_details_prompt(card_data):
+def build_card_details_prompt(card_data, rag_context=None):
     """
     Build the GPT prompt for analyzing a single card's details.
 
     Args:
         card_data: Dictionary with card information including rewards
+        rag_context: Optional excerpts from the card's benefit documents (RAG prefetch mode)
 
     Returns:
         str: The formatted prompt for GPT
@@ -222,6 +258,7 @@ def build_card_details_prompt(card_data):
 
         Card to analyze:
         {json.dumps(card_data, indent=2)}
+        {build_documentation_info(rag_context)}
 
         INSTRUCTIONS:
         - Use the database information provided as a baseline
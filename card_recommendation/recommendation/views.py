@@ -5,116 +5,228 @@ from django.conf import settings
 from rest_framework import generics
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
-from django.http import StreamingHttpResponse
-from xai_sdk import Client
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.utils.encoders import JSONEncoder
+from django.http import StreamingHttpResponse, JsonResponse, HttpResponseNotModified
 from xai_sdk.chat import system, user as xai_user
 from xai_sdk.tools import collections_search
 
-from .models import MerchantCategory, RewardCategory, RewardRate, Card
+from .models import Card
 from .serializers import RewardRateSerializer, CardSerializer
 from users.permissions import IsAuthenticatedAndActive
-from .utils import build_gpt_analysis_prompt, build_gpt_streaming_analysis_prompt, build_card_details_prompt
+from .utils import (
+    build_gpt_analysis_prompt, build_gpt_streaming_analysis_prompt, build_card_details_prompt,
+    ANALYSIS_PROMPT_VERSION, STREAMING_ANALYSIS_PROMPT_VERSION,
+    STREAMING_ANALYSIS_SYSTEM_PROMPT, CARD_DETAILS_SYSTEM_PROMPT,
+    STREAMING_ANALYSIS_PREFETCH_SYSTEM_PROMPT, CARD_DETAILS_PREFETCH_SYSTEM_PROMPT,
+)
 from .rag_service import RAGService
+from .rag_scope import get_rag_scope, MAX_TOOL_COLLECTIONS
+from .search_cache import get_search_cache_stats
+from .rag_prefetch import rag_prefetch_enabled, start_card_prefetch
+from .xai_clients import get_xai_client
+from .reward_matrix import get_reward_matrix
+from .category_index import resolve_categories
+from .card_profiles import get_card_profiles, get_card_profile
+from .analysis_cache import analysis_fingerprint, get_cached_analysis, set_cached_analysis
+from .single_flight import coalesced_stream
+from .stream_parser import analysis_stream_parser, card_details_stream_parser, extract_json_document
+from .card_details_store import (
+    reward_data_version, get_card_details_document, save_card_details_document,
+    etag_header, etag_matches,
+)
 
 from users.models import UserCard
+from users.places import find_nearby_stores
 
 
-def get_rag_tools():
+def get_rag_tools(collection_ids=None):
     """
     Helper function to get RAG tools for xAI chat if configured.
 
+    Args:
+        collection_ids: Collections to search (default: CARD_BENEFITS_COLLECTION_ID),
+            e.g. RagScope.collection_ids() for the user's cards
+
     Returns:
         list: List of tools including collections_search if RAG is enabled, empty list otherwise
     """
     collection_id = getattr(settings, 'CARD_BENEFITS_COLLECTION_ID', None)
-    if not collection_id:
+    # In prefetch mode the views retrieve context themselves (see rag_prefetch.py)
+    if not collection_id or rag_prefetch_enabled():
         return []
 
+    if not collection_ids or len(collection_ids) > MAX_TOOL_COLLECTIONS:
+        collection_ids = [collection_id]
+
     return [
         collections_search(
-            collection_ids=[collection_id],
+            collection_ids=list(collection_ids),
             retrieval_mode="hybrid",
         )
     ]
 
 
+def get_cards_rag_scope(card_ids):
+    """
+    Get the RAG documents and collections for a set of cards.
+
+    Args:
+        card_ids: Card UUIDs
+
+    Returns:
+        RagScope, or None if RAG is not configured (no query is made)
+    """
+    if not getattr(settings, 'CARD_BENEFITS_COLLECTION_ID', None):
+        return None
+    return get_rag_scope(card_ids)
+
+
+def sse_event(data):
+    """
+    Format a payload as a Server-Sent Event frame.
+
+    Args:
+        data: JSON-serializable payload (Decimals are encoded like REST responses)
+
+    Returns:
+        str: The "data:" frame
+    """
+    return f"data: {json.dumps(data, cls=JSONEncoder)}\n\n"
+
+
+def sse_response(stream):
+    """
+    Wrap a generator of SSE frames in a StreamingHttpResponse.
+
+    Args:
+        stream: Generator yielding SSE "data:" frames
+
+    Returns:
+        StreamingHttpResponse: Response with SSE headers set
+    """
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def relay_chat_stream(chat, parser, structured):
+    """
+    Relay a Grok chat stream as SSE frames.
+
+    Every fragment is fed to the parser, whose full_text() holds the complete
+    response afterwards.
+
+    Args:
+        chat: Chat created with client.chat.create()
+        parser: JSONStreamParser for the expected response shape
+        structured: Send the parser's events instead of raw chunks
+
+    Returns:
+        The final chat response (e.g., for logging tool calls)
+    """
+    response = None
+    for response, chunk in chat.stream():
+        if not chunk.content:
+            continue
+        events = parser.feed(chunk.content)
+        if structured:
+            for name, payload in events:
+                yield sse_event({name: payload})
+        else:
+            yield sse_event({'chunk': chunk.content})
+    return response
+
+
+def done_event(content, structured):
+    """Completion frame; the "events" format does not repeat the full response"""
+    if structured:
+        return sse_event({'done': True})
+    return sse_event({'done': True, 'full_response': content})
+
+
+def replay_cached_stream(content, parser, structured):
+    """
+    Replay a cached streaming response using the same frames as a live stream.
+
+    Args:
+        content: The full response text cached from an earlier stream
+        parser: JSONStreamParser for the response shape
+        structured: Send typed events instead of a raw chunk
+    """
+    if structured:
+        for name, payload in parser.feed(content):
+            yield sse_event({name: payload})
+    else:
+        yield sse_event({'chunk': content})
+    yield done_event(content, structured)
+
+
+def with_provisional_ranking(ranking, stream):
+    """
+    Send a ranking computed from the reward tables before the LLM stream.
+
+    Args:
+        ranking: Recommendation dicts from RewardMatrix.rank_cards()
+        stream: Generator of SSE frames that refines the ranking
+    """
+    yield sse_event({'provisional_ranking': ranking})
+    yield from stream
+
+
+# "chunks" (default) forwards raw model fragments and repeats the full text in
+# the final frame; "events" sends typed events for completed JSON parts
+STREAM_FORMATS = ('chunks', 'events')
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def rag_search_cache_stats(request):
+    """Hit/miss counters of this worker's RAG search cache (staff only)"""
+    return Response(get_search_cache_stats(), status=200)
+
+
 class CardListView(generics.ListAPIView):
     queryset = Card.objects.all()
     serializer_class = CardSerializer
     permission_classes = [IsAuthenticatedAndActive]
 
 
-category_mapping = {
-    "dining": [
-        "restaurant",
-        "food",
-        "acai_shop",
-        "afghani_restaurant",
-        "african_restaurant",
-        "american_restaurant",
-        "asian_restaurant",
-        "bagel_shop",
-        "bakery",
-        "bar",
-        "bar_and_grill",
-        "barbecue_restaurant",
-        "brazilian_restaurant",
-        "breakfast_restaurant",
-        "brunch_restaurant",
-        "buffet_restaurant",
-        "cafe",
-        "cafeteria",
-        "candy_store",
-        "cat_cafe",
-        "chinese_restaurant",
-        "chocolate_factory",
-        "chocolate_shop",
-        "coffee_shop",
-        "confectionery",
-        "deli",
-        "dessert_restaurant",
-        "dessert_shop",
-        "diner",
-        "dog_cafe",
-        "donut_shop",
-        "fast_food_restaurant",
-        "fine_dining_restaurant",
-        "food_court",
-        "french_restaurant",
-        "greek_restaurant",
-        "hamburger_restaurant",
-        "ice_cream_shop",
-        "indian_restaurant",
-        "indonesian_restaurant",
-        "italian_restaurant",
-        "japanese_restaurant",
-        "juice_shop",
-        "korean_restaurant",
-        "lebanese_restaurant",
-        "meal_delivery",
-        "meal_takeaway",
-        "mediterranean_restaurant",
-        "mexican_restaurant",
-        "middle_eastern_restaurant",
-        "pizza_restaurant",
-        "pub",
-        "ramen_restaurant",
-        "restaurant",
-        "sandwich_shop",
-        "seafood_restaurant",
-        "spanish_restaurant",
-        "steak_house",
-        "sushi_restaurant",
-        "tea_house",
-        "thai_restaurant",
-        "turkish_restaurant",
-        "vegan_restaurant",
-        "vegetarian_restaurant",
-        "vietnamese_restaurant",
-        "wine_bar"
-    ]
-}
+def get_wallet_card_ids(user):
+    """
+    Get the card model IDs in a user's wallet with a single query.
+
+    Args:
+        user: The requesting user
+
+    Returns:
+        list: Card UUIDs (one per UserCard with a linked card model)
+    """
+    return list(
+        UserCard.objects.filter(user=user, card_model__isnull=False).values_list('card_model_id', flat=True)
+    )
+
+
+def rank_wallet_for_types(card_ids, types, matrix=None):
+    """
+    Rank wallet cards for a store's Google place types.
+
+    Args:
+        card_ids: Card UUIDs from the user's wallet
+        types: Google place types for the store
+        matrix: Optional RewardMatrix to reuse across several stores
+
+    Returns:
+        list: Recommendation dicts sorted by value, highest first
+    """
+    # Mapped categories ranked by specificity; unmapped types are tried as category names
+    category_names = resolve_categories(types) or types
+    print(f"🔎 Matching categories: {category_names}")
+
+    # Catalog lookups are served from the in-memory matrix (no DB queries)
+    matrix = matrix or get_reward_matrix()
+    return matrix.rank_cards(card_ids, category_names)
 
 
 @api_view(['GET'])
@@ -128,80 +240,102 @@ def get_card_benefits_by_types(request):
         print("❌ No 'types' query parameters provided")
         return Response({'error': 'Query parameter "types" is required.'}, status=400)
 
-    matched_category_name = None
-    for key, mapped_types in category_mapping.items():
-        if any(t in mapped_types for t in types):
-            matched_category_name = key
-            break
+    card_ids = get_wallet_card_ids(user)
+    print(f"👤 User has {len(card_ids)} user cards. Card model IDs: {card_ids}")
 
-    if matched_category_name:
-        matching_category = MerchantCategory.objects.filter(name__iexact=matched_category_name).first()
-        if matching_category:
-            matching_categories = [matching_category]
-        else:
-            matching_categories = []
-    else:
-        matching_categories = MerchantCategory.objects.filter(name__in=types)
-    print(f"🔎 Matching MerchantCategories: {[cat.name for cat in matching_categories]}")
+    sorted_data = rank_wallet_for_types(card_ids, types)
+    print(f"📦 Returning {len(sorted_data)} sorted recommendations")
+    return Response(sorted_data, status=200)
 
-    fallback_category = MerchantCategory.objects.filter(name__iexact="other").first()
 
-    user_cards = UserCard.objects.filter(user=user, card_model__isnull=False).select_related('card_model')
-    card_ids = [uc.card_model.id for uc in user_cards]
-    print(f"👤 User has {len(user_cards)} user cards. Card model IDs: {card_ids}")
+MAX_BATCH_STORES = 50
 
-    reward_categories = RewardCategory.objects.filter(
-        card_id__in=card_ids,
-        merchant_category__in=matching_categories
-    ).select_related('card', 'merchant_category')
-    print(f"🎁 Found {reward_categories.count()} matching reward categories")
 
-    # Map: card_id -> RewardCategory
-    card_reward_map = {rc.card.id: rc for rc in reward_categories}
-    print(f"📌 Card reward map keys: {list(card_reward_map.keys())}")
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def get_card_benefits_by_types_batch(request):
+    """
+    Rank the user's cards for many stores in one request.
+
+    Expects a JSON body:
+    {
+        "stores": [
+            {"name": "Chipotle", "address": "123 Main St", "types": ["restaurant", "food"]},
+            ...
+        ]
+    }
+
+    Returns one entry per store, in request order, with the same recommendation
+    list get_card_benefits_by_types returns for that store's types.
+    """
+    stores = request.data.get('stores') if isinstance(request.data, dict) else None
+    if not isinstance(stores, list) or not stores:
+        return Response({'error': '"stores" must be a non-empty list.'}, status=400)
+    if len(stores) > MAX_BATCH_STORES:
+        return Response({'error': f'At most {MAX_BATCH_STORES} stores can be ranked per request.'}, status=400)
+
+    for store in stores:
+        types = store.get('types') if isinstance(store, dict) else None
+        if not isinstance(types, list) or not types or not all(isinstance(t, str) for t in types):
+            return Response({'error': 'Every store must include a non-empty "types" list of strings.'}, status=400)
+
+    # Wallet and reward rows are loaded once for the whole batch
+    card_ids = get_wallet_card_ids(request.user)
+    matrix = get_reward_matrix()
+    print(f"📥 Batch ranking {len(stores)} stores for {len(card_ids)} user cards")
 
     results = []
-    for uc in user_cards:
-        card = uc.card_model
-        print(f"➡️ Evaluating card: {card.name} (ID: {card.id})")
+    for store in stores:
+        results.append({
+            'name': store.get('name'),
+            'address': store.get('address'),
+            'types': store['types'],
+            'recommendations': rank_wallet_for_types(card_ids, store['types'], matrix=matrix),
+        })
 
-        rc = card_reward_map.get(card.id)
+    return Response({'results': results}, status=200)
 
-        # Fallback to 'Others' if no match
-        if not rc and fallback_category:
-            print(f"⚠️ No match for card {card.id}. Trying fallback...")
-            rc = RewardCategory.objects.filter(card=card, merchant_category=fallback_category).first()
 
-        if not rc:
-            print(f"🚫 No reward category for card {card.id}. Skipping.")
-            continue
+@api_view(['GET'])
+@permission_classes([IsAuthenticatedAndActive])
+def get_nearby_stores_with_best_card(request):
+    """
+    Nearest stores with the best card from the user's wallet for each.
+
+    Expects query parameters lat, lng and radius (meters, default 100), like
+    /get-nearby-stores/. Returns the same stores, each with "best_card" (the
+    top entry get_card_benefits_by_types would return for its categories, or
+    null). The wallet is loaded once and each distinct set of resolved
+    categories is ranked once, so the number of DB queries does not grow with
+    the number of stores.
+    """
+    try:
+        lat = float(request.query_params.get('lat'))
+        lng = float(request.query_params.get('lng'))
+        radius = float(request.query_params.get('radius', 100))
+    except (TypeError, ValueError):
+        return Response({"error": "Invalid latitude or longitude"}, status=400)
 
-        try:
-            rate = rc.rewardrate  # assumes OneToOne relation
-        except RewardRate.DoesNotExist:
-            print(f"🚫 No reward rate for reward category of card {card.id}")
-            continue
+    try:
+        stores = find_nearby_stores(lat, lng, radius)
+    except Exception as e:
+        return Response({"error": str(e)}, status=500)
 
-        base_point_value = float(card.base_point_value or 0)
-        points = rate.points or 0
-        cashback = float(rate.cashback_percentage or 0)
-        value = cashback + points * base_point_value
+    card_ids = get_wallet_card_ids(request.user)
+    matrix = get_reward_matrix()
+    print(f"📍 Ranking {len(card_ids)} user cards for {len(stores)} nearby stores")
 
-        print(f"✅ Card {card.name}: cashback={cashback}, points={points}, value={value}")
+    # Stores of the same kind resolve to the same categories; rank each set once
+    rankings = {}
+    results = []
+    for store in stores:
+        category_names = tuple(resolve_categories(store['categories']) or store['categories'])
+        if category_names not in rankings:
+            rankings[category_names] = matrix.rank_cards(card_ids, category_names)
+        ranked = rankings[category_names]
+        results.append({**store, 'best_card': ranked[0] if ranked else None})
 
-        results.append({
-            "card_id": str(card.id),
-            "card_name": card.name,
-            "issuer": card.issuer.name,
-            "value": value,
-            "reward_type": "cashback" if rate.cashback_percentage else "points",
-            "reward_amount": rate.cashback_percentage or rate.points,
-            "category": rc.merchant_category.name
-        })
-    results.sort(key=lambda x: x["card_name"])
-    sorted_data = sorted(results, key=lambda x: x["value"], reverse=True)
-    print(f"📦 Returning {len(sorted_data)} sorted recommendations")
-    return Response(sorted_data, status=200)
+    return Response({"stores": results}, status=200)
 
 
 @api_view(['GET'])
@@ -226,69 +360,33 @@ def analyze_cards_with_gpt(request):
             print("❌ No 'types' query parameters provided")
             return Response({'error': 'Query parameter "types" is required.'}, status=400)
 
-        # Find matching category using the same logic as get_card_benefits_by_types
-        matched_category_name = None
-        for key, mapped_types in category_mapping.items():
-            if any(t in mapped_types for t in types):
-                matched_category_name = key
-                break
-        
-        if matched_category_name:
-            matching_category = MerchantCategory.objects.filter(name__iexact=matched_category_name).first()
-            if matching_category:
-                matching_categories = [matching_category]
-            else:
-                matching_categories = []
-        else:
-            matching_categories = MerchantCategory.objects.filter(name__in=types)
-        
-        print(f"🔎 Matching MerchantCategories: {[cat.name for cat in matching_categories]}")
+        # Resolve categories using the same logic as get_card_benefits_by_types
+        category_names = resolve_categories(types) or types
         
         # Get user's cards (same logic as get_card_benefits_by_types)
-        user_cards = UserCard.objects.filter(user=user, card_model__isnull=False).select_related('card_model')
-        if not user_cards.exists():
+        card_ids = get_wallet_card_ids(user)
+        if not card_ids:
             return Response({'error': 'User has no cards'}, status=400)
-        
-        card_ids = [uc.card_model.id for uc in user_cards]
-        print(f"👤 User has {len(user_cards)} user cards. Card model IDs: {card_ids}")
-        
-        # Get card details from database
-        cards = Card.objects.filter(id__in=card_ids).select_related('issuer')
-        if not cards.exists():
+
+        print(f"👤 User has {len(card_ids)} user cards. Card model IDs: {card_ids}")
+
+        # Get card details and reward information (cached per card)
+        card_data = get_card_profiles(card_ids)
+        if not card_data:
             return Response({'error': 'No valid cards found for user'}, status=400)
-        
-        # Get reward information for each card
-        card_data = []
-        for card in cards:
-            # Get reward categories for this card
-            reward_categories = RewardCategory.objects.filter(card=card).select_related('merchant_category')
-            
-            card_info = {
-                'id': str(card.id),
-                'name': card.name,
-                'issuer': card.issuer.name,
-                'base_point_value': float(card.base_point_value) if card.base_point_value else None,
-                'rewards': []
-            }
-
-            for rc in reward_categories:
-                try:
-                    rate = rc.rewardrate
-                    reward_info = {
-                        'category': rc.merchant_category.name,
-                        'cashback_percentage': float(rate.cashback_percentage) if rate.cashback_percentage else None,
-                        'points': rate.points if rate.points else None,
-                        'reset_period': rate.reset_period if rate.reset_period else None,
-                        'limit': float(rate.limit) if rate.limit else None
-                    }
-                    card_info['rewards'].append(reward_info)
-                except RewardRate.DoesNotExist:
-                    continue
-
-            card_data.append(card_info)
 
         # Use the matched category name for the analysis
-        analysis_category = matched_category_name if matched_category_name else types[0]
+        analysis_category = category_names[0]
+
+        # Serve repeat analyses (same wallet, category and store) from cache
+        cache_key = analysis_fingerprint(
+            'analysis', card_ids, analysis_category, store_name, store_address,
+            prompt_version=ANALYSIS_PROMPT_VERSION, collection_version=None, model="grok-3"
+        )
+        cached_analysis = get_cached_analysis(cache_key)
+        if cached_analysis is not None:
+            print(f"⚡ Serving cached GPT analysis - {cached_analysis['total_cards_analyzed']} cards")
+            return Response({**cached_analysis, 'types': types}, status=200)
 
         # Prepare prompt for GPT using helper function
         prompt = build_gpt_analysis_prompt(
@@ -302,7 +400,7 @@ def analyze_cards_with_gpt(request):
         if not os.environ.get('XAI_API_KEY'):
             return Response({'error': 'Grok API key not configured'}, status=500)
 
-        client = Client()
+        client = get_xai_client()
 
         # Call Grok API with JSON mode
         chat = client.chat.create(model="grok-3")
@@ -345,12 +443,13 @@ def analyze_cards_with_gpt(request):
         # GPT already returns cards in best-to-worst order, so no additional sorting needed
         
         print(f"✅ GPT Analysis complete - {len(validated_results)} cards analyzed")
-        return Response({
+        analysis = {
             'category': analysis_category,
-            'types': types,
             'analysis': validated_results,
             'total_cards_analyzed': len(validated_results)
-        }, status=200)
+        }
+        set_cached_analysis(cache_key, analysis)
+        return Response({**analysis, 'types': types}, status=200)
         
     except Exception as e:
         print(f"❌ Error in GPT analysis: {str(e)}")
@@ -360,162 +459,221 @@ def analyze_cards_with_gpt(request):
         }, status=500)
 
 
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])
-def analyze_cards_with_gpt_streaming(request):
+def prepare_streaming_analysis(user, query_params):
     """
-    Analyze user's credit cards for a specific category using GPT API with streaming.
-    Returns ranking first, then streams the full analysis.
+    Do all the database work for a streaming analysis before any LLM call.
 
-    Expects query parameters:
-    - types: list of category types (e.g., ?types=restaurant&types=pharmacy)
-    - store_name: name of the store/merchant (optional)
-    - store_address: address of the store/merchant (optional)
+    Shared by the sync view below and the async view in async_views.py.
+
+    Args:
+        user: The requesting user
+        query_params: Request query parameters (types, store_name, store_address, stream_format)
+
+    Returns:
+        tuple: (context dict, None) on success, or (None, (error dict, status)) on failure
     """
-    try:
-        user = request.user
-        store_name = request.query_params.get('store_name', None)
-        store_address = request.query_params.get('store_address', None)
-        types = request.query_params.getlist('types')
-        print(f"🤖 GPT Streaming Analysis - User: {user.id}, Types: {types}")
+    store_name = query_params.get('store_name', None)
+    store_address = query_params.get('store_address', None)
+    types = query_params.getlist('types')
+    stream_format = query_params.get('stream_format', 'chunks')
+    print(f"🤖 GPT Streaming Analysis - User: {user.id}, Types: {types}")
 
-        if not types:
-            print("❌ No 'types' query parameters provided")
-            return Response({'error': 'Query parameter "types" is required.'}, status=400)
+    if not types:
+        print("❌ No 'types' query parameters provided")
+        return None, ({'error': 'Query parameter "types" is required.'}, 400)
+    if stream_format not in STREAM_FORMATS:
+        return None, ({'error': f'"stream_format" must be one of {", ".join(STREAM_FORMATS)}.'}, 400)
 
-        # Find matching category using the same logic as analyze_cards_with_gpt
-        matched_category_name = None
-        for key, mapped_types in category_mapping.items():
-            if any(t in mapped_types for t in types):
-                matched_category_name = key
-                break
-
-        if matched_category_name:
-            matching_category = MerchantCategory.objects.filter(name__iexact=matched_category_name).first()
-            if matching_category:
-                matching_categories = [matching_category]
-            else:
-                matching_categories = []
-        else:
-            matching_categories = MerchantCategory.objects.filter(name__in=types)
+    # Resolve categories using the same logic as get_card_benefits_by_types
+    category_names = resolve_categories(types) or types
 
-        print(f"🔎 Matching MerchantCategories: {[cat.name for cat in matching_categories]}")
+    # Get user's cards (same logic as get_card_benefits_by_types)
+    card_ids = get_wallet_card_ids(user)
+    if not card_ids:
+        return None, ({'error': 'User has no cards'}, 400)
 
-        # Get user's cards
-        user_cards = UserCard.objects.filter(user=user, card_model__isnull=False).select_related('card_model')
-        if not user_cards.exists():
-            return Response({'error': 'User has no cards'}, status=400)
+    print(f"👤 User has {len(card_ids)} user cards. Card model IDs: {card_ids}")
 
-        card_ids = [uc.card_model.id for uc in user_cards]
-        print(f"👤 User has {len(user_cards)} user cards. Card model IDs: {card_ids}")
+    # Use the matched category name for the analysis
+    analysis_category = category_names[0]
 
-        # Get card details from database
-        cards = Card.objects.filter(id__in=card_ids).select_related('issuer')
-        if not cards.exists():
-            return Response({'error': 'No valid cards found for user'}, status=400)
+    # Get RAG tools if configured, limited to the collections with the wallet's documents
+    rag_scope = get_cards_rag_scope(card_ids)
+    tools = get_rag_tools(rag_scope.collection_ids(card_ids) if rag_scope else None)
+    collection_id = getattr(settings, 'CARD_BENEFITS_COLLECTION_ID', None)
+    # Use grok-4 if we have RAG tools, grok-3 otherwise
+    model = "grok-4" if tools else "grok-3"
+    prefetch_mode = rag_prefetch_enabled()
+
+    # Repeat analyses (same wallet, category and store) are replayed from cache
+    cache_key = analysis_fingerprint(
+        'streaming', card_ids, analysis_category, store_name, store_address,
+        prompt_version=STREAMING_ANALYSIS_PROMPT_VERSION + ("-prefetch" if prefetch_mode else ""),
+        collection_version=rag_scope.version_tag(card_ids) if rag_scope else None,
+        model=model
+    )
+    cached_content = get_cached_analysis(cache_key)
+
+    # On a miss in RAG prefetch mode, start the document searches now so they overlap
+    # with the remaining database work (card names come from the in-memory matrix)
+    matrix = get_reward_matrix()
+    prefetch = None
+    if cached_content is None:
+        prefetch = start_card_prefetch(
+            [{'id': card_id, **matrix.cards[card_id]} for card_id in card_ids if card_id in matrix.cards],
+            category=analysis_category,
+            scope=rag_scope
+        )
 
-        # Get reward information for each card
-        card_data = []
-        for card in cards:
-            reward_categories = RewardCategory.objects.filter(card=card).select_related('merchant_category')
-
-            card_info = {
-                'id': str(card.id),
-                'name': card.name,
-                'issuer': card.issuer.name,
-                'base_point_value': float(card.base_point_value) if card.base_point_value else None,
-                'rewards': []
-            }
-
-            for rc in reward_categories:
-                try:
-                    rate = rc.rewardrate
-                    reward_info = {
-                        'category': rc.merchant_category.name,
-                        'cashback_percentage': float(rate.cashback_percentage) if rate.cashback_percentage else None,
-                        'points': rate.points if rate.points else None,
-                        'reset_period': rate.reset_period if rate.reset_period else None,
-                        'limit': float(rate.limit) if rate.limit else None
-                    }
-                    card_info['rewards'].append(reward_info)
-                except RewardRate.DoesNotExist:
-                    continue
-
-            card_data.append(card_info)
+    # Get card details and reward information (cached per card)
+    card_data = get_card_profiles(card_ids)
+    if not card_data:
+        return None, ({'error': 'No valid cards found for user'}, 400)
+
+    # Ranking from the reward tables (same as get_card_benefits_by_types),
+    # sent before xAI is contacted and refined by the LLM stream
+    provisional_ranking = matrix.rank_cards(card_ids, category_names)
+
+    return {
+        'stream_format': stream_format,
+        'structured': stream_format == 'events',
+        'card_data': card_data,
+        'analysis_category': analysis_category,
+        'store_name': store_name,
+        'store_address': store_address,
+        'provisional_ranking': provisional_ranking,
+        'tools': tools,
+        'collection_id': collection_id,
+        'model': model,
+        'system_prompt': STREAMING_ANALYSIS_PREFETCH_SYSTEM_PROMPT if prefetch_mode else STREAMING_ANALYSIS_SYSTEM_PROMPT,
+        # Only started on a cache miss, and waited for inside the stream (see collect_rag_context)
+        'prefetch': prefetch,
+        'rag_context': None,
+        # A response generated without every card's documents isn't cached
+        'cacheable': True,
+        'cache_key': cache_key,
+        'cached_content': cached_content,
+    }, None
+
+
+def collect_rag_context(context):
+    """
+    Wait for a request's RAG prefetch and record the retrieved context.
 
-        # Use the matched category name for the analysis
-        analysis_category = matched_category_name if matched_category_name else types[0]
+    Called from inside the event stream, so the response headers (and the
+    provisional ranking) are sent before the searches are waited for.
 
-        # Prepare prompt for GPT using streaming helper function
-        prompt = build_gpt_streaming_analysis_prompt(
-            card_data=card_data,
-            analysis_category=analysis_category,
-            store_name=store_name,
-            store_address=store_address
-        )
+    Args:
+        context: Context dict from prepare_streaming_analysis() or prepare_card_details()
+
+    Returns:
+        str: The retrieved context, or None when no prefetch was started
+    """
+    prefetch = context.pop('prefetch', None)
+    if prefetch is not None:
+        context['rag_context'], context['cacheable'] = prefetch.collect()
+    return context['rag_context']
+
+
+def log_rag_status(context, card_names):
+    """Log whether RAG tools or pre-retrieved context are attached to a request"""
+    if context['tools']:
+        print(f"✅ RAG enabled - Collection ID: {context['collection_id']}")
+        print(f"📚 RAG will search PDFs for: {', '.join(card_names)}")
+    elif context['rag_context'] is not None:
+        print(f"✅ RAG prefetch - {len(context['rag_context'])} characters of context for: {', '.join(card_names)}")
+    else:
+        print(f"⚠️  RAG disabled - No collection ID configured")
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def analyze_cards_with_gpt_streaming(request):
+    """
+    Analyze user's credit cards for a specific category using GPT API with streaming.
+    Sends a provisional ranking from the reward tables first, then streams the
+    GPT ranking and full analysis.
+
+    Expects query parameters:
+    - types: list of category types (e.g., ?types=restaurant&types=pharmacy)
+    - store_name: name of the store/merchant (optional)
+    - store_address: address of the store/merchant (optional)
+    - stream_format: "chunks" (default) or "events" for typed ranking /
+      card_analysis / done events (optional)
+    """
+    try:
+        context, error = prepare_streaming_analysis(request.user, request.query_params)
+        if error:
+            return Response(error[0], status=error[1])
+
+        structured = context['structured']
+        provisional_ranking = context['provisional_ranking']
+        cache_key = context['cache_key']
+        cached_content = context['cached_content']
+        if cached_content is not None:
+            print(f"⚡ Replaying cached GPT streaming analysis - {len(cached_content)} characters")
+            replay = replay_cached_stream(cached_content, analysis_stream_parser(), structured)
+            return sse_response(with_provisional_ranking(provisional_ranking, replay))
 
         # Initialize Grok client
         if not os.environ.get('XAI_API_KEY'):
             return Response({'error': 'Grok API key not configured'}, status=500)
 
-        client = Client()
-
-        # Get RAG tools if configured
-        tools = get_rag_tools()
-        if tools:
-            print(f"✅ RAG enabled - Collection ID: {getattr(settings, 'CARD_BENEFITS_COLLECTION_ID', None)}")
-            print(f"📚 RAG will search PDFs for: {', '.join([card['name'] for card in card_data])}")
-        else:
-            print(f"⚠️  RAG disabled - No collection ID configured")
+        client = get_xai_client()
+        tools = context['tools']
+        model = context['model']
 
         def event_stream():
             """Generator function for Server-Sent Events"""
             try:
-                # Use grok-4 if we have RAG tools, grok-3 otherwise
-                model = "grok-4" if tools else "grok-3"
+                # Prepare prompt for GPT using streaming helper function
+                prompt = build_gpt_streaming_analysis_prompt(
+                    card_data=context['card_data'],
+                    analysis_category=context['analysis_category'],
+                    store_name=context['store_name'],
+                    store_address=context['store_address'],
+                    rag_context=collect_rag_context(context)
+                )
+                log_rag_status(context, [card['name'] for card in context['card_data']])
+
                 print(f"🔄 Starting stream with model: {model}, RAG tools: {bool(tools)}")
 
                 # Call Grok API with streaming enabled
                 chat = client.chat.create(
                     model=model,
                     messages=[
-                        system("You are a credit card expert who provides detailed, accurate analysis of credit card benefits. CRITICAL: Use the collections_search tool to look up official card benefit documentation for accurate, up-to-date information. Always prioritize information from official documents over general knowledge. Always respond with valid JSON."),
+                        system(context['system_prompt']),
                         xai_user(prompt)
                     ],
                     tools=tools if tools else None
                 )
 
-                accumulated_content = ""
-
-                # Stream the response
-                for response, chunk in chat.stream():
-                    if chunk.content:
-                        accumulated_content += chunk.content
-                        # Send chunk as SSE (Server-Sent Event)
-                        yield f"data: {json.dumps({'chunk': chunk.content})}\n\n"
+                # Stream the response as SSE (Server-Sent Events)
+                parser = analysis_stream_parser()
+                response = yield from relay_chat_stream(chat, parser, structured)
+                accumulated_content = parser.full_text()
 
                 # Log if RAG tool was used (check final response)
                 if tools and hasattr(response, 'tool_calls') and response.tool_calls:
                     print(f"🔍 RAG tool was invoked {len(response.tool_calls)} time(s)")
 
                 # Send completion signal
-                yield f"data: {json.dumps({'done': True, 'full_response': accumulated_content})}\n\n"
+                yield done_event(accumulated_content, structured)
 
                 print(f"✅ GPT Streaming Analysis complete - streamed {len(accumulated_content)} characters")
                 print(accumulated_content)
+                if context['cacheable']:
+                    cache_streamed_analysis(cache_key, accumulated_content)
 
             except Exception as e:
                 print(f"❌ Error in streaming: {str(e)}")
                 import traceback
                 traceback.print_exc()
-                error_data = json.dumps({'error': str(e)})
-                yield f"data: {error_data}\n\n"
+                yield sse_event({'error': str(e)})
 
-        # Return StreamingHttpResponse with SSE
-        response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
-        response['Cache-Control'] = 'no-cache'
-        response['X-Accel-Buffering'] = 'no'
-        return response
+        # Identical concurrent requests (in the same format) share one upstream stream
+        stream = coalesced_stream(f"{cache_key}:{context['stream_format']}", event_stream)
+        return sse_response(with_provisional_ranking(provisional_ranking, stream))
 
     except Exception as e:
         print(f"❌ Error in GPT streaming analysis: {str(e)}")
@@ -525,6 +683,112 @@ def analyze_cards_with_gpt_streaming(request):
         }, status=500)
 
 
+def cache_streamed_analysis(cache_key, content):
+    """Cache a streamed analysis if it holds a complete, well-formed JSON object (fences are dropped)"""
+    parsed = extract_json_document(content)
+    if parsed is None:
+        print("⚠️  Streamed response is not valid JSON - not caching")
+        return
+    set_cached_analysis(cache_key, json.dumps(parsed))
+
+
+def prepare_card_details(card_id, query_params):
+    """
+    Do all the database work for a card details stream before any LLM call.
+
+    Shared by the sync view below and the async view in async_views.py.
+
+    Args:
+        card_id: UUID of the card model
+        query_params: Request query parameters (stream_format)
+
+    Returns:
+        tuple: (context dict, None) on success, or (None, (error dict, status)) on failure
+    """
+    print(f"🤖 GPT Card Details Streaming - Card ID: {card_id}")
+    stream_format = query_params.get('stream_format', 'chunks')
+    if stream_format not in STREAM_FORMATS:
+        return None, ({'error': f'"stream_format" must be one of {", ".join(STREAM_FORMATS)}.'}, 400)
+
+    # Get card and reward information (cached per card)
+    card_data = get_card_profile(card_id)
+    if card_data is None:
+        return None, ({'error': f'Card with id {card_id} not found'}, 404)
+
+    print(f"📇 Found card: {card_data['name']} by {card_data['issuer']}")
+    print(f"📊 Card has {len(card_data['rewards'])} reward categories")
+
+    # Get RAG tools if configured, limited to the collections with the card's documents
+    rag_scope = get_cards_rag_scope([card_id])
+    tools = get_rag_tools(rag_scope.collection_ids([card_id]) if rag_scope else None)
+    collection_id = getattr(settings, 'CARD_BENEFITS_COLLECTION_ID', None)
+    # Use grok-4 if we have RAG tools, grok-3 otherwise
+    model = "grok-4" if tools else "grok-3"
+
+    # Details generated from the same card data and documents are served from the store
+    reward_version = reward_data_version(card_data)
+    collection_version = rag_scope.version_tag([card_id]) if rag_scope else None
+    document = get_card_details_document(card_id, reward_version, collection_version, model)
+
+    # Only search the card's documents (RAG prefetch mode) if Grok is going to be called
+    prefetch = start_card_prefetch([card_data], scope=rag_scope) if document is None else None
+
+    return {
+        'stream_format': stream_format,
+        'structured': stream_format == 'events',
+        'card_data': card_data,
+        'tools': tools,
+        'collection_id': collection_id,
+        'model': model,
+        'reward_version': reward_version,
+        'collection_version': collection_version,
+        'document': document,
+        'system_prompt': CARD_DETAILS_PREFETCH_SYSTEM_PROMPT if rag_prefetch_enabled() else CARD_DETAILS_SYSTEM_PROMPT,
+        # Waited for inside the stream (see collect_rag_context)
+        'prefetch': prefetch,
+        'rag_context': None,
+        # Details generated without the card's documents aren't stored
+        'cacheable': True,
+    }, None
+
+
+def stored_card_details_response(request, document):
+    """
+    Build the non-streaming response for a stored card details document.
+
+    Args:
+        request: The incoming request (If-None-Match and Accept are checked)
+        document: Up-to-date CardDetailsDocument
+
+    Returns:
+        HttpResponse: 304 if the client's ETag matches, the stored JSON if the
+        client asked for application/json, otherwise None (replay it as SSE)
+    """
+    accept = request.META.get('HTTP_ACCEPT', '')
+    if etag_matches(request.META.get('HTTP_IF_NONE_MATCH'), document):
+        response = HttpResponseNotModified()
+    elif 'application/json' in accept and 'text/event-stream' not in accept:
+        response = JsonResponse(document.content, encoder=JSONEncoder, safe=False)
+    else:
+        return None
+    response['ETag'] = etag_header(document)
+    return response
+
+
+def card_details_flight_key(card_id, context):
+    """Single-flight key of a card details stream (same card, data versions and format)"""
+    return f"card_details:{card_id}:{context['reward_version']}:{context['collection_version']}:{context['stream_format']}"
+
+
+def save_streamed_card_details(context, card_id, content):
+    """Store a streamed card details response for later requests"""
+    if not context['cacheable']:
+        return
+    save_card_details_document(
+        card_id, content, context['reward_version'], context['collection_version'], context['model']
+    )
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_card_details_streaming(request, card_id):
@@ -533,109 +797,82 @@ def get_card_details_streaming(request, card_id):
 
     Expects URL parameter:
     - card_id: UUID of the card model
-    """
-    try:
-        print(f"🤖 GPT Card Details Streaming - Card ID: {card_id}")
-
-        # Get card from database
-        try:
-            card = Card.objects.select_related('issuer').get(id=card_id)
-        except Card.DoesNotExist:
-            return Response({'error': f'Card with id {card_id} not found'}, status=404)
 
-        print(f"📇 Found card: {card.name} by {card.issuer.name}")
+    Optional query parameter:
+    - stream_format: "chunks" (default) or "events" for a typed card_details event
 
-        # Get reward information for the card
-        reward_categories = RewardCategory.objects.filter(card=card).select_related('merchant_category')
-
-        card_data = {
-            'id': str(card.id),
-            'name': card.name,
-            'issuer': card.issuer.name,
-            'base_point_value': float(card.base_point_value) if card.base_point_value else None,
-            'rewards': []
-        }
-
-        for rc in reward_categories:
-            try:
-                rate = rc.rewardrate
-                reward_info = {
-                    'category': rc.merchant_category.name,
-                    'cashback_percentage': float(rate.cashback_percentage) if rate.cashback_percentage else None,
-                    'points': rate.points if rate.points else None,
-                    'reset_period': rate.reset_period if rate.reset_period else None,
-                    'limit': float(rate.limit) if rate.limit else None
-                }
-                card_data['rewards'].append(reward_info)
-            except RewardRate.DoesNotExist:
-                continue
-
-        print(f"📊 Card has {len(card_data['rewards'])} reward categories")
-
-        # Prepare prompt for GPT
-        prompt = build_card_details_prompt(card_data)
+    Details are generated once per card and version and then served from the
+    store: replayed as SSE, or as plain JSON for "Accept: application/json".
+    Responses carry an ETag and honor If-None-Match.
+    """
+    try:
+        context, error = prepare_card_details(card_id, request.query_params)
+        if error:
+            return Response(error[0], status=error[1])
+
+        card_data = context['card_data']
+        structured = context['structured']
+
+        document = context['document']
+        if document is not None:
+            print(f"⚡ Serving stored card details for {card_data['name']}")
+            response = stored_card_details_response(request, document)
+            if response is None:
+                replay = replay_cached_stream(json.dumps(document.content), card_details_stream_parser(), structured)
+                response = sse_response(replay)
+                response['ETag'] = etag_header(document)
+            return response
 
         # Initialize Grok client
         if not os.environ.get('XAI_API_KEY'):
             return Response({'error': 'Grok API key not configured'}, status=500)
 
-        client = Client()
-
-        # Get RAG tools if configured
-        tools = get_rag_tools()
-        if tools:
-            print(f"✅ RAG enabled - Collection ID: {getattr(settings, 'CARD_BENEFITS_COLLECTION_ID', None)}")
-            print(f"📚 RAG will search PDFs for: {card_data['name']}")
-        else:
-            print(f"⚠️  RAG disabled - No collection ID configured")
+        client = get_xai_client()
+        tools = context['tools']
+        model = context['model']
 
         def event_stream():
             """Generator function for Server-Sent Events"""
             try:
-                # Use grok-4 if we have RAG tools, grok-3 otherwise
-                model = "grok-4" if tools else "grok-3"
+                # Prepare prompt for GPT
+                prompt = build_card_details_prompt(card_data, rag_context=collect_rag_context(context))
+                log_rag_status(context, [card_data['name']])
+
                 print(f"🔄 Starting stream with model: {model}, RAG tools: {bool(tools)}")
 
                 # Call Grok API with streaming enabled
                 chat = client.chat.create(
                     model=model,
                     messages=[
-                        system("You are a credit card expert who provides detailed, accurate information about credit card benefits and features. CRITICAL: Use the collections_search tool to look up official card benefit documentation for accurate, up-to-date information. Always prioritize information from official documents over general knowledge. Always respond with valid JSON."),
+                        system(context['system_prompt']),
                         xai_user(prompt)
                     ],
                     tools=tools if tools else None
                 )
 
-                accumulated_content = ""
-
-                # Stream the response
-                for response, chunk in chat.stream():
-                    if chunk.content:
-                        accumulated_content += chunk.content
-                        # Send chunk as SSE (Server-Sent Event)
-                        yield f"data: {json.dumps({'chunk': chunk.content})}\n\n"
+                # Stream the response as SSE (Server-Sent Events)
+                parser = card_details_stream_parser()
+                response = yield from relay_chat_stream(chat, parser, structured)
+                accumulated_content = parser.full_text()
 
                 # Log if RAG tool was used (check final response)
                 if tools and hasattr(response, 'tool_calls') and response.tool_calls:
                     print(f"🔍 RAG tool was invoked {len(response.tool_calls)} time(s)")
 
                 # Send completion signal
-                yield f"data: {json.dumps({'done': True, 'full_response': accumulated_content})}\n\n"
+                yield done_event(accumulated_content, structured)
 
                 print(f"✅ GPT Card Details Streaming complete - streamed {len(accumulated_content)} characters")
+                save_streamed_card_details(context, card_id, accumulated_content)
 
             except Exception as e:
                 print(f"❌ Error in streaming: {str(e)}")
                 import traceback
                 traceback.print_exc()
-                error_data = json.dumps({'error': str(e)})
-                yield f"data: {error_data}\n\n"
-
-        # Return StreamingHttpResponse with SSE
-        response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
-        response['Cache-Control'] = 'no-cache'
-        response['X-Accel-Buffering'] = 'no'
-        return response
+                yield sse_event({'error': str(e)})
+
+        # Concurrent misses for the same card (in the same format) share one upstream stream
+        return sse_response(coalesced_stream(card_details_flight_key(card_id, context), event_stream))
 
     except Exception as e:
         print(f"❌ Error in card details streaming: {str(e)}")
@@ -0,0 +1,283 @@
+"""
+Process-wide registry of xAI clients.
+
+Building an xai_sdk Client opens new gRPC channels, so every request that
+created its own client paid for a TLS handshake before the first token. The
+registry keeps a small pool of clients per process and hands them out
+round-robin; gRPC clients are thread-safe, so requests (and single-flight
+stream threads) share them freely. Spreading load over several channels keeps
+many concurrent streams from queueing on one HTTP/2 connection.
+
+Clients are health-checked on checkout at most every
+XAI_CLIENT_HEALTH_CHECK_INTERVAL seconds and replaced if their channel can't
+reconnect. Workers warm the pool at boot (see post_worker_init in
+gunicorn.conf.py) so the first request finds connected channels.
+
+Async views share one AsyncClient per event loop. Its grpc.aio channels are
+bound to that loop, so it is warmed and closed by the ASGI lifespan events of
+the worker's serving loop (see asgi.py).
+"""
+import asyncio
+import itertools
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import grpc
+from django.conf import settings
+from xai_sdk import Client, AsyncClient
+
+
+def _pool_size():
+    return max(1, int(getattr(settings, 'XAI_CLIENT_POOL_SIZE', 2)))
+
+
+def _api_keys():
+    """Return (api_key, management_api_key), raising if XAI_API_KEY is not set"""
+    api_key = os.environ.get('XAI_API_KEY')
+    if not api_key:
+        raise ValueError('XAI_API_KEY environment variable not set')
+
+    # Use XAI_MANAGEMENT_API_KEY if available, otherwise use XAI_API_KEY for both
+    return api_key, os.environ.get('XAI_MANAGEMENT_API_KEY', api_key)
+
+
+def api_channel(client):
+    """
+    Get the gRPC channel of a client's API calls.
+
+    xai_sdk has no public accessor for it, so this reads the private attribute
+    of the SDK versions allowed by requirements.txt.
+
+    Returns:
+        The client's API channel, or None if this SDK version keeps it elsewhere
+    """
+    channel = getattr(client, '_api_channel', None)
+    if channel is None:
+        print("⚠️  xai_sdk client has no _api_channel - skipping channel health checks")
+    return channel
+
+
+class PooledClient:
+    """A pooled Client and when its channel was last known to be healthy"""
+
+    def __init__(self):
+        api_key, management_api_key = _api_keys()
+        self.client = Client(api_key=api_key, management_api_key=management_api_key)
+        self.checked_at = 0.0
+
+    def is_healthy(self, timeout):
+        """
+        Wait for the client's API channel to be connected.
+
+        Connects an idle channel, so this also warms it.
+
+        Args:
+            timeout: Seconds to wait for the channel to become ready
+
+        Returns:
+            bool: True if the channel is ready (or can't be checked with this SDK version)
+        """
+        channel = api_channel(self.client)
+        if channel is not None:
+            try:
+                grpc.channel_ready_future(channel).result(timeout=timeout)
+            except grpc.FutureTimeoutError:
+                return False
+        self.checked_at = time.monotonic()
+        return True
+
+    def close(self):
+        try:
+            self.client.close()
+        except Exception as e:
+            print(f"⚠️  Error closing xAI client: {str(e)}")
+
+
+class XAIClientPool:
+    """Round-robin pool of xAI clients with periodic health checks"""
+
+    def __init__(self, size):
+        self.size = size
+        self._clients = [None] * size
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def _slot(self, index):
+        """Return the client in a slot, creating it on first use"""
+        pooled = self._clients[index]
+        if pooled is None:
+            with self._lock:
+                pooled = self._clients[index]
+                if pooled is None:
+                    pooled = PooledClient()
+                    self._clients[index] = pooled
+        return pooled
+
+    def _replace(self, index, pooled):
+        """Swap out an unhealthy client (unless another thread already did)"""
+        with self._lock:
+            if self._clients[index] is pooled:
+                print(f"♻️  Replacing unhealthy xAI client in slot {index}")
+                replacement = PooledClient()
+                # Don't re-check (and block on) the new channel until the next interval
+                replacement.checked_at = time.monotonic()
+                self._clients[index] = replacement
+                pooled.close()
+            return self._clients[index]
+
+    def get(self):
+        """
+        Check out a client.
+
+        Returns:
+            xai_sdk.Client: A client whose channel passed a recent health check
+        """
+        index = next(self._counter) % self.size
+        pooled = self._slot(index)
+
+        interval = getattr(settings, 'XAI_CLIENT_HEALTH_CHECK_INTERVAL', 60)
+        if time.monotonic() - pooled.checked_at > interval:
+            timeout = getattr(settings, 'XAI_CLIENT_HEALTH_CHECK_TIMEOUT', 5)
+            if not pooled.is_healthy(timeout):
+                pooled = self._replace(index, pooled)
+        return pooled.client
+
+    def warm(self):
+        """
+        Create and connect every client in the pool.
+
+        Returns:
+            int: Number of clients whose channel connected
+        """
+        timeout = getattr(settings, 'XAI_CLIENT_HEALTH_CHECK_TIMEOUT', 5)
+        clients = [self._slot(index) for index in range(self.size)]
+        # Connect the channels in parallel so boot waits at most one timeout
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            return sum(executor.map(lambda pooled: pooled.is_healthy(timeout), clients))
+
+    def close(self):
+        with self._lock:
+            for pooled in self._clients:
+                if pooled is not None:
+                    pooled.close()
+            self._clients = [None] * self.size
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# grpc.aio channels belong to the event loop they were created on
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_client_pool():
+    """Return this process's client pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = XAIClientPool(_pool_size())
+    return _pool
+
+
+def get_xai_client():
+    """
+    Get a shared xAI client for chat and collections calls.
+
+    Returns:
+        xai_sdk.Client: Pooled client (do not close it)
+
+    Raises:
+        ValueError: If XAI_API_KEY is not set
+    """
+    return get_client_pool().get()
+
+
+def get_async_xai_client():
+    """
+    Get the shared async xAI client for the running event loop.
+
+    Must be called from a coroutine.
+
+    Returns:
+        xai_sdk.AsyncClient: Client reused by every request on this loop
+
+    Raises:
+        ValueError: If XAI_API_KEY is not set
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        api_key, management_api_key = _api_keys()
+        client = AsyncClient(api_key=api_key, management_api_key=management_api_key)
+        _async_clients[loop] = client
+    return client
+
+
+async def warm_async_xai_client():
+    """
+    Create and connect the running event loop's async client (e.g., at ASGI lifespan startup).
+
+    Does nothing if XAI_API_KEY is not set; connection failures are logged,
+    not raised.
+    """
+    if not os.environ.get('XAI_API_KEY'):
+        print("⚠️  XAI_API_KEY not set - skipping async xAI client warm-up")
+        return
+
+    started = time.monotonic()
+    try:
+        channel = api_channel(get_async_xai_client())
+        if channel is not None:
+            timeout = getattr(settings, 'XAI_CLIENT_HEALTH_CHECK_TIMEOUT', 5)
+            await asyncio.wait_for(channel.channel_ready(), timeout=timeout)
+    except Exception as e:
+        print(f"⚠️  Async xAI client warm-up failed: {str(e) or type(e).__name__}")
+        return
+    elapsed = time.monotonic() - started
+    print(f"🔥 Warmed async xAI client in {elapsed:.2f}s")
+
+
+async def close_async_xai_client():
+    """Close the running event loop's async client (e.g., at ASGI lifespan shutdown)"""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is None:
+        return
+    try:
+        await client.close()
+    except Exception as e:
+        print(f"⚠️  Error closing async xAI client: {str(e)}")
+
+
+def warm_xai_clients():
+    """
+    Connect the client pool ahead of the first request (e.g., at worker boot).
+
+    Does nothing if XAI_API_KEY is not set; connection failures are logged,
+    not raised, and the clients retry on checkout.
+    """
+    if not os.environ.get('XAI_API_KEY'):
+        print("⚠️  XAI_API_KEY not set - skipping xAI client warm-up")
+        return
+
+    pool = get_client_pool()
+    started = time.monotonic()
+    try:
+        ready = pool.warm()
+    except Exception as e:
+        print(f"⚠️  xAI client warm-up failed: {str(e)}")
+        return
+    elapsed = time.monotonic() - started
+    print(f"🔥 Warmed {ready}/{pool.size} xAI clients in {elapsed:.2f}s")
+
+
+def close_xai_clients():
+    """Close every pooled client (e.g., at worker exit)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
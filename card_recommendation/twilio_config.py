@@ -1,7 +1,12 @@
 """ Configures Twilio module """
+import logging
 import os
+from twilio.http import HttpClient
+from twilio.http.response import Response
 from twilio.rest import Client
 
+from http_client import get_http_client
+
 environment = os.getenv('ENVIRONMENT')
 
 class TwilioTestClient:
@@ -25,6 +30,26 @@ class TwilioTestClientMessages:
             'body': body
         })
 
+class PooledTwilioHttpClient(HttpClient):
+    """ Sends Twilio API requests through the shared outbound HTTP client """
+
+    def __init__(self):
+        super().__init__(logging.getLogger('twilio.http_client'), False)
+
+    def request(self, method, url, params=None, data=None, headers=None, auth=None,
+                timeout=None, allow_redirects=False):
+        """ Makes a Twilio API request (pooled, with timeouts and retries) """
+        kwargs = {'params': params, 'headers': headers, 'auth': auth, 'allow_redirects': allow_redirects}
+        if headers and headers.get('Content-Type') in ('application/json', 'application/scim+json'):
+            kwargs['json'] = data
+        else:
+            kwargs['data'] = data
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+        response = get_http_client().request(method, url, **kwargs)
+        self._test_only_last_response = Response(int(response.status_code), response.text, response.headers)
+        return self._test_only_last_response
+
 account_sid = os.environ.get('TWILIO_ACCOUNT_SID')
 auth_token = os.environ.get('TWILIO_AUTH_TOKEN')
 twilio_phone_number = os.environ.get('TWILIO_PHONE_NUMBER')
@@ -32,4 +57,4 @@ twilio_phone_number = os.environ.get('TWILIO_PHONE_NUMBER')
 if environment == 'local' or not account_sid or not auth_token:
     twilio_client = TwilioTestClient(account_sid, auth_token)
 else:
-    twilio_client = Client(account_sid, auth_token)
+    twilio_client = Client(account_sid, auth_token, http_client=PooledTwilioHttpClient())
@@ -1,8 +1,10 @@
 from django.contrib import admin
 
-from users.models import User, UserCard, PhoneAuthentication
+from users.models import User, UserCard, PhoneAuthentication, Place, PlaceTile
 
 # Register your models here.
 admin.site.register(User)
 admin.site.register(UserCard)
 admin.site.register(PhoneAuthentication)
+admin.site.register(Place)
+admin.site.register(PlaceTile)
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:13
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Place',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('place_id', models.CharField(max_length=255, unique=True)),
+                ('name', models.CharField(max_length=255)),
+                ('types', models.JSONField(default=list)),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('address', models.CharField(blank=True, max_length=255)),
+                ('geohash', models.CharField(db_index=True, max_length=12)),
+                ('fetched_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PlaceTile',
+            fields=[
+                ('geohash', models.CharField(max_length=12, primary_key=True, serialize=False)),
+                ('fetched_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -66,3 +66,27 @@ class PhoneAuthentication(models.Model):
     code = models.CharField(max_length=6, default=random_code)
     is_verified = models.BooleanField(default=False)
     proxy_uuid = models.UUIDField(default=uuid4)
+
+class Place(models.Model):
+    """Store returned by a Google Places nearby search"""
+    id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
+    place_id = models.CharField(max_length=255, unique=True)
+    name = models.CharField(max_length=255)
+    types = models.JSONField(default=list)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    address = models.CharField(max_length=255, blank=True)
+    # Geohash of the location (see users/places.py); cells are prefixes of it
+    geohash = models.CharField(max_length=12, db_index=True)
+    fetched_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} ({self.address})"
+
+class PlaceTile(models.Model):
+    """Geohash cell whose Places search results are stored in Place"""
+    geohash = models.CharField(max_length=12, primary_key=True)
+    fetched_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.geohash} ({self.fetched_at:%Y-%m-%d %H:%M})"
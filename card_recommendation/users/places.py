@@ -0,0 +1,700 @@
+"""
+Google Places nearby search with a geohash tile cache.
+
+Users asking for nearby stores are rarely far apart (the same mall, the same
+street, the same user a few seconds later), but their coordinates never
+match exactly. Instead of searching around each query point, the world is cut
+into geohash cells:
+
+- the cell size (geohash precision) is picked from the query radius, so a
+  query touches a handful of cells
+- each cell is searched once, around its center with a radius that covers
+  the whole cell, and the filtered store list is kept in the 'places_tiles'
+  cache (see CACHES in settings.py, which sets the TTL and LRU size)
+- the stores are also saved as Place rows and the cell as a PlaceTile, so
+  after a cache miss a cell searched within PLACES_TILE_MAX_AGE is loaded
+  from the database (Place.geohash starts with the cell's geohash) instead
+  of calling Google
+- concurrent misses for the same cell share one Places request
+  (coalesced_call, see recommendation/single_flight.py)
+- requests go through the shared outbound client (pooled, with timeouts
+  and retries, see http_client.py); with PLACES_FETCH_MODE=paged a cell's
+  first page is returned right away, while a background thread follows
+  next_page_token and runs extra type-filtered searches concurrently,
+  within PLACES_FETCH_BUDGET seconds, then re-caches and saves the cell
+
+A query's stores are assembled from the cells its circle touches. Distances
+from the query point are computed for all of them at once with NumPy, and
+the nearest stores within the radius are picked with a heap.
+"""
+import heapq
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from http_client import get_http_client
+
+from recommendation.single_flight import coalesced_call
+from users.models import Place, PlaceTile
+
+GOOGLE_PLACES_API_KEY = os.environ.get('GOOGLE_PLACES_API_KEY')
+PLACES_NEARBY_URL = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
+
+PLACES_TILE_CACHE_ALIAS = 'places_tiles'
+# Bump when the cached store format changes
+PLACES_TILE_FORMAT_VERSION = 2
+# Geohash precision stored on Place rows (~5 m cells)
+PLACE_GEOHASH_PRECISION = 9
+# Stores returned by find_nearby_stores
+NEARBY_STORES_LIMIT = 8
+
+# Places statuses that mean the response is complete (and can be cached)
+CACHEABLE_STATUSES = {"OK", "ZERO_RESULTS"}
+# Largest radius Places accepts, in meters
+PLACES_MAX_RADIUS = 50000
+# Seconds before a next_page_token becomes valid, and between retries while it is not
+NEXT_PAGE_DELAY = 2.0
+NEXT_PAGE_RETRY_DELAY = 0.5
+# Cells whose paged search is completed in the background at the same time
+BACKGROUND_SEARCH_WORKERS = 4
+
+EARTH_RADIUS_MILES = 3958.8
+EARTH_RADIUS_METERS = 6371008.8
+METERS_PER_MILE = 1609.344
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+_background_executor = None
+_background_executor_lock = threading.Lock()
+# Background saves take turns (SQLite allows one writer at a time)
+_background_store_lock = threading.Lock()
+
+
+def haversine_distance(lat1, lng1, lat2, lng2):
+    # Radius of Earth in miles
+    R = EARTH_RADIUS_MILES
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    delta_phi = math.radians(lat2 - lat1)
+    delta_lambda = math.radians(lng2 - lng1)
+
+    a = math.sin(delta_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2) ** 2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return R * c
+
+
+def haversine_distances(lat, lng, lats, lngs):
+    """
+    Distances in miles from one point to many (vectorized haversine_distance).
+
+    Args:
+        lat: Latitude of the origin
+        lng: Longitude of the origin
+        lats: Array of latitudes
+        lngs: Array of longitudes
+
+    Returns:
+        np.ndarray: Distances in miles
+    """
+    phi1 = math.radians(lat)
+    phi2 = np.radians(lats)
+    delta_phi = phi2 - phi1
+    delta_lambda = np.radians(lngs) - math.radians(lng)
+
+    a = np.sin(delta_phi / 2) ** 2 + math.cos(phi1) * np.cos(phi2) * np.sin(delta_lambda / 2) ** 2
+    return EARTH_RADIUS_MILES * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def filter_types(types):
+    return 'point_of_interest' in types and 'establishment' in types and len(types) > 2
+
+
+def geohash_encode(lat, lng, precision):
+    """
+    Geohash of a point.
+
+    Args:
+        lat: Latitude in degrees
+        lng: Longitude in degrees
+        precision: Number of base32 characters
+
+    Returns:
+        str: Geohash of the cell containing the point
+    """
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        # Bits alternate between longitude (even) and latitude (odd)
+        coordinate, bounds = (lng, lng_range) if even else (lat, lat_range)
+        middle = (bounds[0] + bounds[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            bounds[0] = middle
+        else:
+            bounds[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def geohash_bounds(geohash):
+    """
+    Bounding box of a geohash cell.
+
+    Returns:
+        tuple: (lat_min, lat_max, lng_min, lng_max)
+    """
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = _BASE32.index(char)
+        for shift in range(4, -1, -1):
+            bounds = lng_range if even else lat_range
+            middle = (bounds[0] + bounds[1]) / 2
+            if value >> shift & 1:
+                bounds[0] = middle
+            else:
+                bounds[1] = middle
+            even = not even
+    return lat_range[0], lat_range[1], lng_range[0], lng_range[1]
+
+
+def cell_size_degrees(precision):
+    """
+    Height and width of the cells at a geohash precision.
+
+    Returns:
+        tuple: (lat_span, lng_span) in degrees
+    """
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def tile_precision(lat, radius):
+    """
+    Pick the finest geohash precision whose cells are at least as tall and wide as the radius.
+
+    Args:
+        lat: Latitude of the query (cells narrow towards the poles)
+        radius: Query radius in meters
+
+    Returns:
+        int: Geohash precision (1-8)
+    """
+    meters_per_degree = math.pi * EARTH_RADIUS_METERS / 180
+    for precision in range(8, 0, -1):
+        lat_span, lng_span = cell_size_degrees(precision)
+        height = lat_span * meters_per_degree
+        width = lng_span * meters_per_degree * math.cos(math.radians(lat))
+        if min(height, width) >= radius:
+            return precision
+    return 1
+
+
+def _distance_to_cell(lat, lng, geohash):
+    """Miles from a point to the nearest point of a cell (0 inside it)"""
+    lat_min, lat_max, lng_min, lng_max = geohash_bounds(geohash)
+    return haversine_distance(
+        lat, lng,
+        min(max(lat, lat_min), lat_max),
+        min(max(lng, lng_min), lng_max),
+    )
+
+
+def covering_tiles(lat, lng, radius):
+    """
+    Geohash cells touched by a query circle, nearest first.
+
+    Args:
+        lat: Query latitude
+        lng: Query longitude
+        radius: Query radius in meters
+
+    Returns:
+        list: Geohashes
+    """
+    radius_miles = radius / METERS_PER_MILE
+    precision = tile_precision(lat, radius)
+    lat_span, lng_span = cell_size_degrees(precision)
+    lat_min, lat_max, lng_min, lng_max = geohash_bounds(geohash_encode(lat, lng, precision))
+    center_lat, center_lng = (lat_min + lat_max) / 2, (lng_min + lng_max) / 2
+
+    # Cells are at least as big as the radius, so the circle stays within the 3x3 block
+    tiles = {}
+    for i in (-1, 0, 1):
+        cell_lat = center_lat + i * lat_span
+        if not -90 < cell_lat < 90:
+            continue
+        for j in (-1, 0, 1):
+            cell_lng = (center_lng + j * lng_span + 180) % 360 - 180
+            geohash = geohash_encode(cell_lat, cell_lng, precision)
+            if geohash in tiles:
+                continue
+            distance = _distance_to_cell(lat, lng, geohash)
+            if distance <= radius_miles:
+                tiles[geohash] = distance
+    return sorted(tiles, key=tiles.get)
+
+
+def tile_search_area(geohash):
+    """
+    Center and radius of the Places search that covers a cell.
+
+    Returns:
+        tuple: (lat, lng, radius in whole meters)
+    """
+    lat_min, lat_max, lng_min, lng_max = geohash_bounds(geohash)
+    center_lat, center_lng = (lat_min + lat_max) / 2, (lng_min + lng_max) / 2
+    # Half the diagonal reaches every corner; the edge nearer the equator is the wider one
+    corner_miles = max(
+        haversine_distance(center_lat, center_lng, lat_min, lng_max),
+        haversine_distance(center_lat, center_lng, lat_max, lng_max),
+    )
+    radius = math.ceil(corner_miles * METERS_PER_MILE)
+    return center_lat, center_lng, min(max(radius, 1), PLACES_MAX_RADIUS)
+
+
+def parse_places_results(results):
+    """
+    Keep the physical stores from a Places response.
+
+    Args:
+        results: The response's "results" list
+
+    Returns:
+        list: Store dicts (place_id, name, categories, latitude, longitude, address)
+    """
+    stores = []
+    for result in results:
+        place_id = result.get("place_id")
+        name = result.get("name")
+        geometry = result.get("geometry", {})
+        location = geometry.get("location", {})
+        store_lat = location.get("lat")
+        store_lng = location.get("lng")
+        categories = result.get("types", [])
+        address = result.get("vicinity") or result.get("formatted_address", "Address not available")
+
+        if place_id and name and store_lat and store_lng and filter_types(categories):
+            stores.append({
+                "place_id": place_id,
+                "name": name,
+                "categories": categories,
+                "latitude": store_lat,
+                "longitude": store_lng,
+                "address": address,
+            })
+    return stores
+
+
+def fetch_places(lat, lng, radius, place_type=None, page_token=None):
+    """
+    Run one Places nearby search request.
+
+    Args:
+        lat: Search center latitude
+        lng: Search center longitude
+        radius: Search radius in meters
+        place_type: Optional Places type to restrict the search to
+        page_token: next_page_token of a previous response (the other arguments are then ignored)
+
+    Returns:
+        tuple: (stores from parse_places_results, Places status string, next_page_token or None)
+    """
+    if page_token:
+        url = f"{PLACES_NEARBY_URL}?pagetoken={page_token}&key={GOOGLE_PLACES_API_KEY}"
+    else:
+        url = (
+            f"{PLACES_NEARBY_URL}"
+            f"?location={lat},{lng}&radius={radius}&key={GOOGLE_PLACES_API_KEY}"
+        )
+        if place_type:
+            url += f"&type={place_type}"
+    res = get_http_client().get(url)
+    data = res.json()
+    return parse_places_results(data.get("results", [])), data.get("status"), data.get("next_page_token")
+
+
+def fetch_places_pages(lat, lng, radius, place_type=None, deadline=None):
+    """
+    Run a Places nearby search, following next_page_token until the deadline.
+
+    Args:
+        lat: Search center latitude
+        lng: Search center longitude
+        radius: Search radius in meters
+        place_type: Optional Places type to restrict the search to
+        deadline: time.monotonic() after which no further page is requested
+
+    Returns:
+        tuple: (stores from every page fetched, status of the first page)
+    """
+    stores, places_status, page_token = fetch_places(lat, lng, radius, place_type)
+    if places_status == "OK":
+        stores += follow_next_pages(lat, lng, radius, page_token, deadline)
+    return stores, places_status
+
+
+def follow_next_pages(lat, lng, radius, page_token, deadline):
+    """
+    Fetch the pages after a Places response until the deadline.
+
+    Args:
+        lat: Search center latitude
+        lng: Search center longitude
+        radius: Search radius in meters
+        page_token: next_page_token of the response (None fetches nothing)
+        deadline: time.monotonic() after which no further page is requested
+
+    Returns:
+        list: Stores from the pages fetched
+    """
+    stores = []
+    delay = NEXT_PAGE_DELAY
+    while page_token and time.monotonic() + delay < deadline:
+        time.sleep(delay)
+        page, page_status, next_token = fetch_places(lat, lng, radius, page_token=page_token)
+        if page_status == "INVALID_REQUEST":
+            # The token is not active yet; try again shortly
+            delay = NEXT_PAGE_RETRY_DELAY
+            continue
+        if page_status != "OK":
+            break
+        stores += page
+        page_token, delay = next_token, NEXT_PAGE_DELAY
+    return stores
+
+
+def merge_stores(store_lists):
+    """Concatenate store lists, keeping the first entry of each place"""
+    merged = {}
+    for stores in store_lists:
+        for store in stores:
+            merged.setdefault(store["place_id"], store)
+    return list(merged.values())
+
+
+def fetch_area_places(lat, lng, radius):
+    """
+    Search an area with the configured PLACES_FETCH_MODE.
+
+    'single' reads the first page of one search. 'paged' also follows
+    next_page_token and runs one search per PLACES_SEARCH_TYPES type. Only
+    the untyped search's first page is fetched here; the rest is left to the
+    returned callable, so the caller can answer with the first page and
+    complete the search later (see complete_area_search).
+
+    Args:
+        lat: Search center latitude
+        lng: Search center longitude
+        radius: Search radius in meters
+
+    Returns:
+        tuple: (stores of the first page, its Places status, callable returning
+        the complete store list or None when there is nothing more to fetch)
+    """
+    stores, places_status, page_token = fetch_places(lat, lng, radius)
+    if getattr(settings, 'PLACES_FETCH_MODE', 'single') != 'paged' or places_status != "OK":
+        return stores, places_status, None
+
+    # The rest of the search has PLACES_FETCH_BUDGET seconds from here
+    deadline = time.monotonic() + getattr(settings, 'PLACES_FETCH_BUDGET', 3.0)
+    place_types = getattr(settings, 'PLACES_SEARCH_TYPES', [])
+    if not page_token and not place_types:
+        return stores, places_status, None
+
+    def complete():
+        return complete_area_search(lat, lng, radius, stores, page_token, place_types, deadline)
+
+    return stores, places_status, complete
+
+
+def complete_area_search(lat, lng, radius, stores, page_token, place_types, deadline):
+    """
+    Fetch the remaining pages and the type searches of a paged area search, concurrently.
+
+    Searches still running at the deadline are dropped.
+
+    Args:
+        lat: Search center latitude
+        lng: Search center longitude
+        radius: Search radius in meters
+        stores: Stores of the untyped search's first page
+        page_token: next_page_token of the first page
+        place_types: Places types to run extra searches for
+        deadline: time.monotonic() after which the searches are no longer waited for
+
+    Returns:
+        list: Stores of every search that finished in time, first page first
+    """
+    def typed_search(place_type):
+        return fetch_places_pages(lat, lng, radius, place_type, deadline)[0]
+
+    executor = ThreadPoolExecutor(max_workers=1 + len(place_types))
+    try:
+        searches = {'next pages': executor.submit(follow_next_pages, lat, lng, radius, page_token, deadline)}
+        for place_type in place_types:
+            searches[f"type {place_type}"] = executor.submit(typed_search, place_type)
+        wait(searches.values(), timeout=max(0.0, deadline - time.monotonic()))
+    finally:
+        executor.shutdown(wait=False)
+
+    store_lists = [stores]
+    for label, future in searches.items():
+        if not future.done():
+            print(f"⏱️ Places search for {label} missed the fetch budget")
+        elif future.exception() is not None:
+            print(f"⚠️ Places search for {label} failed: {future.exception()}")
+        else:
+            store_lists.append(future.result())
+    return merge_stores(store_lists)
+
+
+def _get_background_executor():
+    global _background_executor
+    if _background_executor is None:
+        with _background_executor_lock:
+            if _background_executor is None:
+                _background_executor = ThreadPoolExecutor(
+                    max_workers=BACKGROUND_SEARCH_WORKERS,
+                    thread_name_prefix='places-background',
+                )
+    return _background_executor
+
+
+def _complete_tile_search(geohash, complete):
+    """Finish a cell's paged search, then re-cache and save the complete results"""
+    # Pool threads live outside the request cycle, so manage their DB connection here
+    close_old_connections()
+    try:
+        stores = complete()
+        caches[PLACES_TILE_CACHE_ALIAS].set(tile_cache_key(geohash), stores)
+        with _background_store_lock:
+            store_tile(geohash, stores)
+        print(f"📍 Completed Places search for tile {geohash} - {len(stores)} stores")
+    except Exception as e:
+        print(f"⚠️ Completing Places search for tile {geohash} failed: {str(e)}")
+    finally:
+        close_old_connections()
+
+
+def tile_cache_key(geohash):
+    return f"places_tile:{PLACES_TILE_FORMAT_VERSION}:{geohash}"
+
+
+def load_stored_tiles(tiles):
+    """
+    Load the stores of cells searched within PLACES_TILE_MAX_AGE from the database.
+
+    Args:
+        tiles: Geohashes of one precision
+
+    Returns:
+        dict: geohash -> store dicts, for the fresh cells only (two queries)
+    """
+    max_age = getattr(settings, 'PLACES_TILE_MAX_AGE', 60 * 60 * 24 * 7)
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    fresh = list(PlaceTile.objects.filter(geohash__in=tiles, fetched_at__gte=cutoff).values_list('geohash', flat=True))
+    if not fresh:
+        return {}
+
+    stored = {tile: [] for tile in fresh}
+    prefix_length = len(fresh[0])
+    in_fresh_tiles = Q()
+    for tile in fresh:
+        in_fresh_tiles |= Q(geohash__startswith=tile)
+    places = Place.objects.filter(in_fresh_tiles, fetched_at__gte=cutoff).values_list(
+        'place_id', 'name', 'types', 'latitude', 'longitude', 'address', 'geohash'
+    )
+    for place_id, name, types, latitude, longitude, address, geohash in places:
+        stored[geohash[:prefix_length]].append({
+            "place_id": place_id,
+            "name": name,
+            "categories": types,
+            "latitude": latitude,
+            "longitude": longitude,
+            "address": address,
+        })
+    return stored
+
+
+def store_tile(geohash, stores):
+    """
+    Save a cell's Places search results and mark the cell as searched.
+
+    Args:
+        geohash: The cell
+        stores: Store dicts from the cell's search
+    """
+    now = timezone.now()
+    # One row per place, the first result winning (an upsert may not touch a row twice)
+    unique_stores = {store["place_id"]: store for store in reversed(stores)}.values()
+    Place.objects.bulk_create(
+        [
+            Place(
+                place_id=store["place_id"],
+                name=store["name"][:255],
+                types=store["categories"],
+                latitude=store["latitude"],
+                longitude=store["longitude"],
+                address=store["address"][:255],
+                geohash=geohash_encode(store["latitude"], store["longitude"], PLACE_GEOHASH_PRECISION),
+                fetched_at=now,
+            )
+            for store in unique_stores
+        ],
+        update_conflicts=True,
+        unique_fields=['place_id'],
+        update_fields=['name', 'types', 'latitude', 'longitude', 'address', 'geohash', 'fetched_at'],
+    )
+    PlaceTile.objects.update_or_create(geohash=geohash, defaults={'fetched_at': now})
+
+
+def search_tile(geohash):
+    """
+    Run (or join) the Places search of a cell, caching complete results.
+
+    In paged mode the first page is cached and returned; the rest of the
+    search is completed on a background thread, which caches and stores the
+    full results (see _complete_tile_search).
+
+    Returns:
+        tuple: (store dicts, whether this call ran the search and it should be stored)
+    """
+    cache = caches[PLACES_TILE_CACHE_ALIAS]
+    key = tile_cache_key(geohash)
+    searched = []
+
+    def fill():
+        # A flight that just finished may have filled the cell
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+        center_lat, center_lng, radius = tile_search_area(geohash)
+        stores, places_status, complete = fetch_area_places(center_lat, center_lng, radius)
+        if places_status not in CACHEABLE_STATUSES:
+            print(f"⚠️ Places search for tile {geohash} returned {places_status}; not caching")
+            return stores
+        cache.set(key, stores)
+        if complete is None:
+            searched.append(True)
+        else:
+            _get_background_executor().submit(_complete_tile_search, geohash, complete)
+        return stores
+
+    stores = coalesced_call(key, fill)
+    return stores, bool(searched)
+
+
+def get_tiles_stores(tiles):
+    """
+    Stores of several cells: from the cache, then the database, then (coalesced) Places searches.
+
+    Args:
+        tiles: Geohashes of one precision
+
+    Returns:
+        dict: geohash -> store dicts
+    """
+    cache = caches[PLACES_TILE_CACHE_ALIAS]
+    keys = {tile: tile_cache_key(tile) for tile in tiles}
+    cached = cache.get_many(list(keys.values()))
+    found = {tile: cached[key] for tile, key in keys.items() if key in cached}
+
+    missing = [tile for tile in tiles if tile not in found]
+    if missing:
+        stored = load_stored_tiles(missing)
+        cache.set_many({keys[tile]: stores for tile, stores in stored.items()})
+        found.update(stored)
+
+    cold = [tile for tile in missing if tile not in found]
+    if cold:
+        # Only the HTTP requests run on the pool; the database is written from this thread
+        # (paged searches completed in the background save themselves, see search_tile)
+        if len(cold) == 1:
+            results = [search_tile(cold[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=len(cold)) as executor:
+                results = list(executor.map(search_tile, cold))
+        for tile, (stores, searched) in zip(cold, results):
+            found[tile] = stores
+            if searched:
+                store_tile(tile, stores)
+    return found
+
+
+def nearest_stores(lat, lng, stores, radius, limit=NEARBY_STORES_LIMIT):
+    """
+    Pick the stores nearest to a point.
+
+    Args:
+        lat: Query latitude
+        lng: Query longitude
+        stores: Candidate store dicts (may repeat a place)
+        radius: Query radius in meters
+        limit: Number of stores to return
+
+    Returns:
+        list: Up to limit store dicts within the radius, nearest first, with "distance" in miles
+    """
+    if not stores:
+        return []
+    distances = haversine_distances(
+        lat, lng,
+        np.fromiter((store["latitude"] for store in stores), dtype=np.float64, count=len(stores)),
+        np.fromiter((store["longitude"] for store in stores), dtype=np.float64, count=len(stores)),
+    )
+    radius_miles = radius / METERS_PER_MILE
+
+    def candidates():
+        seen = set()
+        for index in np.flatnonzero(distances <= radius_miles):
+            place_id = stores[index]["place_id"]
+            if place_id not in seen:
+                seen.add(place_id)
+                yield distances[index], index
+
+    return [
+        {**stores[index], "distance": round(float(distance), 1)}
+        for distance, index in heapq.nsmallest(limit, candidates())
+    ]
+
+
+def find_nearby_stores(lat, lng, radius, limit=NEARBY_STORES_LIMIT):
+    """
+    Find the stores nearest to a point, assembled from cached geohash cells.
+
+    Args:
+        lat: Query latitude
+        lng: Query longitude
+        radius: Query radius in meters
+        limit: Number of stores to return
+
+    Returns:
+        list: Store dicts within the radius, nearest first, with "distance" in miles
+    """
+    radius = min(max(radius, 1), PLACES_MAX_RADIUS)
+    tiles = covering_tiles(lat, lng, radius)
+    tile_stores = get_tiles_stores(tiles)
+    candidates = [store for tile in tiles for store in tile_stores[tile]]
+    return nearest_stores(lat, lng, candidates, radius, limit)
@@ -1,3 +1,87 @@
-from django.test import TestCase
+from django.test import SimpleTestCase
 
-# Create your tests here.
+from .places import (
+    METERS_PER_MILE, covering_tiles, geohash_bounds, geohash_encode, haversine_distance,
+    nearest_stores, tile_precision, tile_search_area,
+)
+
+# Santana Row, San Jose
+LAT, LNG = 37.32098, -121.94790
+
+
+def store(place_id, lat, lng):
+    return {
+        "place_id": place_id,
+        "name": place_id,
+        "categories": ["store", "point_of_interest", "establishment"],
+        "latitude": lat,
+        "longitude": lng,
+        "address": "",
+    }
+
+
+class CoveringTilesTests(SimpleTestCase):
+    def test_first_tile_contains_the_point(self):
+        for radius in (50, 100, 500, 5000):
+            tiles = covering_tiles(LAT, LNG, radius)
+            self.assertEqual(tiles[0], geohash_encode(LAT, LNG, tile_precision(LAT, radius)))
+
+    def test_tiles_share_one_precision_and_are_sorted_by_distance(self):
+        tiles = covering_tiles(LAT, LNG, 300)
+        self.assertEqual(len({len(tile) for tile in tiles}), 1)
+        self.assertEqual(len(tiles), len(set(tiles)))
+
+        def distance_to(tile):
+            lat_min, lat_max, lng_min, lng_max = geohash_bounds(tile)
+            return haversine_distance(LAT, LNG, min(max(LAT, lat_min), lat_max), min(max(LNG, lng_min), lng_max))
+
+        distances = [distance_to(tile) for tile in tiles]
+        self.assertEqual(distances, sorted(distances))
+        self.assertLessEqual(distances[-1], 300 / METERS_PER_MILE)
+
+    def test_tiles_cover_the_query_circle(self):
+        radius = 400
+        tiles = set(covering_tiles(LAT, LNG, radius))
+        precision = tile_precision(LAT, radius)
+        # Points on the circle, in meters north/east of the center
+        for north, east in ((radius, 0), (-radius, 0), (0, radius), (0, -radius), (280, 280), (-280, -280)):
+            lat = LAT + north / 111_195
+            lng = LNG + east / (111_195 * 0.7955)
+            self.assertIn(geohash_encode(lat, lng, precision), tiles)
+
+    def test_search_area_reaches_every_corner(self):
+        tile = covering_tiles(LAT, LNG, 100)[0]
+        center_lat, center_lng, radius = tile_search_area(tile)
+        lat_min, lat_max, lng_min, lng_max = geohash_bounds(tile)
+        for lat in (lat_min, lat_max):
+            for lng in (lng_min, lng_max):
+                self.assertLessEqual(haversine_distance(center_lat, center_lng, lat, lng) * METERS_PER_MILE, radius)
+
+
+class NearestStoresTests(SimpleTestCase):
+    def test_nearest_first_within_the_radius(self):
+        stores = [
+            store('far', LAT + 0.0008, LNG),
+            store('outside', LAT + 0.01, LNG),
+            store('near', LAT + 0.0001, LNG),
+            store('middle', LAT, LNG + 0.0005),
+        ]
+        result = nearest_stores(LAT, LNG, stores, radius=200)
+
+        self.assertEqual([s['place_id'] for s in result], ['near', 'middle', 'far'])
+        self.assertEqual([s['distance'] for s in result], sorted(s['distance'] for s in result))
+
+    def test_repeated_places_are_returned_once(self):
+        stores = [store('a', LAT, LNG + 0.0002), store('b', LAT, LNG + 0.0001), store('a', LAT, LNG + 0.0002)]
+        result = nearest_stores(LAT, LNG, stores, radius=100)
+
+        self.assertEqual([s['place_id'] for s in result], ['b', 'a'])
+
+    def test_limit(self):
+        stores = [store(str(i), LAT + i * 0.00001, LNG) for i in range(20)]
+        result = nearest_stores(LAT, LNG, stores, radius=100, limit=5)
+
+        self.assertEqual([s['place_id'] for s in result], ['0', '1', '2', '3', '4'])
+
+    def test_no_stores(self):
+        self.assertEqual(nearest_stores(LAT, LNG, [], radius=100), [])
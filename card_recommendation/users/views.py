@@ -1,6 +1,3 @@
-import requests
-import os
-import math
 from uuid import UUID
 
 from rest_framework.decorators import api_view
@@ -8,16 +5,17 @@ from rest_framework.decorators import api_view
 from rest_framework import status, generics
 from rest_framework.response import Response
 from rest_framework.decorators import permission_classes
+from rest_framework.permissions import IsAdminUser
 
 from rest_framework import viewsets
 from users.models import User, UserCard
 from users.serializers import UserSerializer, UserCardSerializer
 from users.permissions import StaffPermissions, IsAuthenticatedAndActive
+from users.places import find_nearby_stores
+from http_client import get_http_client
 
 from recommendation.models import Card
 
-GOOGLE_PLACES_API_KEY = os.environ.get('GOOGLE_PLACES_API_KEY')
-
 class UserViewSet(viewsets.ModelViewSet):
     serializer_class = UserSerializer
     queryset = User.objects.all()
@@ -129,73 +127,33 @@ def delete_user_card(request, pk):
     user_card.delete()
     return Response({"message": "Card deleted."}, status=204)
 
-def haversine_distance(lat1, lng1, lat2, lng2):
-    # Radius of Earth in miles
-    R = 3958.8
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    delta_phi = math.radians(lat2 - lat1)
-    delta_lambda = math.radians(lng2 - lng1)
-
-    a = math.sin(delta_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2) ** 2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return R * c
-
-def filter_types(types):
-    return 'point_of_interest' in types and 'establishment' in types and len(types) > 2
-
 @api_view(['GET'])
 @permission_classes([IsAuthenticatedAndActive])
 def get_nearby_stores(request):
     try:
         lat = float(request.query_params.get('lat'))
         lng = float(request.query_params.get('lng'))
-        radius = request.query_params.get('radius', 100)
+        radius = float(request.query_params.get('radius', 100))
 
         # lat = 37.32498
         # lng = -121.94560
 
-        url = (
-            f"https://maps.googleapis.com/maps/api/place/nearbysearch/json"
-            f"?location={lat},{lng}&radius={radius}&key={GOOGLE_PLACES_API_KEY}"
-        )
-
-        res = requests.get(url)
-        data = res.json()
-        results = data.get("results", [])
-
-        stores = []
-        for result in results:
-            name = result.get("name")
-            geometry = result.get("geometry", {})
-            location = geometry.get("location", {})
-            store_lat = location.get("lat")
-            store_lng = location.get("lng")
-            categories = result.get("types", [])
-            address = result.get("vicinity") or result.get("formatted_address", "Address not available")
-
-            if name and store_lat and store_lng and filter_types(categories):
-                distance = haversine_distance(lat, lng, store_lat, store_lng)
-                stores.append({
-                    "name": name,
-                    "categories": categories,
-                    "latitude": store_lat,
-                    "longitude": store_lng,
-                    "address": address,
-                    "distance": round(distance, 1)
-                })
-
-        unique_stores = {s["name"]: s for s in stores}.values()
-        print(unique_stores)
-        top8 = list(unique_stores)[:8]
-
-        return Response({"stores": top8}, status=200)
+        # Nearest 8, assembled from geohash cells cached across requests (see users/places.py)
+        stores = find_nearby_stores(lat, lng, radius)
+
+        return Response({"stores": stores}, status=200)
 
     except (TypeError, ValueError):
         return Response({"error": "Invalid latitude or longitude"}, status=400)
     except Exception as e:
         return Response({"error": str(e)}, status=500)
 
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def outbound_http_stats(request):
+    """Outbound request counters and latencies of this worker, per host (staff only)"""
+    return Response(get_http_client().stats(), status=200)
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticatedAndActive])
 def get_online_stores(request):